@@ -0,0 +1,51 @@
+"""
+Compare the WSGI and ASGI read paths under high concurrency.
+
+Start the same project twice, e.g.::
+
+    gunicorn yaqeenmed_backend.wsgi:application -w 4 -b 127.0.0.1:8000
+    uvicorn yaqeenmed_backend.asgi:application --workers 4 --port 8001
+
+then run::
+
+    python benchmarks/async_vs_wsgi.py --token <access token> \\
+        --wsgi http://127.0.0.1:8000 --asgi http://127.0.0.1:8001 --concurrency 200
+
+The sync endpoints (``/api/issues/`` ...) are driven on the WSGI server and the
+``/api/async/...`` endpoints on the ASGI server; results are printed as JSON.
+"""
+import argparse
+import asyncio
+import json
+
+from loadgen import run_load
+
+ENDPOINTS = [
+    ('issues', '/api/issues/', '/api/async/issues/'),
+    ('doctors', '/api/doctors/', '/api/async/doctors/'),
+    ('patient-requests', '/api/patient-requests/', '/api/async/patient-requests/'),
+]
+
+
+async def main(args):
+    headers = {'Authorization': f'Bearer {args.token}'}
+    results = {}
+    for name, sync_path, async_path in ENDPOINTS:
+        if args.only and name not in args.only:
+            continue
+        results[name] = {
+            'wsgi': await run_load(args.wsgi, sync_path, args.requests, args.concurrency, headers),
+            'asgi': await run_load(args.asgi, async_path, args.requests, args.concurrency, headers),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--token', required=True, help="JWT access token for the requests")
+    parser.add_argument('--wsgi', default='http://127.0.0.1:8000')
+    parser.add_argument('--asgi', default='http://127.0.0.1:8001')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--only', nargs='*', help="Limit to these endpoint names")
+    asyncio.run(main(parser.parse_args()))
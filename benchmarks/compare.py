@@ -0,0 +1,61 @@
+"""
+Compare two reports written by benchmarks/routes.py::
+
+    python benchmarks/compare.py results-v1.json results-v2.json
+
+Prints, per route, the old and new p50/p95/p99 latency, throughput and mean
+queries per request with the relative change.  Exits non-zero when any p95
+got slower than ``--threshold`` (a fraction, default 0.2), so the comparison
+can gate a release.
+"""
+import argparse
+import json
+import sys
+
+METRICS = [
+    ('p50 ms', lambda r: r['latency_ms']['p50']),
+    ('p95 ms', lambda r: r['latency_ms']['p95']),
+    ('p99 ms', lambda r: r['latency_ms']['p99']),
+    ('req/s', lambda r: r['throughput_rps']),
+    ('queries', lambda r: r['queries_per_request']['mean']),
+]
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old
+
+
+def main(args):
+    with open(args.old) as fh:
+        old = json.load(fh)['routes']
+    with open(args.new) as fh:
+        new = json.load(fh)['routes']
+
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        cells = []
+        for label, metric in METRICS:
+            before, after = metric(old[name]), metric(new[name])
+            delta = change(before, after)
+            cells.append(f"{label} {before} -> {after}" + (f" ({delta:+.0%})" if delta is not None else ""))
+        print(f"{name}: " + ', '.join(cells))
+        delta = change(old[name]['latency_ms']['p95'], new[name]['latency_ms']['p95'])
+        if delta is not None and delta > args.threshold:
+            regressions.append(name)
+    for name in sorted(old.keys() ^ new.keys()):
+        print(f"{name}: only in {'old' if name in old else 'new'} report")
+
+    if regressions:
+        print(f"p95 regressed by more than {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    sys.exit(main(parser.parse_args()))
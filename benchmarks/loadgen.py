@@ -0,0 +1,135 @@
+"""
+Minimal asyncio HTTP/1.1 load generator (standard library only).
+
+Each virtual client holds one keep-alive connection and issues requests back
+to back, so ``concurrency`` is the number of simultaneously open requests the
+server has to juggle.
+"""
+import asyncio
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+class HTTPError(Exception):
+    pass
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        parts = []
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            parts.append(chunk[:-2])
+        body = b''.join(parts)
+    else:
+        body = await reader.read()
+    return status, headers, body
+
+
+class Connection:
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = self.writer = None
+
+    async def request(self, path, headers, method='GET', body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive']
+        lines += [f'{key}: {value}' for key, value in headers.items()]
+        if body:
+            lines.append(f'Content-Length: {len(body)}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+        try:
+            response = await read_response(self.reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            raise
+        if response[1].get('connection', '').lower() == 'close':
+            await self.close()
+        return response
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, extra=None):
+    latencies = sorted(latencies)
+    summary = {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+            'p50': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            'p99': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        },
+    }
+    summary.update(extra or {})
+    return summary
+
+
+async def run_load(base_url, path, total_requests, concurrency, headers=None, on_response=None, method='GET', body=b''):
+    """Issue ``total_requests`` requests against ``base_url + path`` and return a summary dict."""
+    headers = headers or {}
+    prefix = urlsplit(base_url).path.rstrip('/')
+    remaining = total_requests
+    latencies = []
+    errors = 0
+    error_statuses = Counter()
+
+    async def client():
+        nonlocal remaining, errors
+        connection = Connection(base_url)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    status, response_headers, response_body = await connection.request(prefix + path, headers, method, body)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    continue
+                if status >= 400:
+                    errors += 1
+                    error_statuses[status] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if on_response is not None:
+                    on_response(status, response_headers, response_body)
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    extra = {'error_statuses': {str(code): count for code, count in sorted(error_statuses.items())}}
+    return summarize(latencies, errors, time.perf_counter() - started, extra)
@@ -0,0 +1,67 @@
+"""
+Check that a burst of logins does not slow down the rest of the API.
+
+Password checks run on a bounded hashing pool (see main_app.passwords), so
+during a login storm the other endpoints should keep their latency and
+surplus logins should be turned away with a fast 503.  Against a server with
+seeded data (``python manage.py seed_benchmark``) run::
+
+    python benchmarks/login_storm.py --base-url http://127.0.0.1:8000 --storm-concurrency 200
+
+The probe route is measured on its own, then again while ``--storm-concurrency``
+clients log in back to back.  The JSON result holds both probe summaries, the
+storm's summary (``error_statuses`` counts the 503s) and the ratio of the
+probe's p95 latency during and before the storm.  Use ``--login-path
+/api/async/users/login/`` to storm the async login view on an ASGI server.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from loadgen import run_load
+from routes import post_json
+
+
+async def main(args):
+    base_url = args.base_url.rstrip('/')
+    credentials = {'username': args.username, 'password': args.password}
+    token = post_json(f'{base_url}/api/users/login/', credentials)['access']
+    probe_headers = {'Authorization': f'Bearer {token}'}
+
+    baseline = await run_load(base_url, args.probe, args.probe_requests, args.probe_concurrency, probe_headers)
+    print(f"baseline p95 {baseline['latency_ms']['p95']} ms", file=sys.stderr)
+
+    # --storm-requests should be large enough for the storm to outlast the probe
+    storm = asyncio.ensure_future(run_load(
+        base_url, args.login_path, args.storm_requests, args.storm_concurrency,
+        {'Content-Type': 'application/json'}, method='POST', body=json.dumps(credentials).encode(),
+    ))
+    await asyncio.sleep(args.warmup)
+    during = await run_load(base_url, args.probe, args.probe_requests, args.probe_concurrency, probe_headers)
+    storm_summary = await storm
+    print(f"during storm p95 {during['latency_ms']['p95']} ms", file=sys.stderr)
+
+    before, after = baseline['latency_ms']['p95'], during['latency_ms']['p95']
+    print(json.dumps({
+        'probe': args.probe,
+        'baseline': baseline,
+        'during_storm': during,
+        'storm': storm_summary,
+        'p95_ratio': round(after / before, 2) if before and after else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--username', default='bench_patient_0')
+    parser.add_argument('--password', default='benchmark-password')
+    parser.add_argument('--probe', default='/api/issues/', help="Route whose latency is watched")
+    parser.add_argument('--probe-requests', type=int, default=1000)
+    parser.add_argument('--probe-concurrency', type=int, default=10)
+    parser.add_argument('--login-path', default='/api/users/login/')
+    parser.add_argument('--storm-requests', type=int, default=5000)
+    parser.add_argument('--storm-concurrency', type=int, default=100)
+    parser.add_argument('--warmup', type=float, default=1.0, help="Seconds of storm before the probe starts")
+    asyncio.run(main(parser.parse_args()))
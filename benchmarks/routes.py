@@ -0,0 +1,187 @@
+"""
+Latency and throughput benchmark for the API routes in main_app/urls.py.
+
+Seed a data set and start a server that reports queries per request::
+
+    python manage.py seed_benchmark --issues 100000
+    QUERY_COUNT_HEADER=1 gunicorn yaqeenmed_backend.wsgi:application -w 4 -b 127.0.0.1:8000
+
+then run::
+
+    python benchmarks/routes.py --base-url http://127.0.0.1:8000 --label 100k --output results-100k.json
+
+Each route is driven by ``--concurrency`` keep-alive clients authenticated as a
+seeded patient or doctor.  The JSON result lists p50/p95/p99 latency,
+throughput and queries per request for every route; compare two runs with
+``benchmarks/compare.py``.  Routes that write are skipped unless
+``--include-writes`` is given, because they change the data set between runs.
+Long-lived routes (the event stream, comment long-polling), multi-step uploads
+and file downloads are not benchmarked here.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from loadgen import run_load
+
+# name, role, method, path, JSON body (writes only)
+ROUTES = [
+    ('home', 'patient', 'GET', '/api/', None),
+    ('patient-list', 'doctor', 'GET', '/api/patients/', None),
+    ('patient-detail', 'patient', 'GET', '/api/patients/{patient}/', None),
+    ('doctor-list', 'patient', 'GET', '/api/doctors/', None),
+    ('doctor-detail', 'patient', 'GET', '/api/doctors/{doctor}/', None),
+    ('issue-list', 'patient', 'GET', '/api/issues/', None),
+    ('issue-list-doctor', 'doctor', 'GET', '/api/issues/', None),
+    ('issue-detail', 'patient', 'GET', '/api/issues/{issue}/', None),
+    ('issue-comments', 'patient', 'GET', '/api/issues/{issue}/comments/', None),
+    ('issue-search', 'patient', 'GET', '/api/issues/search/?q=pain', None),
+    ('issue-export', 'patient', 'GET', '/api/issues/export.ndjson', None),
+    ('document-list', 'patient', 'GET', '/api/documents/', None),
+    ('document-detail', 'patient', 'GET', '/api/documents/{document}/', None),
+    ('comment-list', 'patient', 'GET', '/api/comments/', None),
+    ('comment-detail', 'patient', 'GET', '/api/comments/{comment}/', None),
+    ('patient-request-list', 'patient', 'GET', '/api/patient-requests/', None),
+    ('patient-request-search', 'patient', 'GET', '/api/patient-requests/search/?q=opinion', None),
+    ('dashboard-stats', 'doctor', 'GET', '/api/stats/', None),
+    ('async-issue-list', 'patient', 'GET', '/api/async/issues/', None),
+    ('async-issue-detail', 'patient', 'GET', '/api/async/issues/{issue}/', None),
+    ('async-doctor-list', 'patient', 'GET', '/api/async/doctors/', None),
+    ('async-patient-request-list', 'patient', 'GET', '/api/async/patient-requests/', None),
+    ('login', None, 'POST', '/api/users/login/', 'credentials'),
+    ('comment-bulk-create', 'patient', 'POST', '/api/comments/bulk/', [{'issue': '{issue}', 'content': 'Benchmark comment'}]),
+    ('patient-request-create', 'patient', 'POST', '/api/patient-requests/',
+     {'title': 'Benchmark', 'detailed_comment': '...', 'summary_comment': '...'}),
+    ('issue-claim', 'doctor', 'POST', '/api/issues/claim/', {}),
+]
+
+
+def post_json(url, data, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    request = urllib.request.Request(url, json.dumps(data).encode(), headers, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def get_json(url, token):
+    request = urllib.request.Request(url, headers={'Authorization': f'Bearer {token}'})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def discover(base_url, tokens, doctor_id):
+    """Look up ids of rows the patient can see, for the detail routes."""
+    issue = get_json(f'{base_url}/api/issues/?page_size=1', tokens['patient'])['results'][0]
+    patient = get_json(f'{base_url}/api/patients/?page_size=1', tokens['patient'])['results'][0]
+    return {
+        'issue': issue['id'],
+        'document': issue['documents'][0]['id'] if issue['documents'] else 0,
+        'comment': issue['comments'][0]['id'] if issue['comments'] else 0,
+        'patient': patient['id'],
+        'doctor': doctor_id,
+    }
+
+
+def fill(template, ids):
+    if isinstance(template, str):
+        value = template.format(**ids)
+        return int(value) if template.startswith('{') and value.isdigit() else value
+    if isinstance(template, list):
+        return [fill(item, ids) for item in template]
+    if isinstance(template, dict):
+        return {key: fill(value, ids) for key, value in template.items()}
+    return template
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    base_url = args.base_url.rstrip('/')
+    credentials = {'patient': args.patient, 'doctor': args.doctor}
+    tokens = {}
+    user_ids = {}
+    for role, username in credentials.items():
+        login = post_json(f'{base_url}/api/users/login/', {'username': username, 'password': args.password})
+        tokens[role] = login['access']
+        user_ids[role] = login['user']['id']
+    # A doctor's primary key is its user id
+    ids = discover(base_url, tokens, user_ids['doctor'])
+
+    results = {}
+    for name, role, method, path, body in ROUTES:
+        if args.only and name not in args.only:
+            continue
+        if method != 'GET' and not args.include_writes:
+            continue
+        headers = {'Authorization': f'Bearer {tokens[role]}'} if role else {}
+        if body == 'credentials':
+            body = {'username': args.patient, 'password': args.password}
+        payload = b''
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            payload = json.dumps(fill(body, ids)).encode()
+
+        queries = []
+
+        def count_queries(status, response_headers, response_body):
+            if 'x-query-count' in response_headers:
+                queries.append(int(response_headers['x-query-count']))
+
+        summary = await run_load(
+            base_url, path.format(**ids), args.requests, args.concurrency, headers,
+            on_response=count_queries, method=method, body=payload,
+        )
+        summary['queries_per_request'] = {
+            'mean': round(statistics.fmean(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        }
+        results[name] = summary
+        print(f"{name}: p50 {summary['latency_ms']['p50']} ms, {summary['throughput_rps']} req/s", file=sys.stderr)
+
+    report = {
+        'label': args.label,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'base_url': base_url,
+        'concurrency': args.concurrency,
+        'requests_per_route': args.requests,
+        'routes': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--patient', default='bench_patient_0', help="Seeded patient to authenticate as")
+    parser.add_argument('--doctor', default='bench_doctor_0', help="Seeded doctor to authenticate as")
+    parser.add_argument('--password', default='benchmark-password')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per route")
+    parser.add_argument('--only', nargs='*', help="Limit to these route names")
+    parser.add_argument('--include-writes', action='store_true', help="Also benchmark routes that create or change rows")
+    parser.add_argument('--label', help="Free-form name for this run, e.g. the data volume")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    started = time.perf_counter()
+    asyncio.run(main(parser.parse_args()))
+    print(f"Finished in {time.perf_counter() - started:.1f}s", file=sys.stderr)
@@ -0,0 +1,108 @@
+"""
+Routing of pending issues to doctors.
+
+Candidates are locked with ``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent
+claimers each walk past rows another transaction is already taking instead of
+queueing behind it.  The assignment itself is a conditional UPDATE on
+``doctor IS NULL AND status = PENDING``, so even on backends without row locks
+(SQLite) an issue can never be handed to two doctors.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .counters import issue_keys, record_change
+from .events import issue_status_changed
+from .models import Doctor, Issue
+
+
+def max_open_issues():
+    return getattr(settings, 'MAX_OPEN_ISSUES_PER_DOCTOR', 20)
+
+
+def claimable_issues(specialty):
+    return Issue.objects.filter(
+        Q(specialty=specialty) | Q(specialty=''),
+        status=Issue.STATUS_PENDING,
+        doctor__isnull=True,
+    ).order_by('created_at', 'id')
+
+
+def lock_candidates(queryset, limit, *fields):
+    if connection.features.has_select_for_update_skip_locked:
+        queryset = queryset.select_for_update(skip_locked=True)
+    return list(queryset.values_list(*(fields or ('id',)))[:limit])
+
+
+def assign(issue_id, doctor):
+    """Atomically give an unclaimed pending issue to ``doctor``; False if someone beat us to it."""
+    assigned = bool(
+        Issue.objects.filter(pk=issue_id, doctor__isnull=True, status=Issue.STATUS_PENDING)
+        .update(doctor=doctor, status=Issue.STATUS_ACCEPTED, updated_at=timezone.now())
+    )
+    if assigned:
+        # update() bypasses the save hooks that publish status changes and keep the counters
+        issue = Issue.objects.select_related('patient').get(pk=issue_id)
+        record_change(
+            issue_keys(issue.patient_id, None, Issue.STATUS_PENDING),
+            issue_keys(issue.patient_id, doctor.pk, Issue.STATUS_ACCEPTED),
+        )
+        issue_status_changed(issue, Issue.STATUS_PENDING)
+    return assigned
+
+
+def open_issue_count(doctor):
+    return Issue.objects.filter(doctor=doctor, status__in=Issue.OPEN_STATUSES).count()
+
+
+def claim_next_issue(doctor, batch_size=5):
+    """
+    Assign the oldest claimable issue for the doctor's specialty to them.
+
+    Returns the Issue, or None when the queue is empty or the doctor already
+    holds MAX_OPEN_ISSUES_PER_DOCTOR open issues.
+    """
+    with transaction.atomic():
+        # Serialises claims by the same doctor so the open-issue cap holds
+        list(Doctor.objects.select_for_update().filter(pk=doctor.pk).values_list('pk'))
+        if open_issue_count(doctor) >= max_open_issues():
+            return None
+        for (issue_id,) in lock_candidates(claimable_issues(doctor.specialty), batch_size):
+            if assign(issue_id, doctor):
+                return Issue.objects.get(pk=issue_id)
+    return None
+
+
+def assign_pending_issues(limit=100):
+    """
+    Push pending issues to the least-loaded doctor of the matching specialty.
+
+    Returns the number of issues assigned.  Doctors at the open-issue cap are
+    skipped; issues nobody can take stay pending.
+    """
+    cap = max_open_issues()
+    assigned = 0
+    with transaction.atomic():
+        # Take the same doctor locks claim_next_issue does, in pk order so two
+        # runs cannot deadlock, before counting anyone's open issues
+        list(Doctor.objects.select_for_update().order_by('pk').values_list('pk'))
+        loads = {
+            doctor.pk: doctor
+            for doctor in Doctor.objects.annotate(
+                open_issues=Count('issue', filter=Q(issue__status__in=Issue.OPEN_STATUSES))
+            ).filter(open_issues__lt=cap)
+        }
+        pending = Issue.objects.filter(status=Issue.STATUS_PENDING, doctor__isnull=True).order_by('created_at', 'id')
+        for issue_id, specialty in lock_candidates(pending, limit, 'id', 'specialty'):
+            candidates = [d for d in loads.values() if not specialty or d.specialty == specialty]
+            if not candidates:
+                continue
+            doctor = min(candidates, key=lambda d: (d.open_issues, d.pk))
+            if assign(issue_id, doctor):
+                assigned += 1
+                doctor.open_issues += 1
+                if doctor.open_issues >= cap:
+                    del loads[doctor.pk]
+    return assigned
+
@@ -0,0 +1,242 @@
+"""
+Native async variants of the read-only endpoints, and of login/registration.
+
+These are plain Django coroutine views rather than DRF views, so under an ASGI
+server (e.g. ``uvicorn yaqeenmed_backend.asgi:application``) a worker can keep
+many slow clients waiting on the database without tying up a thread each.
+Where a synchronous counterpart exists they return the same payload.
+"""
+import asyncio
+import functools
+import json
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import passwords
+from .authentication import CachedJWTAuthentication
+from .events import broker, ensure_listener
+from .middleware import timed_data
+from .models import Comment, Doctor, Issue, Patient
+from .pagination import KeysetPagination, SyncPagination
+from .serializers import (
+    CommentListSerializer, DoctorSerializer, IssueSerializer, PatientRequestSerializer, RegisterSerializer,
+)
+from .views import IssueList, DoctorList, issue_queryset, login_payload, patient_request_queryset, scope_doctors, scope_issues
+
+FETCH_CHUNK_SIZE = 100
+# How long an EventSource waits before reconnecting, in milliseconds
+EVENT_RETRY_MS = 3000
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def error_response(exc):
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, exc.status_code)
+
+
+async def authenticate(request):
+    result = await CachedJWTAuthentication().aauthenticate(request)
+    if result is None:
+        return None
+    return result[0]
+
+
+def read_only(view):
+    """Authenticate the request, reject non-GET methods and render API errors as JSON."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+        try:
+            user = await authenticate(request)
+            if user is None:
+                return json_response({'detail': 'Authentication credentials were not provided.'}, status.HTTP_401_UNAUTHORIZED)
+            api_request = Request(request)
+            api_request.user = user
+            return await view(api_request, *args, **kwargs)
+        except APIException as exc:
+            return error_response(exc)
+    return wrapper
+
+
+def anonymous_post(view):
+    """Accept only POST, parse the body as DRF would and answer 503 when the password pool is saturated."""
+    @csrf_exempt
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+        try:
+            api_request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+            return await view(api_request, *args, **kwargs)
+        except passwords.HashingBusy:
+            response = json_response({'error': 'Too many sign-ins in progress, please retry.'}, status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = passwords.retry_after()
+            return response
+        except APIException as exc:
+            return error_response(exc)
+    return wrapper
+
+
+async def paginate(queryset, request, view_class, paginator_class=KeysetPagination):
+    paginator = paginator_class()
+    page_queryset = paginator.get_page_queryset(queryset, request, view=view_class)
+    paginator.set_page([row async for row in page_queryset.aiterator(chunk_size=FETCH_CHUNK_SIZE)])
+    return paginator
+
+
+@read_only
+async def issue_list(request):
+    paginator = await paginate(scope_issues(request.user, issue_queryset(request)), request, IssueList)
+    serializer = IssueSerializer(paginator.page, many=True, context={'request': request})
+    return json_response(paginator.get_paginated_response(timed_data(serializer)).data)
+
+
+@read_only
+async def issue_detail(request, pk):
+    try:
+        issue = await issue_queryset(request).aget(pk=pk)
+    except Issue.DoesNotExist:
+        raise NotFound()
+    return json_response(timed_data(IssueSerializer(issue, context={'request': request})))
+
+
+@read_only
+async def doctor_list(request):
+    queryset = scope_doctors(request.user, Doctor.objects.select_related('user'))
+    paginator = await paginate(queryset, request, DoctorList)
+    serializer = DoctorSerializer(paginator.page, many=True, context={'request': request})
+    return json_response(paginator.get_paginated_response(timed_data(serializer)).data)
+
+
+@read_only
+async def patient_request_list(request):
+    try:
+        patient = await Patient.objects.aget(user=request.user)
+    except ObjectDoesNotExist:
+        raise NotFound('No patient profile for this user.')
+    queryset = patient_request_queryset(request).filter(patient=patient)
+    paginator = await paginate(queryset, request, None)
+    serializer = PatientRequestSerializer(paginator.page, many=True, context={'request': request})
+    return json_response(paginator.get_paginated_response(timed_data(serializer)).data)
+
+
+@read_only
+async def issue_comments(request, pk):
+    """
+    Comments on an issue created after the ``?after=`` cursor, oldest first.
+
+    With ``?wait=<seconds>`` and nothing new yet, the request is held open
+    (re-checking every COMMENT_POLL_INTERVAL seconds) until a comment arrives
+    or the wait expires, so clients can long-poll instead of re-fetching the
+    whole IssueDetail payload.
+    """
+    if not await scope_issues(request.user, Issue.objects.filter(pk=pk)).aexists():
+        raise NotFound()
+    try:
+        wait = float(request.query_params.get('wait', 0))
+    except ValueError:
+        wait = 0
+    # nan would never compare <= 0 below and hold the request open forever
+    if not math.isfinite(wait):
+        wait = 0
+    wait = max(0, min(wait, getattr(settings, 'COMMENT_LONG_POLL_MAX', 30)))
+    interval = getattr(settings, 'COMMENT_POLL_INTERVAL', 1.0)
+    deadline = time.monotonic() + wait
+
+    queryset = Comment.objects.filter(issue_id=pk).select_related('author')
+    while True:
+        paginator = await paginate(queryset, request, None, SyncPagination)
+        remaining = deadline - time.monotonic()
+        if paginator.page or remaining <= 0:
+            break
+        await asyncio.sleep(min(interval, remaining))
+
+    serializer = CommentListSerializer(paginator.page, many=True, context={'request': request})
+    return json_response(paginator.get_paginated_response(timed_data(serializer)).data)
+
+
+@anonymous_post
+async def login(request):
+    """LoginView, awaiting the password check on the hashing pool instead of blocking a thread on it."""
+    user = await passwords.aauthenticate(request.data.get('username'), request.data.get('password'))
+    if user is None:
+        return json_response({'error': 'Invalid credentials'}, status.HTTP_401_UNAUTHORIZED)
+    return json_response(await sync_to_async(login_payload)(user))
+
+
+@anonymous_post
+async def register(request):
+    serializer = RegisterSerializer(data=request.data)
+    if not await sync_to_async(serializer.is_valid)():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    password_hash = await passwords.arun(make_password, serializer.validated_data['password'])
+
+    await sync_to_async(serializer.save)(password_hash=password_hash)
+    return json_response({'message': 'User registered successfully!'}, status.HTTP_201_CREATED)
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+async def event_messages(user, last_event_id):
+    # Subscribe from inside the iterator so the queue belongs to the loop that consumes it
+    ensure_listener()
+    subscription, replay = broker.subscribe(user, last_event_id)
+    try:
+        yield f"retry: {EVENT_RETRY_MS}\n\n"
+        if replay is None:
+            yield "event: reset\ndata: {}\n\n"
+        else:
+            for event in replay:
+                yield format_event(event)
+
+        heartbeat = getattr(settings, 'EVENT_HEARTBEAT_INTERVAL', 15)
+        deadline = time.monotonic() + getattr(settings, 'EVENT_STREAM_MAX_AGE', 300)
+        while not subscription.overflowed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event)
+        yield "event: reset\ndata: {}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@read_only
+async def event_stream(request):
+    """
+    Server-Sent Events stream of issue and patient-request status changes
+    visible to the caller.
+
+    Streams close after EVENT_STREAM_MAX_AGE seconds; clients reconnect with
+    ``Last-Event-ID`` and receive what they missed.  A ``reset`` event means
+    the missed events are no longer buffered and the lists must be reloaded.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    response = StreamingHttpResponse(event_messages(request.user, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
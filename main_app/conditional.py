@@ -0,0 +1,125 @@
+"""
+Conditional GET: ETag / Last-Modified validators and 304 Not Modified.
+
+Each view describes its payload with a cheap query (``updated_at`` maxima
+and row counts, the names of the people it renders, or the few columns a
+profile shows) instead of building it.  When the client's If-None-Match still
+matches, the answer is a bodyless 304 and the payload is never fetched or
+serialized.  ETags are weak: they track the rows behind a payload, not its
+bytes.
+
+The states built here send no Last-Modified: the newest ``updated_at`` of a
+set of rows does not move when one of them is deleted, nor when a related
+user is renamed, so If-Modified-Since would answer 304 for a changed payload.
+"""
+import functools
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .models import Comment, Document
+
+
+def make_etag(request, fingerprint):
+    # The query string is part of the payload's identity (pages, page sizes)
+    digest = hashlib.md5(repr((request.get_full_path(), fingerprint)).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+def conditional_response(request, state, respond):
+    """
+    ``state`` is ``(last_modified, fingerprint)`` from a view's cheap query, or
+    None to skip validation (e.g. the object does not exist).  ``respond``
+    builds the full response and is only called when the client's copy is stale.
+    """
+    if state is None:
+        return respond()
+    last_modified, fingerprint = state
+    etag = make_etag(request, fingerprint)
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if not_modified is not None:
+        response = Response(status=not_modified.status_code)
+    else:
+        response = respond()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Clients may keep the payload but must revalidate before reusing it
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class ConditionalGetMixin:
+    """Generic-view mixin: ``conditional_state()`` returns the (last_modified, fingerprint) pair or None."""
+
+    def conditional_state(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        return conditional_response(request, self.conditional_state(), functools.partial(super().get, request, *args, **kwargs))
+
+
+def issue_children(outer='pk'):
+    """Correlated subqueries for the latest change and number of an issue's comments and documents."""
+    comments = Comment.objects.filter(issue=OuterRef(outer)).order_by().values('issue')
+    documents = Document.objects.filter(issue=OuterRef(outer)).order_by().values('issue')
+    return {
+        'comments_changed': Subquery(comments.annotate(value=Max('updated_at')).values('value')),
+        'comment_count': Subquery(comments.annotate(value=Count('id')).values('value')),
+        'documents_changed': Subquery(documents.annotate(value=Max('updated_at')).values('value')),
+        'document_count': Subquery(documents.annotate(value=Count('id')).values('value')),
+    }
+
+
+# Rendered by name: the patient by username, the doctor and comment authors by full name
+ISSUE_PEOPLE = ['patient_id', 'patient__user__username', 'doctor_id', 'doctor__user__first_name', 'doctor__user__last_name']
+COMMENT_AUTHOR = ['author_id', 'author__first_name', 'author__last_name', 'author__role']
+
+
+def grouped_rows(queryset, fields):
+    """Latest change and row count per distinct combination of ``fields``, in one query."""
+    rows = queryset.order_by().values_list(*fields).annotate(changed=Max('updated_at'), count=Count('id'))
+    # repr() sorts rows holding None next to strings
+    return sorted(map(repr, rows))
+
+
+def issue_state(issues, pk):
+    """One issue, its comments and documents and the people it names, in one query (a row per comment author)."""
+    rows = (
+        issues.filter(pk=pk).order_by()
+        .values('updated_at', *ISSUE_PEOPLE, *(f'comments__{field}' for field in COMMENT_AUTHOR))
+        .annotate(**issue_children())
+        .distinct()
+    )
+    fingerprint = sorted(repr(sorted(row.items())) for row in rows)
+    return (None, fingerprint) if fingerprint else None
+
+
+def issue_list_state(issues):
+    """Every issue in a scoped list with their comments, documents and the people they name: three queries."""
+    ids = issues.order_by().values('pk')
+    documents = Document.objects.filter(issue__in=ids).aggregate(changed=Max('updated_at'), count=Count('id'))
+    fingerprint = (
+        grouped_rows(issues, ISSUE_PEOPLE),
+        grouped_rows(Comment.objects.filter(issue__in=ids), COMMENT_AUTHOR),
+        sorted(documents.items()),
+    )
+    return None, fingerprint
+
+
+def list_state(queryset, nested):
+    """``nested`` names the related columns the payload embeds, e.g. a patient's user fields."""
+    return None, grouped_rows(queryset, nested)
+
+
+def row_state(queryset, pk, fields):
+    """For rows without ``updated_at`` (profiles): the columns the payload shows are the fingerprint."""
+    row = queryset.filter(pk=pk).values_list(*fields).first()
+    return None if row is None else (None, row)
@@ -0,0 +1,147 @@
+"""
+Per-owner, per-status counts of issues and patient requests.
+
+Dashboards read DashboardCounter rows instead of running ``COUNT(*) GROUP BY``
+over Issue and PatientRequest.  Every write path adjusts the counters in the
+same transaction as the row itself: save/delete hooks (see main_app.signals),
+the assignment queue's conditional update and the bulk create endpoint.  Issues
+count towards their patient and, once assigned, their doctor; patient requests
+towards their patient.  Each row also counts towards a site-wide total per
+kind and status (owner type ``all``), adjusted by the same increments, so the
+admin dashboard never has to add up every patient's rows.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import DashboardCounter, Issue, PatientRequest
+
+ISSUE = DashboardCounter.KIND_ISSUE
+PATIENT_REQUEST = DashboardCounter.KIND_PATIENT_REQUEST
+PATIENT = DashboardCounter.OWNER_PATIENT
+DOCTOR = DashboardCounter.OWNER_DOCTOR
+ALL = DashboardCounter.OWNER_ALL
+
+
+def issue_keys(patient_id, doctor_id, status):
+    keys = [(ALL, 0, ISSUE, status), (PATIENT, patient_id, ISSUE, status)]
+    if doctor_id is not None:
+        # A doctor's primary key is its user id
+        keys.append((DOCTOR, doctor_id, ISSUE, status))
+    return keys
+
+
+def patient_request_keys(patient_id, status):
+    if patient_id is None:
+        return []
+    return [(ALL, 0, PATIENT_REQUEST, status), (PATIENT, patient_id, PATIENT_REQUEST, status)]
+
+
+def counter_keys(instance):
+    """
+    The counters a saved Issue or PatientRequest contributes to.
+
+    Returns None when the fields involved were deferred at load time, so the
+    counted state is unknown.
+    """
+    state = instance.__dict__
+    if isinstance(instance, Issue):
+        if not {'patient_id', 'doctor_id', 'status'} <= state.keys():
+            return None
+        return issue_keys(state['patient_id'], state['doctor_id'], state['status'])
+    if not {'patient_id', 'status'} <= state.keys():
+        return None
+    return patient_request_keys(state['patient_id'], state['status'])
+
+
+def apply(deltas):
+    """Add each delta to its counter, creating missing rows."""
+    with transaction.atomic():
+        # A stable order keeps concurrent writers from deadlocking on the rows
+        for key in sorted(key for key, delta in deltas.items() if delta):
+            owner_type, owner_id, kind, status = key
+            lookup = {'owner_type': owner_type, 'owner_id': owner_id, 'kind': kind, 'status': status}
+            DashboardCounter.objects.get_or_create(**lookup)
+            DashboardCounter.objects.filter(**lookup).update(count=F('count') + deltas[key])
+
+
+def record_change(old_keys, new_keys):
+    deltas = Counter(new_keys or ())
+    deltas.subtract(old_keys or ())
+    apply(deltas)
+
+
+def record_created(instances):
+    apply(Counter(key for instance in instances for key in counter_keys(instance)))
+
+
+def read_counts(owner_type, owner_id):
+    """``{kind: {status: count}}`` for one owner, every status present."""
+    counts = {
+        ISSUE: dict.fromkeys(dict(Issue.STATUS_CHOICES), 0),
+        PATIENT_REQUEST: dict.fromkeys(dict(PatientRequest.STATUS_CHOICES), 0),
+    }
+    rows = DashboardCounter.objects.filter(owner_type=owner_type, owner_id=owner_id).values_list('kind', 'status', 'count')
+    for kind, status, count in rows:
+        counts[kind][status] = count
+    return counts
+
+
+def read_totals():
+    """``{kind: {status: count}}`` over every patient, plus ``{doctor_id: {status: count}}``."""
+    counts = {
+        ISSUE: dict.fromkeys(dict(Issue.STATUS_CHOICES), 0),
+        PATIENT_REQUEST: dict.fromkeys(dict(PatientRequest.STATUS_CHOICES), 0),
+    }
+    doctors = {}
+    # Patient rows are never read here: the site-wide rows already sum them
+    for owner_type, owner_id, kind, status, count in DashboardCounter.objects.filter(
+        owner_type__in=[ALL, DOCTOR]
+    ).values_list('owner_type', 'owner_id', 'kind', 'status', 'count'):
+        if owner_type == ALL:
+            counts[kind][status] = count
+        else:
+            doctors.setdefault(owner_id, dict.fromkeys(dict(Issue.STATUS_CHOICES), 0))[status] = count
+    return counts, doctors
+
+
+def actual_counts():
+    """Count every owner/status group from the source tables."""
+    counts = Counter()
+    for row in Issue.objects.values('status').annotate(n=Count('id')).order_by():
+        counts[(ALL, 0, ISSUE, row['status'])] = row['n']
+    for row in PatientRequest.objects.filter(patient__isnull=False).values('status').annotate(n=Count('id')).order_by():
+        counts[(ALL, 0, PATIENT_REQUEST, row['status'])] = row['n']
+    for row in Issue.objects.values('patient_id', 'status').annotate(n=Count('id')).order_by():
+        counts[(PATIENT, row['patient_id'], ISSUE, row['status'])] = row['n']
+    for row in Issue.objects.filter(doctor__isnull=False).values('doctor_id', 'status').annotate(n=Count('id')).order_by():
+        counts[(DOCTOR, row['doctor_id'], ISSUE, row['status'])] = row['n']
+    for row in (
+        PatientRequest.objects.filter(patient__isnull=False)
+        .values('patient_id', 'status').annotate(n=Count('id')).order_by()
+    ):
+        counts[(PATIENT, row['patient_id'], PATIENT_REQUEST, row['status'])] = row['n']
+    return counts
+
+
+def rebuild_counters(dry_run=False):
+    """Recompute every counter from the source tables; returns ``{key: (stored, actual)}`` for those that drifted."""
+    with transaction.atomic():
+        stored = {
+            (row.owner_type, row.owner_id, row.kind, row.status): row.count
+            for row in DashboardCounter.objects.select_for_update()
+        }
+        actual = actual_counts()
+        drift = {
+            key: (stored.get(key, 0), actual.get(key, 0))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key, 0) != actual.get(key, 0)
+        }
+        if not dry_run:
+            DashboardCounter.objects.all().delete()
+            DashboardCounter.objects.bulk_create(
+                DashboardCounter(owner_type=owner_type, owner_id=owner_id, kind=kind, status=status, count=count)
+                for (owner_type, owner_id, kind, status), count in actual.items()
+            )
+    return drift
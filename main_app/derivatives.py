@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+logger = logging.getLogger(__name__)
+
+# Longest edge, in pixels, of each derivative
+DERIVATIVE_SIZES = {
+    'thumbnail': 160,
+    'preview': 1024,
+}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# Directory under MEDIA_ROOT; not part of the content-addressed tree
+DERIVATIVE_PREFIX = 'derivatives'
+
+# Derivatives are addressed by their source name, so they are written with a
+# plain FileSystemStorage rather than the content-addressed default storage.
+derivative_storage = FileSystemStorage()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def image_format():
+    from PIL import features
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+
+def is_image(name):
+    return bool(name) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_name(name, size):
+    stem = os.path.splitext(name)[0]
+    extension = '.webp' if image_format() == 'WEBP' else '.jpg'
+    return f"{DERIVATIVE_PREFIX}/{size}/{stem}{extension}"
+
+
+def render_derivatives(source_path, targets, fmt):
+    """Resize one source image into every (path, edge) target. Runs in a worker process."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for target_path, edge in targets:
+            derivative = image.copy()
+            derivative.thumbnail((edge, edge))
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            partial = f"{target_path}.part"
+            derivative.save(partial, fmt, quality=80)
+            os.replace(partial, target_path)
+    return [path for path, _ in targets]
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2))
+        return _pool
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("Image derivative generation failed: %s", future.exception())
+
+
+def schedule_derivatives(field_file):
+    """
+    Queue thumbnail/preview generation for an uploaded image.
+
+    Work is handed to a process pool so resizing never runs on the request
+    path; with IMAGE_DERIVATIVE_WORKERS = 0 it runs inline instead.
+    """
+    if not field_file or not is_image(field_file.name) or not field_file.storage.exists(field_file.name):
+        return
+    targets = [
+        (derivative_storage.path(derivative_name(field_file.name, size)), edge)
+        for size, edge in DERIVATIVE_SIZES.items()
+        if not derivative_storage.exists(derivative_name(field_file.name, size))
+    ]
+    if not targets:
+        return
+    source_path = field_file.storage.path(field_file.name)
+    if getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2) == 0:
+        render_derivatives(source_path, targets, image_format())
+        return
+    get_pool().submit(render_derivatives, source_path, targets, image_format()).add_done_callback(_log_failure)
+
+
+def derivative_urls(field_file, request=None):
+    """Map each derivative size to its URL, falling back to the original until it is generated."""
+    if not field_file or not is_image(field_file.name):
+        return None
+    urls = {}
+    for size in DERIVATIVE_SIZES:
+        name = derivative_name(field_file.name, size)
+        url = derivative_storage.url(name) if derivative_storage.exists(name) else field_file.url
+        urls[size] = request.build_absolute_uri(url) if request is not None else url
+    return urls
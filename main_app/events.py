@@ -0,0 +1,201 @@
+"""
+Status-change events for issues and patient requests.
+
+Save hooks (see main_app.signals) publish an event once the saving
+transaction commits.  Each worker process keeps a ``Broker`` that fans events
+out to its open Server-Sent Events streams and remembers the most recent ones
+so a reconnecting client can resume from its ``Last-Event-ID``.
+
+With ``EVENT_BROKER_BACKEND = 'postgres'`` events are published with
+``pg_notify`` instead and every worker delivers them from a background
+``LISTEN`` thread, so a stream sees changes saved by any worker.  PostgreSQL
+delivers notifications in commit order, which keeps the replay buffers of all
+workers in the same order.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'yaqeenmed_events'
+
+
+def backend():
+    return getattr(settings, 'EVENT_BROKER_BACKEND', 'local')
+
+
+def visible_to(event, user):
+    # Same visibility as scope_issues/scope_patient_requests
+    if user.is_patient:
+        return event['patient_user'] == user.pk
+    elif user.is_doctor:
+        return event['doctor_user'] == user.pk
+    return True
+
+
+class Subscription:
+    """One open stream: a bounded queue fed from any thread via its event loop."""
+
+    def __init__(self, user, loop, max_size):
+        self.user = user
+        self.loop = loop
+        self.queue = asyncio.Queue(max_size)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client is not keeping up; the stream tells it to resync
+            self.overflowed = True
+
+
+class Broker:
+    """
+    In-process fan-out of events to subscriptions, plus a bounded replay buffer.
+
+    ``deliver`` may be called from any thread.  Subscribing and computing the
+    replay happen under the same lock as delivery, so a reconnecting client
+    neither misses nor repeats an event.
+    """
+
+    def __init__(self, buffer_size=1000, queue_size=100):
+        self.queue_size = queue_size
+        self._recent = deque(maxlen=buffer_size)
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def deliver(self, event):
+        with self._lock:
+            self._recent.append(event)
+            subscriptions = [s for s in self._subscriptions if visible_to(event, s.user)]
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The stream's event loop has already closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self, user, last_event_id=None):
+        """
+        Register a stream on the running event loop.
+
+        Returns ``(subscription, replay)`` where ``replay`` lists the visible
+        events after ``last_event_id``, or is None when that id is no longer
+        buffered and the client has to reload its state.
+        """
+        subscription = Subscription(user, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            replay = []
+            if last_event_id:
+                ids = [event['id'] for event in self._recent]
+                if last_event_id in ids:
+                    replay = list(self._recent)[ids.index(last_event_id) + 1:]
+                else:
+                    replay = None
+            self._subscriptions.add(subscription)
+        if replay:
+            replay = [event for event in replay if visible_to(event, user)]
+        return subscription, replay
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+
+
+broker = Broker(
+    buffer_size=getattr(settings, 'EVENT_BUFFER_SIZE', 1000),
+    queue_size=getattr(settings, 'EVENT_QUEUE_SIZE', 100),
+)
+
+
+def make_event(kind, pk, status, previous_status, patient_user, doctor_user):
+    return {
+        'id': uuid.uuid4().hex,
+        'type': kind,
+        'data': {'id': pk, 'status': status, 'previous_status': previous_status},
+        'patient_user': patient_user,
+        'doctor_user': doctor_user,
+    }
+
+
+def publish(event):
+    """Deliver ``event`` to every stream that may see it once the current transaction commits."""
+    if backend() == 'postgres':
+        # NOTIFY is transactional: it is sent on commit and dropped on rollback
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, json.dumps(event)])
+        ensure_listener()
+    else:
+        transaction.on_commit(lambda: broker.deliver(event))
+
+
+def issue_status_changed(issue, previous_status):
+    publish(make_event(
+        'issue', issue.pk, issue.status, previous_status,
+        patient_user=issue.patient.user_id,
+        # A doctor's primary key is its user id
+        doctor_user=issue.doctor_id,
+    ))
+
+
+def patient_request_status_changed(patient_request, previous_status):
+    issue = patient_request.issue
+    publish(make_event(
+        'patient_request', patient_request.pk, patient_request.status, previous_status,
+        patient_user=patient_request.patient.user_id if patient_request.patient_id else None,
+        doctor_user=issue.doctor_id if issue is not None else None,
+    ))
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener():
+    """Start this process's LISTEN thread (PostgreSQL backend only)."""
+    global _listener
+    if backend() != 'postgres':
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=listen, name='event-listener', daemon=True)
+            _listener.start()
+
+
+def listen(poll_interval=5.0):
+    """Feed notifications from every worker into the local broker, reconnecting on errors."""
+    while True:
+        # Django connections are per thread, so this one is private to the listener
+        db = connections['default']
+        try:
+            db.ensure_connection()
+            with db.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            raw = db.connection
+            while True:
+                if select.select([raw], [], [], poll_interval)[0]:
+                    raw.poll()
+                    while raw.notifies:
+                        broker.deliver(json.loads(raw.notifies.pop(0).payload))
+        except Exception:
+            logger.exception("Event listener lost its database connection; retrying")
+            db.close()
+            time.sleep(poll_interval)
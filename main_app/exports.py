@@ -0,0 +1,81 @@
+"""
+Streaming exports of a user's issues and patient requests.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` (a server-side cursor
+on PostgreSQL; related rows are prefetched one chunk at a time) and serialized
+as the response is written, so a worker holds one chunk however long the
+history is.  Every row is rendered by the same serializer as the list
+endpoints.
+
+The body is a synchronous iterator: behind an ASGI server Django consumes it
+fully before sending, so serve exports from the WSGI workers.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class Echo:
+    """A file-like object whose write() returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def serialized_rows(queryset, serializer_class, context):
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 500)
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        yield serializer_class(instance, context=context).data
+
+
+def in_chunks(lines):
+    # One write per database chunk rather than per row
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 500)
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def ndjson_lines(rows):
+    encoder = JSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def csv_lines(rows, fieldnames):
+    """Top-level fields as columns; nested objects and lists are written as JSON."""
+    writer = csv.writer(Echo())
+    encoder = JSONEncoder(ensure_ascii=False)
+    yield writer.writerow(fieldnames)
+    for row in rows:
+        yield writer.writerow([
+            encoder.encode(row[name]) if isinstance(row[name], (dict, list)) else row[name]
+            for name in fieldnames
+        ])
+
+
+def export_response(queryset, serializer_class, file_format, name, request):
+    if file_format not in CONTENT_TYPES:
+        raise Http404
+    rows = serialized_rows(queryset, serializer_class, {'request': request})
+    if file_format == 'csv':
+        lines = csv_lines(rows, list(serializer_class(context={'request': request}).fields))
+    else:
+        lines = ndjson_lines(rows)
+    response = StreamingHttpResponse(in_chunks(lines), content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{file_format}"'
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,97 @@
+"""
+Sparse fieldsets: ``?fields=`` and ``?expand=`` on read endpoints.
+
+``fields`` lists the plain columns a client wants (``id`` is always kept) and
+``expand`` the relations it wants embedded (documents, comments, nested
+profiles).  Without either parameter a payload is exactly what it always was.
+Once one is given, relations are only rendered when named, so asking for
+``?fields=id,title,status`` skips every join and prefetch behind an issue.
+
+The pruning happens twice: ``SparseFieldsMixin`` drops serializer fields, and
+``shape_queryset`` builds the matching queryset from the serializer's
+``field_requirements`` -- ``only()`` on the requested columns, and
+``select_related`` / ``prefetch_related`` for the requested relations only.
+Both read the same ``FieldSelection`` so they cannot disagree.  Writes are
+never pruned.
+"""
+
+
+def parse_names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class FieldSelection:
+    def __init__(self, fields=None, expand=()):
+        self.fields = fields
+        self.expand = set(expand)
+
+    @classmethod
+    def from_request(cls, request):
+        """The caller's selection, or None when the full payload was asked for."""
+        if request is None or request.method != 'GET':
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        fields = parse_names(params['fields']) if 'fields' in params else None
+        return cls(fields, parse_names(params.get('expand', '')))
+
+    def includes(self, name, expandable=False):
+        if name == 'id':
+            return True
+        if expandable:
+            return name in self.expand or (self.fields is not None and name in self.fields)
+        return self.fields is None or name in self.fields
+
+
+def selected_fields(serializer_class, selection):
+    names = serializer_class.Meta.fields
+    if selection is None:
+        return list(names)
+    expandable = serializer_class.field_requirements
+    return [name for name in names if selection.includes(name, name in expandable)]
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin honouring ``?fields=`` / ``?expand=`` from the request in
+    its context.  ``field_requirements`` maps each expandable field to what
+    its queryset needs (``only``, ``select_related``, ``prefetch_related``).
+    """
+    field_requirements = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = FieldSelection.from_request(self.context.get('request'))
+        if selection is None:
+            return fields
+        keep = selected_fields(type(self), selection)
+        return {name: field for name, field in fields.items() if name in keep}
+
+
+def shape_queryset(queryset, serializer_class, request, keep=('created_at',)):
+    """
+    Load what ``serializer_class`` will render for ``request`` and nothing
+    more.  ``keep`` names columns needed regardless of the selection, such as
+    the keyset pagination key.
+    """
+    selection = FieldSelection.from_request(request)
+    concrete = {field.name for field in queryset.model._meta.concrete_fields}
+    columns = {queryset.model._meta.pk.name, *keep}
+    select_related, prefetch_related = [], []
+    for name in selected_fields(serializer_class, selection):
+        requirements = serializer_class.field_requirements.get(name)
+        if requirements is None:
+            if name in concrete:
+                columns.add(name)
+            continue
+        columns.update(requirements.get('only', ()))
+        select_related.extend(requirements.get('select_related', ()))
+        prefetch_related.extend(requirements.get('prefetch_related', ()))
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    if selection is not None:
+        queryset = queryset.only(*columns)
+    return queryset
@@ -0,0 +1,369 @@
+"""
+Streaming bulk import of main_app rows from JSON fixtures, NDJSON and CSV.
+
+Records are read one at a time and buffered per model.  A full buffer is
+inserted with one multi-row INSERT (or ``COPY`` on PostgreSQL), so memory stays
+bounded by the batch size however large the input is.  Rows are inserted raw:
+no save() or signals run, and ``created_at``-style timestamps from the source
+are kept.  Values of fields with choices are matched to the choices regardless
+of case, so fixtures from before the user roles were lower-cased still load.
+
+Every inserted row is recorded in ImportedRow as (source, model, source pk)
+-> new pk.  Foreign keys of later records are resolved through that map.
+Rows whose parents have not been imported yet are set aside in a temporary
+file and retried at the end.  Rows already in the map are skipped, so an
+interrupted import is resumed by running it again.
+"""
+import codecs
+import csv
+import io
+import json
+import re
+import tempfile
+from collections import Counter, defaultdict
+from datetime import date, datetime, time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import ImportedRow
+
+READ_BLOCK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(fh):
+    """Yield the objects of a top-level JSON array (e.g. a dumpdata fixture) from a binary file."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    started = False
+    while True:
+        block = fh.read(READ_BLOCK_SIZE)
+        buffer = buffer[pos:] + text.decode(block, final=not block)
+        pos = 0
+        while True:
+            pos = SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if not block:
+                    raise
+                # The record continues in the next block
+                break
+            yield record
+        if not block:
+            raise ValueError("Unexpected end of JSON array")
+
+
+def iter_ndjson(fh):
+    for line in fh:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv(fh, model_label):
+    """Yield one record per CSV row; the header names the model's fields and an optional ``pk`` or ``id``."""
+    for row in csv.DictReader(io.TextIOWrapper(fh, encoding='utf-8', newline='')):
+        pk = row.pop('pk', None)
+        if pk is None:
+            pk = row.pop('id', None)
+        yield {'model': model_label, 'pk': pk or None, 'fields': row}
+
+
+def copy_text(value):
+    """Render a prepared value for PostgreSQL's COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date, time)):
+        value = value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def choice_value(field, value):
+    """Match ``value`` to one of ``field``'s choices regardless of case (e.g. an old ``PATIENT`` role)."""
+    if not field.choices or not isinstance(value, str):
+        return value
+    for choice, _ in field.flatchoices:
+        if isinstance(choice, str) and choice.lower() == value.lower():
+            return choice
+    return value
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+class Importer:
+    """
+    Feed records to ``add`` and call ``finish``; ``stats`` then holds, per
+    model, how many rows were imported, skipped as already imported, rejected
+    or ignored.  Rejected records are written to ``rejects`` (NDJSON with an
+    ``error`` key) when a file is given.
+    """
+
+    def __init__(self, source, batch_size=1000, use_copy=False, rejects=None, progress=None):
+        self.source = source
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.rejects = rejects
+        self.progress = progress or (lambda message: None)
+        self.stats = defaultdict(Counter)
+        self.pending = defaultdict(list)
+        self.flushing = set()
+        self.records_seen = 0
+        self.spill = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self.spilled = 0
+
+    def add(self, record):
+        label = str(record.get('model', '')).lower()
+        try:
+            model = apps.get_model(label)
+        except (LookupError, ValueError):
+            model = None
+        if model is None or model._meta.app_label != 'main_app' or model is ImportedRow:
+            # contenttypes, permissions, sessions and the like are not imported
+            self.stats[label]['ignored'] += 1
+            return
+        if '_key' not in record:
+            self.records_seen += 1
+            key = self.source_pk(model, record)
+            # Rows without a primary key are keyed by position so re-runs still skip them
+            record['_key'] = str(key) if key not in (None, '') else f"#{self.records_seen}"
+        self.pending[model].append(record)
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model):
+        # Parents first, so this batch's foreign keys can resolve
+        self.flushing.add(model)
+        for field in model._meta.concrete_fields:
+            related = field.related_model
+            if field.is_relation and related not in self.flushing and self.pending.get(related):
+                self.flush(related)
+        self.flushing.discard(model)
+        records = self.pending.pop(model, [])
+        if records:
+            self.import_batch(model, records)
+
+    def finish(self):
+        for model in list(self.pending):
+            self.flush(model)
+        # Retry rows whose parents came later in the input until a pass makes no progress
+        while self.spilled:
+            spill, spilled = self.spill, self.spilled
+            self.spill, self.spilled = tempfile.TemporaryFile('w+', encoding='utf-8'), 0
+            spill.seek(0)
+            self.progress(f"Retrying {spilled} row(s) with forward references.")
+            for line in spill:
+                self.add(json.loads(line))
+            for model in list(self.pending):
+                self.flush(model)
+            spill.close()
+            if self.spilled == spilled:
+                self.spill.seek(0)
+                for line in self.spill:
+                    record = json.loads(line)
+                    self.reject(record, "References a row that is not in the import.")
+                break
+        self.spill.close()
+        return self.stats
+
+    def reject(self, record, error):
+        self.stats[record['model'].lower()]['rejected'] += 1
+        if self.rejects is not None:
+            self.rejects.write(json.dumps({**record, 'error': error}, default=str) + '\n')
+
+    def resolve(self, model, records):
+        """Map every referenced source pk to its imported pk, one query per related model."""
+        wanted = defaultdict(set)
+        for record in records:
+            for field, value in self.relation_values(model, record):
+                if value not in (None, ''):
+                    wanted[field.related_model].add(str(value))
+        resolved = {}
+        for related, keys in wanted.items():
+            resolved[related] = dict(
+                ImportedRow.objects.filter(
+                    source=self.source, model=related._meta.label_lower, source_pk__in=keys
+                ).values_list('source_pk', 'target_pk')
+            )
+        return resolved
+
+    @staticmethod
+    def source_pk(model, record):
+        pk = model._meta.pk
+        fields = record.get('fields', {})
+        if record.get('pk') is None and (pk.name in fields or pk.attname in fields):
+            # e.g. a CSV of doctors with a ``user`` column
+            return fields.get(pk.name, fields.get(pk.attname))
+        return record.get('pk')
+
+    def relation_values(self, model, record):
+        fields = record.get('fields', {})
+        for field in model._meta.concrete_fields:
+            if not field.is_relation:
+                continue
+            if field.primary_key:
+                # e.g. Doctor, whose primary key is its user
+                yield field, self.source_pk(model, record)
+            elif field.name in fields or field.attname in fields:
+                yield field, fields.get(field.name, fields.get(field.attname))
+
+    def build(self, model, record, resolved):
+        fields_by_name = {}
+        for field in model._meta.concrete_fields:
+            fields_by_name[field.name] = fields_by_name[field.attname] = field
+
+        values = {}
+        for name, value in record.get('fields', {}).items():
+            field = fields_by_name.get(name)
+            if field is None or field.primary_key or field.is_relation:
+                continue
+            if value == '' and not field.empty_strings_allowed:
+                value = None
+            if value is not None:
+                value = field.to_python(choice_value(field, value))
+                if isinstance(value, datetime) and settings.USE_TZ and timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+            values[field.attname] = value
+        for field, value in self.relation_values(model, record):
+            if value in (None, ''):
+                values[field.attname] = None
+                continue
+            target = resolved[field.related_model].get(str(value))
+            if target is None:
+                raise UnresolvedReference()
+            values[field.attname] = field.target_field.to_python(target)
+
+        pk = model._meta.pk
+        if not pk.is_relation and not pk.db_returning and record.get('pk') is not None:
+            # Natural primary keys (e.g. StoredBlob.name) are kept as they are
+            values[pk.attname] = pk.to_python(record['pk'])
+        instance = model(**values)
+        now = timezone.now()
+        for field in model._meta.concrete_fields:
+            if (getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)) \
+                    and getattr(instance, field.attname) is None:
+                setattr(instance, field.attname, now)
+        return instance
+
+    def import_batch(self, model, records):
+        label = model._meta.label_lower
+        keys = [record['_key'] for record in records]
+        done = set(
+            ImportedRow.objects.filter(source=self.source, model=label, source_pk__in=keys)
+            .values_list('source_pk', flat=True)
+        )
+        records = [record for record in records if record['_key'] not in done]
+        self.stats[label]['skipped'] += len(done)
+        resolved = self.resolve(model, records)
+
+        rows = []
+        for record in records:
+            try:
+                rows.append((record, self.build(model, record, resolved)))
+            except UnresolvedReference:
+                self.spill.write(json.dumps(record) + '\n')
+                self.spilled += 1
+            except ValidationError as exc:
+                self.reject(record, '; '.join(exc.messages))
+        if not rows:
+            return
+
+        try:
+            with transaction.atomic():
+                targets = self.insert(model, [instance for _, instance in rows], self.use_copy)
+                self.record_imported(label, [record for record, _ in rows], targets)
+            self.stats[label]['imported'] += len(rows)
+        except IntegrityError:
+            # Isolate the offending rows (e.g. a username that already exists)
+            for record, instance in rows:
+                if model._meta.pk.db_returning:
+                    instance.pk = None
+                try:
+                    with transaction.atomic():
+                        targets = self.insert(model, [instance], use_copy=False)
+                        self.record_imported(label, [record], targets)
+                    self.stats[label]['imported'] += 1
+                except IntegrityError as exc:
+                    self.reject(record, str(exc))
+        self.progress(f"{label}: {self.stats[label]['imported']} imported")
+
+    def record_imported(self, label, records, targets):
+        ImportedRow.objects.bulk_create([
+            ImportedRow(source=self.source, model=label, source_pk=record['_key'], target_pk=str(target))
+            for record, target in zip(records, targets)
+        ])
+
+    def insert(self, model, instances, use_copy):
+        """Insert without save() or pre_save(), returning the new primary keys in order."""
+        if use_copy:
+            return self.copy(model, instances)
+        pk = model._meta.pk
+        fields = [field for field in model._meta.concrete_fields if not (field is pk and pk.db_returning)]
+        # Manager._insert with raw=True is what save() uses for fixtures: values go in as they are
+        manager = model._base_manager
+        if not pk.db_returning:
+            batch_size = max(connection.ops.bulk_batch_size(fields, instances), 1)
+            for start in range(0, len(instances), batch_size):
+                manager._insert(instances[start:start + batch_size], fields=fields, raw=True)
+            return [instance.pk for instance in instances]
+
+        targets = []
+        if connection.features.can_return_rows_from_bulk_insert:
+            batch_size = max(connection.ops.bulk_batch_size(fields, instances), 1)
+            for start in range(0, len(instances), batch_size):
+                rows = manager._insert(instances[start:start + batch_size], fields=fields, returning_fields=[pk], raw=True)
+                targets.extend(row[0] for row in rows)
+        else:
+            for instance in instances:
+                targets.append(manager._insert([instance], fields=fields, returning_fields=[pk], raw=True)[0][0])
+        for instance, target in zip(instances, targets):
+            instance.pk = target
+        return targets
+
+    def copy(self, model, instances):
+        """PostgreSQL only: reserve primary keys from the sequence, then stream the rows with COPY."""
+        meta = model._meta
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            if meta.pk.db_returning:
+                cursor.execute(
+                    'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                    [meta.db_table, meta.pk.column, len(instances)],
+                )
+                for instance, (value,) in zip(instances, cursor.fetchall()):
+                    instance.pk = value
+            fields = meta.concrete_fields
+            buffer = io.StringIO()
+            for instance in instances:
+                values = (field.get_db_prep_save(getattr(instance, field.attname), connection) for field in fields)
+                buffer.write('\t'.join(copy_text(value) for value in values) + '\n')
+            buffer.seek(0)
+            columns = ', '.join(quote(field.column) for field in fields)
+            sql = f'COPY {quote(meta.db_table)} ({columns}) FROM STDIN'
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(sql, buffer)
+            else:
+                with raw.copy(sql) as stream:
+                    stream.write(buffer.getvalue())
+        return [instance.pk for instance in instances]
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main_app.assignment import assign_pending_issues
+
+
+class Command(BaseCommand):
+    help = "Assign pending, unclaimed issues to the least-loaded doctor of the matching specialty."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help="Maximum issues to assign in this run.")
+
+    def handle(self, *args, **options):
+        assigned = assign_pending_issues(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f"Assigned {assigned} issue(s)."))
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.storage import ContentAddressedStorage, collect_garbage, rebuild_refcounts
+
+
+class Command(BaseCommand):
+    help = "Garbage-collect unreferenced content-addressed media blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconcile', action='store_true', help="Recount references from the database first.")
+        parser.add_argument('--grace-hours', type=float, default=1, help="Keep unreferenced blobs younger than this.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting it.")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not ContentAddressedStorage.")
+
+        if options['reconcile']:
+            drift = rebuild_refcounts(default_storage)
+            for name, (recorded, actual) in sorted(drift.items()):
+                self.stdout.write(f"{name}: refcount {recorded} -> {actual}")
+            self.stdout.write(f"Reconciled {len(drift)} blob(s).")
+
+        removed = collect_garbage(
+            default_storage, grace=timedelta(hours=options['grace_hours']), dry_run=options['dry_run']
+        )
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(removed)} unreferenced blob(s)."))
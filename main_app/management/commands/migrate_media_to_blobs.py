@@ -0,0 +1,61 @@
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main_app.derivatives import DERIVATIVE_PREFIX, DERIVATIVE_SIZES, derivative_name, derivative_storage
+from main_app.storage import ContentAddressedStorage, file_reference_fields, rebuild_refcounts
+
+
+class Command(BaseCommand):
+    help = "Move existing flat media files into content-addressed blobs and repoint the rows that use them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the files that would be migrated.")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not ContentAddressedStorage.")
+
+        # Blobs are already migrated; derivatives are addressed by their
+        # source's name and regenerated from it, never referenced by a row
+        skipped = {storage.path(storage.blob_prefix), storage.path(DERIVATIVE_PREFIX)}
+        migrated = 0
+        for dirpath, dirnames, filenames in os.walk(storage.location):
+            dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) not in skipped]
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                old_name = os.path.relpath(full_path, storage.location).replace(os.sep, '/')
+                if options['dry_run']:
+                    self.stdout.write(old_name)
+                    continue
+
+                with transaction.atomic():
+                    with open(full_path, 'rb') as fh:
+                        new_name = storage.save(old_name, File(fh))
+                    for model, attname in file_reference_fields():
+                        model._default_manager.filter(**{attname: old_name}).update(**{attname: new_name})
+                os.remove(full_path)
+                self.move_derivatives(old_name, new_name)
+                migrated += 1
+                self.stdout.write(f"{old_name} -> {new_name}")
+
+        if not options['dry_run']:
+            rebuild_refcounts(storage)
+        self.stdout.write(self.style.SUCCESS(f"Migrated {migrated} file(s)."))
+
+    def move_derivatives(self, old_name, new_name):
+        # Derivatives are found by their source's name: follow it to the blob
+        for size in DERIVATIVE_SIZES:
+            old_path = derivative_storage.path(derivative_name(old_name, size))
+            if not os.path.exists(old_path):
+                continue
+            new_path = derivative_storage.path(derivative_name(new_name, size))
+            if os.path.exists(new_path):
+                os.remove(old_path)
+            else:
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                os.replace(old_path, new_path)
@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.onboarding import Onboarding, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create patient and doctor accounts from a CSV or NDJSON file. Columns/keys: username, password, role, "
+        "and optionally email, first_name, last_name, age, specialty, license_number, years_experience."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, help="Accounts per transaction (default ONBOARDING_BATCH_SIZE).")
+        parser.add_argument('--workers', type=int, help="Password hashing processes (default ONBOARDING_HASH_WORKERS).")
+        parser.add_argument('--errors', help="Write rows that were not created here as NDJSON.")
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        onboarding = Onboarding(batch_size=options['batch_size'], workers=options['workers'])
+        started = time.perf_counter()
+        with open(options['path'], 'rb') as fh:
+            try:
+                for row in read_rows(fh, file_format):
+                    onboarding.add(row)
+                    if onboarding.rows % onboarding.batch_size == 0:
+                        self.stdout.write(f"Read {onboarding.rows} rows, created {onboarding.created} accounts.")
+            except (ValueError, UnicodeDecodeError) as exc:
+                raise CommandError(f"Row {onboarding.rows + 1}: {exc}")
+            created, errors = onboarding.finish()
+
+        if options['errors']:
+            with open(options['errors'], 'w', encoding='utf-8') as fh:
+                for row in errors:
+                    fh.write(json.dumps(row) + '\n')
+        for row in errors[:20]:
+            self.stderr.write(f"Row {row['row']} ({row['username']}): {row['errors']}")
+        elapsed = time.perf_counter() - started
+        message = f"Created {created} accounts in {elapsed:.1f}s."
+        if errors:
+            self.stdout.write(self.style.WARNING(f"{message} {len(errors)} rows were not created."))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main_app.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete expired upload sessions and their partial files."
+
+    def handle(self, *args, **options):
+        expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+        count = 0
+        for session in expired.iterator():
+            session.discard()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} expired upload session(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from main_app.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard counters from the issue and patient-request tables and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without rewriting the counters.")
+
+    def handle(self, *args, **options):
+        drift = rebuild_counters(dry_run=options['dry_run'])
+        for (owner_type, owner_id, kind, status), (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f"{owner_type} {owner_id} {kind} {status}: {stored} -> {actual}")
+        verb = "Found" if options['dry_run'] else "Reconciled"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drift)} drifted counter(s)."))
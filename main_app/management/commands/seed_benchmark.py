@@ -0,0 +1,123 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from main_app.counters import rebuild_counters
+from main_app.models import Comment, Doctor, Document, Issue, Patient, PatientRequest, User
+
+USERNAME_PREFIX = 'bench_'
+SPECIALTIES = [choice for choice, _ in Doctor.SPECIALTY_CHOICES]
+STATUSES = [choice for choice, _ in Issue.STATUS_CHOICES]
+WORDS = (
+    "chest pain fever cough headache fracture scan result biopsy follow up dosage "
+    "blood pressure rash fatigue allergy x-ray mri ultrasound referral second opinion"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a reproducible data set for benchmarks/routes.py: patients, doctors and ISSUES issues "
+        "with comments, documents and patient requests. Users are named bench_patient_<n>/bench_doctor_<n>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issues', type=int, default=10_000, help="Number of issues, e.g. 10000, 100000 or 1000000.")
+        parser.add_argument('--patients', type=int, help="Defaults to one patient per 10 issues.")
+        parser.add_argument('--doctors', type=int, help="Defaults to one doctor per 1000 issues (at least 5).")
+        parser.add_argument('--comments-per-issue', type=int, default=3)
+        parser.add_argument('--documents-per-issue', type=int, default=1)
+        parser.add_argument('--requests-per-patient', type=int, default=2)
+        parser.add_argument('--password', default='benchmark-password', help="Password for every seeded user.")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed, so runs are comparable.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true', help="Delete previously seeded benchmark users first.")
+
+    def handle(self, *args, **options):
+        existing = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        if options['flush']:
+            existing.delete()
+        elif existing.exists():
+            raise CommandError("Benchmark data already exists; pass --flush to replace it.")
+
+        issues = options['issues']
+        patient_count = options['patients'] or max(issues // 10, 1)
+        doctor_count = options['doctors'] or max(issues // 1000, 5)
+        batch_size = options['batch_size']
+        rng = random.Random(options['seed'])
+        # Hash once: every seeded user shares the password
+        password = make_password(options['password'])
+
+        with transaction.atomic():
+            patient_users = User.objects.bulk_create(
+                [User(username=f"{USERNAME_PREFIX}patient_{i}", role=User.ROLE_PATIENT, password=password) for i in range(patient_count)],
+                batch_size=batch_size,
+            )
+            doctor_users = User.objects.bulk_create(
+                [User(username=f"{USERNAME_PREFIX}doctor_{i}", role=User.ROLE_DOCTOR, password=password) for i in range(doctor_count)],
+                batch_size=batch_size,
+            )
+            patients = Patient.objects.bulk_create(
+                [Patient(user=user, age=rng.randint(1, 99)) for user in patient_users], batch_size=batch_size
+            )
+            doctors = Doctor.objects.bulk_create(
+                [Doctor(user=user, specialty=SPECIALTIES[i % len(SPECIALTIES)], license_number=f"BENCH-{i}")
+                 for i, user in enumerate(doctor_users)],
+                batch_size=batch_size,
+            )
+        self.stdout.write(f"Created {patient_count} patients and {doctor_count} doctors.")
+
+        for start in range(0, issues, batch_size):
+            with transaction.atomic():
+                self.create_issue_batch(rng, patients, doctors, min(batch_size, issues - start), options)
+            self.stdout.write(f"Created {min(start + batch_size, issues)}/{issues} issues.")
+
+        requests = []
+        for patient in patients:
+            for i in range(options['requests_per_patient']):
+                requests.append(PatientRequest(
+                    patient=patient, title=self.sentence(rng, 4), detailed_comment=self.sentence(rng, 30),
+                    summary_comment=self.sentence(rng, 8), status=rng.choice(STATUSES),
+                ))
+            if len(requests) >= batch_size:
+                PatientRequest.objects.bulk_create(requests)
+                requests = []
+        PatientRequest.objects.bulk_create(requests)
+
+        rebuild_counters()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {issues} issues. Log in as {USERNAME_PREFIX}patient_0 or {USERNAME_PREFIX}doctor_0 "
+            f"with password {options['password']!r}."
+        ))
+
+    def create_issue_batch(self, rng, patients, doctors, size, options):
+        batch = []
+        for _ in range(size):
+            status = rng.choice(STATUSES)
+            batch.append(Issue(
+                patient=rng.choice(patients),
+                doctor=None if status == Issue.STATUS_PENDING else rng.choice(doctors),
+                specialty=rng.choice(SPECIALTIES + ['']),
+                title=self.sentence(rng, 5),
+                description=self.sentence(rng, 40),
+                status=status,
+            ))
+        created = Issue.objects.bulk_create(batch)
+
+        comments = []
+        documents = []
+        for issue in created:
+            authors = [issue.patient.user_id] + ([issue.doctor_id] if issue.doctor_id else [])
+            for _ in range(options['comments_per_issue']):
+                comments.append(Comment(issue=issue, author_id=rng.choice(authors), content=self.sentence(rng, 20)))
+            for n in range(options['documents_per_issue']):
+                documents.append(Document(issue=issue, file=f"issue_documents/bench/{issue.pk}-{n}.pdf"))
+        Comment.objects.bulk_create(comments)
+        Document.objects.bulk_create(documents)
+
+    @staticmethod
+    def sentence(rng, words):
+        return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
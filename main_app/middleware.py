@@ -0,0 +1,199 @@
+import contextvars
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCountMiddleware:
+    """
+    Report the number of SQL queries a request ran in an ``X-Query-Count``
+    header.  Meant for benchmark runs (see benchmarks/routes.py); enable it
+    with the QUERY_COUNT_HEADER environment variable.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(queries)
+        return response
+
+
+class RequestTimings:
+    """What one request spent in the database and in serializers, in seconds."""
+
+    def __init__(self, capture_sql):
+        self.db_time = 0.0
+        self.queries = 0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.capture_sql = capture_sql
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # Called through timed_execute for the request being measured
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.queries += 1
+            if len(self.statements) < self.capture_sql:
+                # Statements only: parameters can hold patient data
+                self.statements.append((sql, elapsed))
+
+
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+
+def timed_execute(execute, sql, params, many, context):
+    # Installed on every connection, so queries an async view runs through
+    # sync_to_async in another thread are counted too: the context (and with
+    # it current_timings) follows the call into that thread.
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def install_timed_execute(connection, **kwargs):
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_execute)
+
+
+def timed_data(serializer):
+    """``serializer.data``, counted as serialize time of the request being measured."""
+    timings = current_timings.get()
+    if timings is None or timings.serializing:
+        return serializer.data
+    timings.serializing = True
+    started = time.perf_counter()
+    try:
+        return serializer.data
+    finally:
+        timings.serialize_time += time.perf_counter() - started
+        timings.serializing = False
+
+
+class TimedSerializer:
+    """Proxy for a serializer whose ``data`` goes through timed_data."""
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    @property
+    def data(self):
+        return timed_data(self.serializer)
+
+
+class TimedSerializerMixin:
+    """
+    Generic-view mixin: serializers from ``get_serializer`` report the time
+    spent producing their ``data`` to ServerTimingMiddleware.  Views that
+    build serializers themselves call ``timed_data``.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return TimedSerializer(super().get_serializer(*args, **kwargs))
+
+
+class ServerTimingMiddleware:
+    """
+    Measure a sample of requests: total time, SQL query count and time, and
+    time spent producing serializer ``.data``.  Measured requests get a
+    ``Server-Timing`` header (shown in browser dev tools) and a structured
+    ``main_app.middleware`` log record; requests slower than
+    SLOW_REQUEST_THRESHOLD_MS are logged as warnings with their SQL.
+
+    Runs natively under both WSGI and ASGI so async views keep their event
+    loop; the measurements live in a context variable rather than on the
+    calling thread's connection.  Serializer time is what views report through
+    ``timed_data`` / TimedSerializerMixin.  A streaming response (exports,
+    the event stream) is only measured until its headers are ready, and is
+    reported with ``partial`` set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 1.0)
+        self.slow_threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 1000) / 1000
+        self.capture_sql = getattr(settings, 'SLOW_REQUEST_MAX_STATEMENTS', 50)
+        connection_created.connect(install_timed_execute)
+        for opened in connections.all(initialized_only=True):
+            install_timed_execute(opened)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        timings = RequestTimings(self.capture_sql)
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        timings = RequestTimings(self.capture_sql)
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - started)
+
+    def report(self, request, response, timings, total):
+        # The body of a streaming response is produced after we return
+        partial = response.streaming
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings.db_time * 1000:.1f};desc="{timings.queries} queries"',
+            f'serialize;dur={timings.serialize_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}' + (';desc="before streaming"' if partial else ''),
+        ])
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 1),
+            'db_ms': round(timings.db_time * 1000, 1),
+            'db_queries': timings.queries,
+            'serialize_ms': round(timings.serialize_time * 1000, 1),
+            'partial': partial,
+        }
+        if total >= self.slow_threshold:
+            fields['sql'] = [{'sql': sql, 'ms': round(elapsed * 1000, 1)} for sql, elapsed in timings.statements]
+            logger.warning("Slow request %s %s took %.0f ms", request.method, request.path, total * 1000, extra=fields)
+        else:
+            logger.info("%s %s took %.0f ms", request.method, request.path, total * 1000, extra=fields)
+        return response
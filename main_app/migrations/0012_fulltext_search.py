@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# Frozen copy of main_app.search.SEARCH_COLUMNS as of this migration
+SEARCH_COLUMNS = {
+    'main_app_issue': ['title', 'description'],
+    'main_app_patientrequest': ['title', 'summary_comment', 'detailed_comment'],
+}
+
+
+def tsvector_sql(columns):
+    return ' || '.join(
+        f"setweight(to_tsvector('english', coalesce({column}, '')), '{weight}')"
+        for column, weight in zip(columns, 'ABCD')
+    )
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in SEARCH_COLUMNS.items():
+        if vendor == 'postgresql':
+            schema_editor.execute(
+                f'ALTER TABLE "{table}" ADD COLUMN "search_vector" tsvector '
+                f'GENERATED ALWAYS AS ({tsvector_sql(columns)}) STORED'
+            )
+            schema_editor.execute(f'CREATE INDEX "{table}_search_gin" ON "{table}" USING GIN ("search_vector")')
+        elif vendor == 'sqlite':
+            fts = f'{table}_fts'
+            cols = ', '.join(columns)
+            new_cols = ', '.join(f'new.{c}' for c in columns)
+            old_cols = ', '.join(f'old.{c}' for c in columns)
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE "{fts}" USING fts5({cols}, content="{table}", content_rowid="id")'
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER "{fts}_ai" AFTER INSERT ON "{table}" BEGIN '
+                f'INSERT INTO "{fts}"(rowid, {cols}) VALUES (new.id, {new_cols}); END'
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER "{fts}_ad" AFTER DELETE ON "{table}" BEGIN '
+                f'INSERT INTO "{fts}"("{fts}", rowid, {cols}) VALUES (\'delete\', old.id, {old_cols}); END'
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER "{fts}_au" AFTER UPDATE ON "{table}" BEGIN '
+                f'INSERT INTO "{fts}"("{fts}", rowid, {cols}) VALUES (\'delete\', old.id, {old_cols}); '
+                f'INSERT INTO "{fts}"(rowid, {cols}) VALUES (new.id, {new_cols}); END'
+            )
+            schema_editor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in SEARCH_COLUMNS:
+        if vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS "{table}_search_gin"')
+            schema_editor.execute(f'ALTER TABLE "{table}" DROP COLUMN IF EXISTS "search_vector"')
+        elif vendor == 'sqlite':
+            fts = f'{table}_fts'
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS "{fts}_{suffix}"')
+            schema_editor.execute(f'DROP TABLE IF EXISTS "{fts}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_storedblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-17 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='specialty',
+            field=models.CharField(blank=True, choices=[('RADIOLOGY', 'Radiology'), ('PATHOLOGY', 'Pathology'), ('CARDIOLOGY', 'Cardiology')], default='', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('doctor__isnull', True), ('status', 'PENDING')), fields=['specialty', 'created_at'], name='issue_claim_queue_idx'),
+        ),
+    ]
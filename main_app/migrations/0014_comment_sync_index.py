@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_issue_specialty'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['issue', 'created_at', 'id'], name='main_app_co_issue_i_363373_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_comment_sync_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('owner_type', models.CharField(max_length=10)),
+                ('owner_id', models.PositiveBigIntegerField()),
+                ('status', models.CharField(max_length=12)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner_type', 'owner_id', 'kind', 'status'), name='unique_dashboard_counter')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['patient', '-created_at', '-id'], name='issue_patient_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['doctor', '-created_at', '-id'], name='issue_doctor_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['doctor', 'status', '-created_at'], name='issue_doctor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientrequest',
+            index=models.Index(fields=['patient', '-created_at', '-id'], name='request_patient_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_composite_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100)),
+                ('model', models.CharField(max_length=50)),
+                ('source_pk', models.CharField(max_length=64)),
+                ('target_pk', models.CharField(max_length=64)),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'model', 'source_pk'), name='unique_imported_row')],
+            },
+        ),
+    ]
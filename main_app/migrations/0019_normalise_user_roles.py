@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def lowercase_roles(apps, schema_editor):
+    # Bulk onboarding stored 'PATIENT'/'DOCTOR'; the choices are lower-case
+    User = apps.get_model('main_app', 'User')
+    for role in ('patient', 'doctor'):
+        User.objects.filter(role=role.upper()).update(role=role)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0018_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_roles, migrations.RunPython.noop),
+    ]
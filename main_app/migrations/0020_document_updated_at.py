@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 18:37
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Existing files have not changed since they were uploaded
+    Document = apps.get_model('main_app', 'Document')
+    Document.objects.update(updated_at=F('uploaded_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0019_normalise_user_roles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
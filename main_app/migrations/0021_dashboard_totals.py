@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import Sum
+
+
+def add_totals(apps, schema_editor):
+    # The site-wide rows are the sum of the per-patient rows
+    DashboardCounter = apps.get_model('main_app', 'DashboardCounter')
+    rows = DashboardCounter.objects.filter(owner_type='patient').values('kind', 'status').annotate(total=Sum('count')).order_by()
+    DashboardCounter.objects.bulk_create(
+        DashboardCounter(owner_type='all', owner_id=0, kind=row['kind'], status=row['status'], count=row['total'])
+        for row in rows
+    )
+
+
+def remove_totals(apps, schema_editor):
+    apps.get_model('main_app', 'DashboardCounter').objects.filter(owner_type='all').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0020_document_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_totals, remove_totals),
+    ]
@@ -1,12 +1,22 @@
-from django.db import models
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
 
 
 
+MAX_DOCUMENT_SIZE_MB = 5
+DOCUMENT_EXTENSIONS = ['pdf', 'jpg', 'jpeg', 'png']
+
 def validate_file_size(value):
-    max_size_mb = 5
+    max_size_mb = MAX_DOCUMENT_SIZE_MB
     if value.size > max_size_mb * 1024 * 1024:
         raise ValidationError(f"File size must be under {max_size_mb}MB")
 
@@ -43,6 +53,16 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.get_full_name()} ({self.role})"
 
+    # Roles are compared through these, case-insensitively: imported rows
+    # may still carry the upper-case spelling
+    @property
+    def is_patient(self):
+        return (self.role or '').lower() == self.ROLE_PATIENT
+
+    @property
+    def is_doctor(self):
+        return (self.role or '').lower() == self.ROLE_DOCTOR
+
 
 
 
@@ -100,8 +120,12 @@ class Issue(models.Model):
         (STATUS_COMPLETED, 'Completed'),
     ]
 
+    OPEN_STATUSES = [STATUS_PENDING, STATUS_ACCEPTED]
+
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True)
+    # Which kind of doctor may claim the issue; blank means any specialty
+    specialty = models.CharField(max_length=20, choices=Doctor.SPECIALTY_CHOICES, blank=True, default='')
     title = models.CharField(max_length=200)
     description = models.TextField()
     status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=STATUS_PENDING)
@@ -113,8 +137,24 @@ class Issue(models.Model):
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            # Patients' and doctors' issue lists in keyset order (see main_app.pagination)
+            models.Index(fields=['patient', '-created_at', '-id'], name='issue_patient_recent_idx'),
+            models.Index(fields=['doctor', '-created_at', '-id'], name='issue_doctor_recent_idx'),
+            # A doctor's issues in one status: the open-issue cap and dashboards
+            models.Index(fields=['doctor', 'status', '-created_at'], name='issue_doctor_status_idx'),
+            # The assignment queue: oldest unassigned pending issue per specialty
+            models.Index(
+                fields=['specialty', 'created_at'],
+                condition=models.Q(status='PENDING', doctor__isnull=True),
+                name='issue_claim_queue_idx',
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        # Keeps the post_save counter update (see main_app.counters) in the row's transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Issue #{self.id} - {self.title}"
 
@@ -143,6 +183,10 @@ class PatientRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Patient Request #{self.id} - {self.title} - {self.status}"
 
@@ -151,6 +195,8 @@ class PatientRequest(models.Model):
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            # A patient's own requests in keyset order (PatientRequestCreate.get)
+            models.Index(fields=['patient', '-created_at', '-id'], name='request_patient_recent_idx'),
         ]
 
 
@@ -160,11 +206,13 @@ class Document(models.Model):
     file = models.FileField(
         upload_to='issue_documents/',
         validators=[
-            FileExtensionValidator(['pdf', 'jpg', 'jpeg', 'png']),
+            FileExtensionValidator(DOCUMENT_EXTENSIONS),
             validate_file_size
         ]
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Moves when the file is replaced, so conditional GETs notice (see main_app.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Document for Issue #{self.issue.id}"
@@ -177,6 +225,12 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Incremental thread sync: comments on one issue after a (created_at, id) cursor
+            models.Index(fields=['issue', 'created_at', 'id']),
+        ]
+
     def save(self, *args, **kwargs):
         if self.issue.status == Issue.STATUS_COMPLETED:
             raise ValidationError("Cannot modify comments on completed issues.")
@@ -184,3 +238,151 @@ class Comment(models.Model):
 
     def __str__(self):
         return f"Comment by {self.author} on Issue #{self.issue.id}"
+
+
+def upload_session_expiry():
+    return timezone.now() + timedelta(hours=24)
+
+
+class UploadSession(models.Model):
+    """A resumable, chunked upload that becomes a Document once complete."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    checksum = models.PositiveBigIntegerField(default=0)  # running CRC-32 of the bytes received so far
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=upload_session_expiry)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    @property
+    def upload_root(self):
+        root = getattr(settings, 'UPLOAD_SESSION_ROOT', os.path.join(tempfile.gettempdir(), 'yaqeenmed_uploads'))
+        os.makedirs(root, exist_ok=True)
+        return root
+
+    @property
+    def temporary_path(self):
+        # The assembled upload, written once every chunk has arrived
+        return os.path.join(self.upload_root, f"{self.id}.part")
+
+    def staging_path(self):
+        # Where one PUT streams its chunk before the offset is claimed
+        return os.path.join(self.upload_root, f"{self.id}.{uuid.uuid4().hex}.staged")
+
+    def chunk_path(self, offset):
+        return os.path.join(self.upload_root, f"{self.id}.{offset:020d}.chunk")
+
+    def assemble(self, block_size=64 * 1024):
+        """Concatenate the committed chunks, following the offsets from 0 to ``size``."""
+        offset = 0
+        with open(self.temporary_path, 'wb') as assembled:
+            while offset < self.size:
+                with open(self.chunk_path(offset), 'rb') as chunk:
+                    for block in iter(lambda: chunk.read(block_size), b''):
+                        assembled.write(block)
+                        offset += len(block)
+        return self.temporary_path
+
+    def discard(self):
+        prefix = f"{self.id}."
+        for name in os.listdir(self.upload_root):
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.upload_root, name))
+                except FileNotFoundError:
+                    pass
+        self.delete()
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.size} bytes) for Issue #{self.issue_id}"
+
+
+class StoredBlob(models.Model):
+    """Reference count for a content-addressed file (see main_app.storage)."""
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
+class DashboardCounter(models.Model):
+    """
+    Number of issues or patient requests one owner has in one status.
+
+    Maintained by main_app.counters as rows are created, change status or
+    owner and are deleted; ``manage.py reconcile_counters`` rebuilds it.
+    """
+    KIND_ISSUE = 'issue'
+    KIND_PATIENT_REQUEST = 'patient_request'
+
+    OWNER_PATIENT = 'patient'
+    OWNER_DOCTOR = 'doctor'
+    # Site-wide totals, kept under owner_id 0 next to the per-owner rows
+    OWNER_ALL = 'all'
+
+    kind = models.CharField(max_length=20)
+    owner_type = models.CharField(max_length=10)
+    owner_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=12)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner_type', 'owner_id', 'kind', 'status'], name='unique_dashboard_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_type} {self.owner_id}: {self.count} {self.status} {self.kind}(s)"
+
+
+class ImportedRow(models.Model):
+    """
+    Where a row from an import source ended up (see main_app.importer).
+
+    Foreign keys in later records are resolved through this map, and rows
+    already listed here are skipped, so an interrupted import can be re-run.
+    """
+    source = models.CharField(max_length=100)
+    model = models.CharField(max_length=50)
+    source_pk = models.CharField(max_length=64)
+    target_pk = models.CharField(max_length=64)
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'model', 'source_pk'], name='unique_imported_row'),
+        ]
+
+    def __str__(self):
+        return f"{self.source}: {self.model} {self.source_pk} -> {self.target_pk}"
+
+
+class RevokedToken(models.Model):
+    """
+    A refresh token that may no longer be used (see main_app.revocation).
+
+    Rows are only needed until the token would have expired anyway, and are
+    pruned after ``expires_at``.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Revoked token {self.jti}"
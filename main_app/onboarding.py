@@ -0,0 +1,168 @@
+"""
+Bulk onboarding of patient and doctor accounts from CSV or NDJSON.
+
+Rows are validated with OnboardingRowSerializer and handled in batches of
+ONBOARDING_BATCH_SIZE.  Each batch checks usernames and licence numbers
+against the database with one query apiece, hashes its passwords on a
+process pool (ONBOARDING_HASH_WORKERS processes; 0 hashes inline), and then
+bulk-inserts its User rows and their Patient/Doctor rows in one
+transaction.  A row that fails is reported with its row number (1-based, header excluded) and does
+not stop the rest.
+
+The process pool is for ``manage.py onboard_users``.  Web requests pass
+``hash_on_password_pool`` instead, so they share the bounded pool that login
+and registration use (see main_app.passwords).
+"""
+import csv
+import io
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+from . import passwords as password_pool
+from .cache import bump_generation
+from .models import Doctor, Patient, User
+from .serializers import OnboardingRowSerializer
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def hash_workers():
+    workers = getattr(settings, 'ONBOARDING_HASH_WORKERS', None)
+    return os.cpu_count() if workers is None else workers
+
+
+def get_pool(workers):
+    with _pool_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _pools[workers]
+
+
+def hash_passwords(passwords, workers):
+    if workers == 0:
+        return [make_password(password) for password in passwords]
+    # A few large tasks per process rather than one round trip per password
+    chunksize = max(len(passwords) // (workers * 4), 1)
+    return list(get_pool(workers).map(make_password, passwords, chunksize=chunksize))
+
+
+def hash_on_password_pool(passwords):
+    # One call per password, so sign-ins waiting on the same pool get served in between;
+    # raises HashingBusy when the pool is saturated
+    return [password_pool.run(make_password, password) for password in passwords]
+
+
+def read_rows(fh, file_format):
+    """Yield the rows of a binary CSV or NDJSON file; blank CSV cells count as missing."""
+    if file_format == 'csv':
+        for row in csv.DictReader(io.TextIOWrapper(fh, encoding='utf-8-sig', newline='')):
+            yield {key: value for key, value in row.items() if key and value not in (None, '')}
+    else:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def error(number, row, errors):
+    return {'row': number, 'username': row.get('username') if isinstance(row, dict) else None, 'errors': errors}
+
+
+class Onboarding:
+    """Feed rows to ``add`` and call ``finish``; ``created`` and ``errors`` hold the outcome."""
+
+    def __init__(self, batch_size=None, workers=None, hasher=None):
+        self.batch_size = batch_size or getattr(settings, 'ONBOARDING_BATCH_SIZE', 1000)
+        self.workers = hash_workers() if workers is None else workers
+        self.hasher = hasher or (lambda passwords: hash_passwords(passwords, self.workers))
+        self.created = 0
+        self.errors = []
+        self.rows = 0
+        self.batch = []
+        # Usernames and licence numbers taken earlier in this file
+        self.usernames = set()
+        self.licenses = set()
+
+    def add(self, row):
+        self.rows += 1
+        if not isinstance(row, dict):
+            self.errors.append(error(self.rows, row, {'non_field_errors': ["Expected an object."]}))
+            return
+        serializer = OnboardingRowSerializer(data=row)
+        if not serializer.is_valid():
+            self.errors.append(error(self.rows, row, serializer.errors))
+            return
+        self.batch.append((self.rows, serializer.validated_data))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def finish(self):
+        self.flush()
+        return self.created, self.errors
+
+    def check_unique(self, batch):
+        usernames = {User.normalize_username(data['username']) for _, data in batch}
+        licenses = {data['license_number'] for _, data in batch if data['role'] == User.ROLE_DOCTOR}
+        taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        taken_licenses = set(Doctor.objects.filter(license_number__in=licenses).values_list('license_number', flat=True))
+        accepted = []
+        for number, data in batch:
+            username = User.normalize_username(data['username'])
+            if username in taken_usernames or username in self.usernames:
+                self.errors.append(error(number, data, {'username': ["Username already exists."]}))
+                continue
+            if data['role'] == User.ROLE_DOCTOR:
+                if data['license_number'] in taken_licenses or data['license_number'] in self.licenses:
+                    self.errors.append(error(number, data, {'license_number': ["License number already exists."]}))
+                    continue
+                self.licenses.add(data['license_number'])
+            self.usernames.add(username)
+            accepted.append((number, data))
+        return accepted
+
+    def flush(self):
+        batch, self.batch = self.check_unique(self.batch), []
+        if not batch:
+            return
+        hashes = self.hasher([data['password'] for _, data in batch])
+        users = [
+            User(
+                username=User.normalize_username(data['username']),
+                email=User.objects.normalize_email(data['email']),
+                first_name=data['first_name'],
+                last_name=data['last_name'],
+                role=data['role'],
+                password=password,
+            )
+            for (_, data), password in zip(batch, hashes)
+        ]
+        try:
+            with transaction.atomic():
+                # Primary keys come back from the insert (PostgreSQL, SQLite 3.35+)
+                users = User.objects.bulk_create(users)
+                Patient.objects.bulk_create([
+                    Patient(user=user, age=data.get('age'))
+                    for user, (_, data) in zip(users, batch) if data['role'] == User.ROLE_PATIENT
+                ])
+                doctors = Doctor.objects.bulk_create([
+                    Doctor(
+                        user=user, specialty=data['specialty'], license_number=data['license_number'],
+                        years_experience=data.get('years_experience'),
+                    )
+                    for user, (_, data) in zip(users, batch) if data['role'] == User.ROLE_DOCTOR
+                ])
+                if doctors:
+                    # bulk_create sends no post_save, so invalidate_doctor_directory does not run
+                    transaction.on_commit(lambda: bump_generation('doctors'))
+        except IntegrityError as exc:
+            # Lost a race with another registration; the whole batch is rolled back
+            for number, data in batch:
+                self.errors.append(error(number, data, {'non_field_errors': [f"Not created: {exc}"]}))
+            return
+        self.created += len(users)
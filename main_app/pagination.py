@@ -0,0 +1,143 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor keyset pagination.
+
+    Rows are ordered by ``ordering`` (newest first by default) and each page
+    continues strictly after the last row of the previous one, so the database
+    seeks straight into the index instead of skipping OFFSET rows, and rows
+    inserted while a client is paging never shift or duplicate later pages.
+
+    Views can override the key with a ``keyset_ordering`` attribute; the last
+    field must be unique (normally the primary key) to break ties.
+    """
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """Return the unevaluated queryset for one page (plus one look-ahead row)."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        self.fields = [self.get_field(queryset.model, f) for f in self.ordering]
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        page_size = self.page_size or 25
+        if self.page_size_query_param:
+            try:
+                requested = int(request.query_params[self.page_size_query_param])
+            except (KeyError, ValueError):
+                return page_size
+            if requested > 0:
+                return min(requested, self.max_page_size)
+        return page_size
+
+    def get_field(self, model, ordering_field):
+        name = ordering_field.lstrip('-')
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+    def after(self, position):
+        # (a, b) after (x, y) in descending order is: a < x OR (a = x AND b < y)
+        condition = Q()
+        equal = Q()
+        for ordering_field, field, value in zip(self.ordering, self.fields, position):
+            lookup = 'lt' if ordering_field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    def encode_position(self, instance):
+        position = [field.value_to_string(instance) for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def encode_cursor(self, instance):
+        token = self.encode_position(instance)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii'))
+            if not isinstance(position, list) or len(position) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class SyncPagination(KeysetPagination):
+    """
+    Oldest-first keyset pages for incremental sync.
+
+    Clients keep the returned ``cursor`` and send it back as ``?after=`` to
+    receive only rows created since; the cursor is echoed unchanged when
+    nothing new has arrived, so it is never lost.
+    """
+    ordering = ('created_at', 'id')
+    cursor_query_param = 'after'
+    page_size = 100
+
+    def get_cursor(self):
+        if self.page:
+            return self.encode_position(self.page[-1])
+        return self.request.query_params.get(self.cursor_query_param) or None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('cursor', self.get_cursor()),
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
@@ -0,0 +1,124 @@
+"""
+Password hashing and verification on a dedicated, bounded thread pool.
+
+PBKDF2 runs in C with the GIL released, so PASSWORD_HASHING_WORKERS threads
+cap how many cores a burst of logins or registrations can occupy while
+request threads (or the event loop) stay free for everything else.  At most
+PASSWORD_HASHING_QUEUE_SIZE calls may wait for a worker; past that ``submit``
+raises HashingBusy at once and the views answer 503 with Retry-After rather
+than letting the backlog grow.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """Every worker is busy and the wait queue is full."""
+
+
+class BoundedExecutor:
+    def __init__(self, workers, queue_size):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        # Running plus waiting calls
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+
+        def call():
+            try:
+                return fn(*args)
+            finally:
+                # Before the result is published, so a caller woken by it finds the slot free
+                self.slots.release()
+
+        try:
+            return self.executor.submit(call)
+        except BaseException:
+            self.slots.release()
+            raise
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BoundedExecutor(
+                getattr(settings, 'PASSWORD_HASHING_WORKERS', 2),
+                getattr(settings, 'PASSWORD_HASHING_QUEUE_SIZE', 32),
+            )
+        return _pool
+
+
+def retry_after():
+    return str(getattr(settings, 'PASSWORD_HASHING_RETRY_AFTER', 1))
+
+
+def run(fn, *args):
+    return get_pool().submit(fn, *args).result()
+
+
+async def arun(fn, *args):
+    return await asyncio.wrap_future(get_pool().submit(fn, *args))
+
+
+def find_user(username):
+    User = get_user_model()
+    try:
+        return User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        return None
+
+
+def needs_rehash(user):
+    # Hashed with an older algorithm or iteration count (Django's ModelBackend upgrades these on login)
+    try:
+        return identify_hasher(user.password).must_update(user.password)
+    except ValueError:
+        return False
+
+
+def authenticate(username, password):
+    """
+    Same outcome as ``django.contrib.auth.authenticate`` with the default
+    ModelBackend, with the hashing done on the pool.  Raises HashingBusy.
+    """
+    if username is None or password is None:
+        return None
+    user = find_user(username)
+    if user is None:
+        # Hash anyway, so unknown usernames take as long as wrong passwords
+        run(make_password, password)
+        return None
+    if not run(check_password, password, user.password) or not user.is_active:
+        return None
+    if needs_rehash(user):
+        user.password = run(make_password, password)
+        user.save(update_fields=['password'])
+    return user
+
+
+async def aauthenticate(username, password):
+    if username is None or password is None:
+        return None
+    user = await sync_to_async(find_user)(username)
+    if user is None:
+        await arun(make_password, password)
+        return None
+    if not await arun(check_password, password, user.password) or not user.is_active:
+        return None
+    if needs_rehash(user):
+        user.password = await arun(make_password, password)
+        await user.asave(update_fields=['password'])
+    return user
+
@@ -0,0 +1,162 @@
+"""
+Revocation of refresh tokens.
+
+Revoked JTIs are stored in RevokedToken.  Each process keeps them in memory
+so that refreshing a token does not cost an extra query:
+
+* a Bloom filter over every unexpired revoked JTI, so a miss means "not
+  revoked" for certain;
+* an exact set of the most recent revocations, which answers the likeliest
+  hits (a token replayed soon after logout) without a query;
+* a Bloom hit outside that set may be a false positive, so only then is
+  the database asked.
+
+Every REVOCATION_SYNC_INTERVAL seconds a check first pulls the rows revoked
+since the previous sync, so a token revoked through another worker stops
+working here within that interval.  Every REVOCATION_PRUNE_INTERVAL seconds
+expired rows are deleted and the filter is rebuilt, sized to what is left.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# Rows committed late by a slow transaction still land inside this window
+SYNC_OVERLAP = timedelta(seconds=60)
+MIN_CAPACITY = 10_000
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class RevocationList:
+    def __init__(self, error_rate=0.001, recent_size=10_000, sync_interval=5, prune_interval=3600):
+        self.error_rate = error_rate
+        self.recent_size = recent_size
+        self.sync_interval = sync_interval
+        self.prune_interval = prune_interval
+        self.database_checks = 0
+        self._bloom = None
+        self._recent = OrderedDict()
+        self._synced_at = None
+        self._next_sync = self._next_prune = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at})
+        with self._lock:
+            if self._bloom is not None:
+                self._remember(jti)
+
+    def is_revoked(self, jti):
+        self._refresh()
+        with self._lock:
+            if jti in self._recent:
+                return True
+            if jti not in self._bloom:
+                return False
+            self.database_checks += 1
+        return RevokedToken.objects.filter(jti=jti, expires_at__gt=timezone.now()).exists()
+
+    def reset(self):
+        """Forget the in-memory state; the next check rebuilds it from the database."""
+        with self._lock:
+            self._bloom = None
+            self._recent.clear()
+            self._synced_at = None
+            self._next_sync = self._next_prune = 0.0
+
+    def _remember(self, jti):
+        self._bloom.add(jti)
+        self._recent[jti] = None
+        self._recent.move_to_end(jti)
+        while len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+        if self._bloom.count > self._bloom.capacity:
+            # Past capacity the false-positive rate climbs; resize at the next check
+            self._next_prune = 0.0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._bloom is not None and now < self._next_sync and now < self._next_prune:
+            return
+        if not self._refresh_lock.acquire(blocking=self._bloom is None):
+            # Another thread is already syncing; the current state is at most one interval old
+            return
+        try:
+            if self._bloom is None or now >= self._next_prune:
+                self._rebuild()
+            elif now >= self._next_sync:
+                self._sync()
+        finally:
+            self._refresh_lock.release()
+
+    def _sync(self):
+        started = timezone.now()
+        rows = list(RevokedToken.objects.filter(revoked_at__gte=self._synced_at - SYNC_OVERLAP).values_list('jti', flat=True))
+        with self._lock:
+            for jti in rows:
+                if jti not in self._recent:
+                    self._remember(jti)
+            self._synced_at = started
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def _rebuild(self):
+        started = timezone.now()
+        RevokedToken.objects.filter(expires_at__lte=started).delete()
+        live = RevokedToken.objects.filter(expires_at__gt=started)
+        bloom = BloomFilter(max(live.count() * 2, MIN_CAPACITY), self.error_rate)
+        recent = OrderedDict()
+        for jti in live.order_by('revoked_at').values_list('jti', flat=True).iterator():
+            bloom.add(jti)
+            recent[jti] = None
+            if len(recent) > self.recent_size:
+                recent.popitem(last=False)
+        with self._lock:
+            # A revocation saved while this ran is picked up by the next sync's overlap window
+            self._bloom, self._recent, self._synced_at = bloom, recent, started
+            self._next_sync = time.monotonic() + self.sync_interval
+            self._next_prune = time.monotonic() + self.prune_interval
+
+
+revocations = RevocationList(
+    error_rate=getattr(settings, 'REVOCATION_ERROR_RATE', 0.001),
+    recent_size=getattr(settings, 'REVOCATION_RECENT_SIZE', 10_000),
+    sync_interval=getattr(settings, 'REVOCATION_SYNC_INTERVAL', 5),
+    prune_interval=getattr(settings, 'REVOCATION_PRUNE_INTERVAL', 3600),
+)
+
+
+def revoke_token(token):
+    """Revoke a validated token (or its payload) until its own expiry."""
+    revocations.revoke(token[api_settings.JTI_CLAIM], datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc))
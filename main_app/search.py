@@ -0,0 +1,97 @@
+"""
+Full-text search over issues and patient requests.
+
+PostgreSQL keeps a generated ``search_vector`` tsvector column with a GIN
+index on each table; SQLite keeps an external-content FTS5 table in sync with
+triggers.  Both are created by migration 0012, outside the Django models, so
+the rest of the code never sees the columns.  SQLite drops triggers whenever a
+migration rebuilds a table, so they are re-checked after every migrate (see
+``ensure_sqlite_triggers``).  Other backends fall back to ``icontains`` over
+the same fields.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+
+# table -> weighted columns, most important first (tsvector weights A, B, C).
+# Migration 0012 keeps its own copy: changing these needs a new migration.
+SEARCH_COLUMNS = {
+    'main_app_issue': ['title', 'description'],
+    'main_app_patientrequest': ['title', 'summary_comment', 'detailed_comment'],
+}
+# PostgreSQL's default ts_rank weights for A, B, C, D, reused for FTS5's bm25()
+WEIGHT_VALUES = [1.0, 0.4, 0.2, 0.1]
+
+
+def fts_table(table):
+    return f'{table}_fts'
+
+
+def sqlite_trigger_sql(table):
+    fts = fts_table(table)
+    columns = SEARCH_COLUMNS[table]
+    cols = ', '.join(columns)
+    new_cols = ', '.join(f'new.{c}' for c in columns)
+    old_cols = ', '.join(f'old.{c}' for c in columns)
+    delete_row = f"INSERT INTO \"{fts}\"(\"{fts}\", rowid, {cols}) VALUES ('delete', old.id, {old_cols});"
+    insert_row = f'INSERT INTO "{fts}"(rowid, {cols}) VALUES (new.id, {new_cols});'
+    return {
+        f'{fts}_ai': f'CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{table}" BEGIN {insert_row} END',
+        f'{fts}_ad': f'CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{table}" BEGIN {delete_row} END',
+        f'{fts}_au': f'CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE ON "{table}" BEGIN {delete_row} {insert_row} END',
+    }
+
+
+def ensure_sqlite_triggers(connection):
+    """Recreate FTS5 sync triggers lost to a table rebuild, then resync the index."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+        for table in SEARCH_COLUMNS:
+            fts = fts_table(table)
+            triggers = sqlite_trigger_sql(table)
+            if fts not in existing or set(triggers) <= existing:
+                continue
+            for sql in triggers.values():
+                cursor.execute(sql)
+            cursor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+
+
+def fts5_query(text):
+    # Quote every word so user input can never be parsed as FTS5 syntax
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search(queryset, text):
+    """Filter ``queryset`` to rows matching ``text`` and order them best match first."""
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        matches = RawSQL(f'"{table}"."search_vector" @@ {tsquery}', [text], output_field=BooleanField())
+        rank = RawSQL(f'ts_rank_cd("{table}"."search_vector", {tsquery})', [text], output_field=FloatField())
+    elif vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return queryset.none()
+        fts = fts_table(table)
+        weights = ', '.join(str(w) for w in WEIGHT_VALUES[:len(SEARCH_COLUMNS[table])])
+        matches = Q(pk__in=RawSQL(f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s', [query]))
+        # bm25() is lower for better matches; negate it so both backends sort descending
+        rank = RawSQL(
+            f'(SELECT -bm25("{fts}", {weights}) FROM "{fts}" WHERE "{fts}" MATCH %s AND rowid = "{table}"."id")',
+            [query], output_field=FloatField()
+        )
+    else:
+        matches = Q()
+        for column in SEARCH_COLUMNS[table]:
+            matches |= Q(**{f'{column}__icontains': text})
+        rank = Value(0.0, output_field=FloatField())
+
+    return queryset.filter(matches).annotate(rank=rank).order_by('-rank', '-created_at', '-id')
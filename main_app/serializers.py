@@ -1,9 +1,29 @@
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Prefetch
 
 
-from .models import User, Patient, Doctor, Issue, Document, Comment, PatientRequest
+import os
+
+from .models import User, Patient, Doctor, Issue, Document, Comment, PatientRequest, UploadSession
+from .models import DOCUMENT_EXTENSIONS, MAX_DOCUMENT_SIZE_MB
+from .derivatives import derivative_urls
+from .fieldsets import SparseFieldsMixin
+from . import passwords
+from .revocation import revocations, revoke_token
+
+def create_profile(user, role):
+    # The one place a new user's Patient or Doctor row is created
+    if role == User.ROLE_PATIENT:
+        Patient.objects.create(user=user)
+    elif role == User.ROLE_DOCTOR:
+        Doctor.objects.create(user=user)
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -18,16 +38,17 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         role = validated_data.pop('role')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
+        # Hashed on the password pool (see main_app.passwords); async views hash before saving
+        password = validated_data.get('password_hash') or passwords.run(make_password, validated_data['password'])
+        user = User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data.get('email')),
+            password=password,
             role=role
         )
-        if role == 'PATIENT':
-            Patient.objects.create(user=user, age=0)  
-        elif role == 'DOCTOR':
-            Doctor.objects.create(user=user, specialty='', license_number='', years_experience=0)  
+        with transaction.atomic():
+            user.save()
+            create_profile(user, role)
         return user
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -42,12 +63,42 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         data['role'] = self.user.role
         return data
 
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """TokenRefreshSerializer that refuses revoked refresh tokens (see main_app.revocation)."""
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if revocations.is_revoked(refresh[jwt_settings.JTI_CLAIM]):
+            raise InvalidToken("Token has been revoked.")
+        data = super().validate(attrs)
+        if jwt_settings.ROTATE_REFRESH_TOKENS and jwt_settings.BLACKLIST_AFTER_ROTATION:
+            # The blacklist app is not installed; revoke the rotated-out token ourselves
+            revoke_token(refresh)
+        return data
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as err:
+            raise serializers.ValidationError(str(err))
+
+    def save(self):
+        revoke_token(self.validated_data['refresh'])
+
 class UserSerializer(serializers.ModelSerializer):
+    profile_picture_derivatives = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'profile_picture']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'profile_picture', 'profile_picture_derivatives']
         extra_kwargs = {'password': {'write_only': True}}
 
+    def get_profile_picture_derivatives(self, obj):
+        return derivative_urls(obj.profile_picture, self.context.get('request'))
+
 class PatientSerializer(serializers.ModelSerializer):
     user = UserSerializer()
 
@@ -61,6 +112,7 @@ class PatientSerializer(serializers.ModelSerializer):
         return Patient.objects.create(user=user, **validated_data)
 
 class DoctorSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='pk')  # Doctor's primary key is its user
     user = UserSerializer()
 
     class Meta:
@@ -73,16 +125,58 @@ class DoctorSerializer(serializers.ModelSerializer):
         return Doctor.objects.create(user=user, **validated_data)
 
 class DocumentSerializer(serializers.ModelSerializer):
+    derivatives = serializers.SerializerMethodField()
+
     class Meta:
         model = Document
-        fields = ['id', 'file', 'uploaded_at']
+        fields = ['id', 'file', 'derivatives', 'uploaded_at']
         read_only_fields = ['uploaded_at']
 
+    def get_derivatives(self, obj):
+        return derivative_urls(obj.file, self.context.get('request'))
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    checksum = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'issue', 'filename', 'size', 'offset', 'checksum', 'expires_at']
+        read_only_fields = ['offset', 'expires_at']
+
+    def get_checksum(self, obj):
+        return f"{obj.checksum:08x}"
+
+    def validate_filename(self, value):
+        # Reject bad extensions before a single byte is uploaded
+        extension = os.path.splitext(value)[1][1:].lower()
+        if extension not in DOCUMENT_EXTENSIONS:
+            raise serializers.ValidationError(f"File extension must be one of: {', '.join(DOCUMENT_EXTENSIONS)}")
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        if not 0 < value <= MAX_DOCUMENT_SIZE_MB * 1024 * 1024:
+            raise serializers.ValidationError(f"File size must be under {MAX_DOCUMENT_SIZE_MB}MB")
+        return value
+
+    def validate_issue(self, value):
+        user = self.context['request'].user
+        if value.patient.user_id != user.pk and value.doctor_id != user.pk:
+            raise serializers.ValidationError("You can only upload documents to your own issues.")
+        return value
+
 class CommentCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ['id', 'content']
 
+class CommentBulkItemSerializer(serializers.ModelSerializer):
+    # A plain id: issues are looked up once for the whole batch, not per item
+    issue = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = Comment
+        fields = ['issue', 'content']
+
 class CommentListSerializer(serializers.ModelSerializer):
     author = serializers.StringRelatedField(read_only=True)
 
@@ -91,24 +185,37 @@ class CommentListSerializer(serializers.ModelSerializer):
         fields = ['id', 'author', 'content', 'created_at', 'updated_at']
         read_only_fields = ['author', 'created_at', 'updated_at']
 
-class IssueSerializer(serializers.ModelSerializer):
+class IssueSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     documents = DocumentSerializer(many=True, read_only=True)
     comments = CommentListSerializer(many=True, read_only=True)
     patient = serializers.StringRelatedField()
     doctor = serializers.StringRelatedField()
 
+    # patient/doctor and every comment author render through __str__, which
+    # reads the related user
+    field_requirements = {
+        'patient': {'only': ['patient'], 'select_related': ['patient__user']},
+        'doctor': {'only': ['doctor'], 'select_related': ['doctor__user']},
+        'documents': {'prefetch_related': ['documents']},
+        'comments': {'prefetch_related': [Prefetch('comments', queryset=Comment.objects.select_related('author'))]},
+    }
+
     class Meta:
         model = Issue
         fields = [
-            'id', 'patient', 'doctor', 'title', 'description',
+            'id', 'patient', 'doctor', 'specialty', 'title', 'description',
             'status', 'created_at', 'updated_at', 'documents', 'comments'
         ]
         read_only_fields = ['patient', 'created_at', 'updated_at']
 
 
-class PatientRequestSerializer(serializers.ModelSerializer):
+class PatientRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     patient = PatientSerializer(read_only=True)
     issue = serializers.PrimaryKeyRelatedField(queryset=Issue.objects.all(), required=False)
+
+    field_requirements = {
+        'patient': {'only': ['patient'], 'select_related': ['patient__user']},
+    }
     
     class Meta:
         model = PatientRequest
@@ -135,3 +242,36 @@ class PatientRequestSerializer(serializers.ModelSerializer):
     #     return PatientRequest.objects.create(**validated_data)  # Create and return the PatientRequest object
 
 
+class OnboardingRowSerializer(serializers.Serializer):
+    """One account in a bulk onboarding file (see main_app.onboarding); uniqueness is checked per batch."""
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    password = serializers.CharField(write_only=True)
+    role = serializers.CharField()
+    first_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=150, required=False, allow_blank=True, default='')
+    age = serializers.IntegerField(min_value=1, max_value=120, required=False, allow_null=True)
+    specialty = serializers.ChoiceField(choices=Doctor.SPECIALTY_CHOICES, required=False)
+    license_number = serializers.CharField(max_length=50, required=False)
+    years_experience = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+
+    def validate_role(self, value):
+        # Accepted in either case, stored as the model's choice value
+        role = value.lower()
+        if role not in (User.ROLE_PATIENT, User.ROLE_DOCTOR):
+            raise serializers.ValidationError("Role must be patient or doctor.")
+        return role
+
+    def validate(self, attrs):
+        if attrs['role'] == User.ROLE_DOCTOR:
+            missing = {name: ["Required for doctors."] for name in ('specialty', 'license_number') if not attrs.get(name)}
+            if missing:
+                raise serializers.ValidationError(missing)
+        return attrs
+
+class PatientRequestBulkItemSerializer(serializers.ModelSerializer):
+    issue = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+    class Meta:
+        model = PatientRequest
+        fields = ['title', 'detailed_comment', 'summary_comment', 'document', 'issue']
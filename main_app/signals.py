@@ -0,0 +1,129 @@
+from django.db import connections, transaction
+from django.db.models import FileField
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .cache import bump_generation
+from .counters import DOCTOR, counter_keys, record_change
+from .derivatives import schedule_derivatives
+from .events import issue_status_changed, patient_request_status_changed
+from .search import ensure_sqlite_triggers
+from .models import DashboardCounter, Doctor, Document, Issue, PatientRequest, User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_doctor_directory(sender, instance, **kwargs):
+    # After commit: a read racing an earlier bump would cache the old rows
+    # under the new generation
+    transaction.on_commit(lambda: bump_generation('doctors'))
+
+
+@receiver(post_delete, sender=Document)
+def release_document_file(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.storage.delete(instance.file.name)
+
+
+@receiver(post_delete, sender=User)
+def release_profile_picture(sender, instance, **kwargs):
+    if instance.profile_picture:
+        instance.profile_picture.storage.delete(instance.profile_picture.name)
+
+
+def stored_file_names(instance):
+    # Read from __dict__ so a deferred file column is not fetched
+    return {
+        field.attname: getattr(instance.__dict__.get(field.attname), 'name', instance.__dict__.get(field.attname))
+        for field in instance._meta.concrete_fields if isinstance(field, FileField)
+    }
+
+
+@receiver(post_init, sender=Document)
+@receiver(post_init, sender=User)
+def remember_file_names(sender, instance, **kwargs):
+    instance._stored_file_names = stored_file_names(instance)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_save, sender=User)
+def release_replaced_files(sender, instance, created, **kwargs):
+    # Replacing a file drops the reference to the previous one, just as a delete would
+    for attname, previous in instance._stored_file_names.items():
+        current = getattr(instance, attname)
+        if previous and previous != current.name:
+            current.storage.delete(previous)
+    instance._stored_file_names = {
+        attname: getattr(instance, attname).name for attname in instance._stored_file_names
+    }
+
+
+@receiver(post_save, sender=Document)
+def generate_document_derivatives(sender, instance, **kwargs):
+    transaction.on_commit(lambda: schedule_derivatives(instance.file))
+
+
+@receiver(post_save, sender=User)
+def generate_profile_picture_derivatives(sender, instance, **kwargs):
+    if instance.profile_picture:
+        transaction.on_commit(lambda: schedule_derivatives(instance.profile_picture))
+
+
+@receiver(post_init, sender=Issue)
+@receiver(post_init, sender=PatientRequest)
+def remember_saved_state(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred status field is not fetched
+    instance._loaded_status = instance.__dict__.get('status')
+    instance._counted_keys = counter_keys(instance)
+
+
+@receiver(post_save, sender=Issue)
+def publish_issue_status(sender, instance, created, **kwargs):
+    if not created and instance._loaded_status != instance.status:
+        issue_status_changed(instance, instance._loaded_status)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=PatientRequest)
+def publish_patient_request_status(sender, instance, created, **kwargs):
+    if not created and instance._loaded_status != instance.status:
+        patient_request_status_changed(instance, instance._loaded_status)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=PatientRequest)
+def count_saved_row(sender, instance, created, **kwargs):
+    keys = counter_keys(instance)
+    if created:
+        record_change(None, keys)
+    elif instance._counted_keys is not None and keys != instance._counted_keys:
+        record_change(instance._counted_keys, keys)
+    instance._counted_keys = keys
+
+
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=PatientRequest)
+def count_deleted_row(sender, instance, **kwargs):
+    record_change(instance._counted_keys, None)
+
+
+@receiver(post_delete, sender=Doctor)
+def drop_doctor_counters(sender, instance, **kwargs):
+    # Their issues were unassigned by an UPDATE that sends no signals
+    DashboardCounter.objects.filter(owner_type=DOCTOR, owner_id=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == 'main_app':
+        ensure_sqlite_triggers(connections[using])
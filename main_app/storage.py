@@ -0,0 +1,213 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F, FileField
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names every file after the SHA-256 of its content.
+
+    Files land in ``blobs/ab/cd/<digest><ext>`` so no directory grows past a
+    few thousand entries, and saving content that is already stored reuses the
+    existing blob instead of writing a suffixed copy.  Each save and delete
+    adjusts the blob's StoredBlob.refcount; unreferenced blobs are removed by
+    ``manage.py collect_blobs`` rather than inline, so a blob that is being
+    re-uploaded at the moment its last reference goes away is never lost.
+    """
+    blob_prefix = 'blobs'
+    fan_out = 2
+    read_block_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save()
+        return name
+
+    def blob_name(self, digest, extension):
+        levels = [digest[i * 2:i * 2 + 2] for i in range(self.fan_out)]
+        return '/'.join([self.blob_prefix, *levels, digest + extension])
+
+    def is_blob(self, name):
+        return name.startswith(self.blob_prefix + '/')
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        extension = os.path.splitext(name)[1].lower()
+        digest = hashlib.sha256()
+        staged = None
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it in place and move it, never copy it
+            source = content.temporary_file_path()
+            with open(source, 'rb') as fh:
+                for block in iter(lambda: fh.read(self.read_block_size), b''):
+                    digest.update(block)
+        else:
+            staging_dir = self.path(os.path.join(self.blob_prefix, 'tmp'))
+            os.makedirs(staging_dir, exist_ok=True)
+            fd, staged = tempfile.mkstemp(dir=staging_dir)
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    out.write(chunk)
+            source = staged
+
+        name = self.blob_name(digest.hexdigest(), extension)
+        full_path = self.path(name)
+        size = os.path.getsize(source)
+        with transaction.atomic():
+            # The row lock orders this against collect_garbage, which deletes
+            # the row and unlinks the file under the same lock
+            StoredBlob.objects.select_for_update().get_or_create(name=name, defaults={'size': size})
+            StoredBlob.objects.filter(name=name).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+            if os.path.exists(full_path):
+                if staged:
+                    os.remove(staged)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                file_move_safe(source, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def delete(self, name):
+        from .models import StoredBlob
+
+        if not self.is_blob(name):
+            return super().delete(name)
+        StoredBlob.objects.filter(name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now()
+        )
+
+
+def file_reference_fields():
+    """Yield (model, field name) for every column that stores a media path."""
+    from .models import PatientRequest
+
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage):
+                yield model, field.attname
+    # PatientRequest.document holds a media-relative path in a plain CharField
+    yield PatientRequest, 'document'
+
+
+# PatientRequest.document may only point at legacy request uploads or blobs
+PATIENT_DOCUMENT_PREFIXES = ('patient_requests/', ContentAddressedStorage.blob_prefix + '/')
+
+
+def is_patient_document_name(name):
+    """A normalised media-relative path under one of PATIENT_DOCUMENT_PREFIXES."""
+    return (
+        isinstance(name, str)
+        and posixpath.normpath(name) == name
+        and name.startswith(PATIENT_DOCUMENT_PREFIXES)
+    )
+
+
+def patient_owned_names(patient, names, exclude_request=None):
+    """
+    The subset of ``names`` that ``patient`` already references: documents on
+    their issues, their profile picture or their other patient requests.
+    """
+    from .models import Document, PatientRequest, User
+
+    names = set(names)
+    owned = set(Document.objects.filter(issue__patient=patient, file__in=names).values_list('file', flat=True))
+    owned.update(User.objects.filter(pk=patient.user_id, profile_picture__in=names).values_list('profile_picture', flat=True))
+    owned.update(
+        PatientRequest.objects.filter(patient=patient, document__in=names)
+        .exclude(pk=exclude_request).values_list('document', flat=True)
+    )
+    return owned
+
+
+def referenced_by_others(name, patient, exclude_request=None):
+    """Whether any row that does not belong to ``patient`` references ``name``."""
+    from .models import Document, PatientRequest, User
+
+    documents = Document.objects.filter(file=name)
+    pictures = User.objects.filter(profile_picture=name)
+    requests = PatientRequest.objects.filter(document=name).exclude(pk=exclude_request)
+    if patient is not None:
+        documents = documents.exclude(issue__patient=patient)
+        pictures = pictures.exclude(pk=patient.user_id)
+        requests = requests.exclude(patient=patient)
+    return documents.exists() or pictures.exists() or requests.exists()
+
+
+def count_references():
+    counts = Counter()
+    for model, attname in file_reference_fields():
+        names = (
+            model._default_manager.exclude(**{f'{attname}__isnull': True})
+            .exclude(**{attname: ''})
+            .values_list(attname, flat=True)
+        )
+        counts.update(names.iterator())
+    return counts
+
+
+def rebuild_refcounts(storage):
+    """Recompute every StoredBlob.refcount from the rows that reference it; returns the drift."""
+    from .models import StoredBlob
+
+    counts = count_references()
+    drift = {}
+    for blob in StoredBlob.objects.iterator():
+        actual = counts.pop(blob.name, 0)
+        if blob.refcount != actual:
+            drift[blob.name] = (blob.refcount, actual)
+            StoredBlob.objects.filter(name=blob.name).update(refcount=actual, updated_at=timezone.now())
+    for name, actual in counts.items():
+        if storage.is_blob(name) and storage.exists(name):
+            drift[name] = (0, actual)
+            StoredBlob.objects.create(name=name, size=storage.size(name), refcount=actual)
+    return drift
+
+
+def collect_garbage(storage, grace=timedelta(hours=1), dry_run=False):
+    """Delete blobs with no references (and stray files with no StoredBlob row) older than ``grace``."""
+    from .models import StoredBlob
+
+    cutoff = timezone.now() - grace
+    removed = []
+    for name in StoredBlob.objects.filter(refcount=0, updated_at__lt=cutoff).values_list('name', flat=True).iterator():
+        if dry_run:
+            removed.append(name)
+            continue
+        with transaction.atomic():
+            # Re-checked under the row lock: a concurrent _save of the same
+            # content either referenced it first (it stays) or waits for this
+            # to finish and finds neither row nor file
+            blob = StoredBlob.objects.select_for_update().filter(name=name, refcount=0).first()
+            if blob is None:
+                continue
+            blob.delete()
+            FileSystemStorage.delete(storage, name)
+        removed.append(name)
+
+    known = set(StoredBlob.objects.values_list('name', flat=True))
+    root = storage.path(storage.blob_prefix)
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            name = os.path.relpath(full_path, storage.location).replace(os.sep, '/')
+            modified = datetime.fromtimestamp(os.path.getmtime(full_path), tz=dt_timezone.utc)
+            if name in known or modified >= cutoff:
+                continue
+            removed.append(name)
+            if not dry_run:
+                os.remove(full_path)
+    return removed
@@ -1,9 +1,45 @@
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 from django.contrib.auth import get_user_model
-from .models import Patient, Doctor, Issue, Comment, Document
+from .models import Patient, Doctor, Issue, Comment, Document, PatientRequest, UploadSession, StoredBlob, DashboardCounter, RevokedToken
 from django.urls import reverse
+from django.db import connection
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from . import views
+from .authentication import user_cache
+from .cache import get_generation
+from .middleware import RequestTimings, ServerTimingMiddleware, current_timings
+from .serializers import CustomTokenObtainPairSerializer, DocumentSerializer, IssueSerializer, UserSerializer
+from .derivatives import DERIVATIVE_SIZES, derivative_name, derivative_storage
+from .assignment import assign_pending_issues, claim_next_issue, claimable_issues, open_issue_count
+from .events import broker, make_event
+from .pagination import KeysetPagination
+from .counters import actual_counts
+from . import passwords
+from .revocation import BloomFilter, RevocationList, revocations, revoke_token
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, modify_settings, override_settings, skipUnlessDBFeature
+from asgiref.sync import async_to_sync
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import warnings
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from datetime import timedelta
+import contextvars
+import csv
+import io
+import json
+import os
+import re
 import tempfile
+import zlib
+from unittest import mock
 
 User = get_user_model()
 
@@ -150,3 +186,1665 @@ class YaqeenMedAPITestCase(APITestCase):
         response = self.client.post(reverse('register'), data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('age', response.data)
+
+
+class QueryBudgetTestCase(APITestCase):
+    """Asserts that a view stays within the ``query_budget`` it declares."""
+
+    def assertWithinQueryBudget(self, view_class, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(
+            len(ctx.captured_queries), view_class.query_budget,
+            f"{view_class.__name__} ran {len(ctx.captured_queries)} queries, budget is {view_class.query_budget}"
+        )
+        return response
+
+
+class IssueQueryBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(username="budget_doctor", password="password123", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty='CARDIOLOGY', license_number='B-1')
+        self.client.force_authenticate(user=self.doctor_user)
+
+    def create_issues(self, count):
+        start = Issue.objects.count()
+        for i in range(start, start + count):
+            patient_user = User.objects.create_user(username=f"budget_patient_{i}", password="password123", role="PATIENT")
+            patient = Patient.objects.create(user=patient_user, age=30)
+            issue = Issue.objects.create(patient=patient, doctor=self.doctor, title=f"Issue {i}", description="...")
+            Document.objects.create(issue=issue, file=f"issue_documents/scan_{i}.pdf")
+            Comment.objects.create(issue=issue, author=patient_user, content="first")
+            Comment.objects.create(issue=issue, author=self.doctor_user, content="reply")
+
+    def test_issue_list_query_count_is_constant(self):
+        self.create_issues(2)
+        self.assertWithinQueryBudget(views.IssueList, reverse('issue-list'))
+        self.create_issues(10)
+        response = self.assertWithinQueryBudget(views.IssueList, reverse('issue-list'))
+        self.assertEqual(len(response.data['results']), 12)
+
+    def test_issue_detail_within_budget(self):
+        self.create_issues(1)
+        issue = Issue.objects.get()
+        response = self.assertWithinQueryBudget(views.IssueDetail, reverse('issue-detail', args=[issue.id]))
+        self.assertEqual(len(response.data['comments']), 2)
+        self.assertEqual(len(response.data['documents']), 1)
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.patient_user = User.objects.create_user(username="paging_patient", password="password123", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.patient_user, age=40)
+        self.client.force_authenticate(user=self.patient_user)
+
+    def fetch_all(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_pages_walk_every_row_once_in_order(self):
+        issues = [Issue.objects.create(patient=self.patient, title=f"Issue {i}", description="...") for i in range(7)]
+        # Force ties on created_at so the id tiebreaker is exercised
+        Issue.objects.filter(id__in=[i.id for i in issues[2:5]]).update(created_at=issues[2].created_at)
+        ids = self.fetch_all(reverse('issue-list') + '?page_size=3')
+        expected = list(Issue.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_inserts_between_pages_do_not_shift_results(self):
+        for i in range(4):
+            PatientRequest.objects.create(patient=self.patient, title=f"Request {i}", detailed_comment="...", summary_comment="...")
+        first = self.client.get(reverse('patient-request-create') + '?page_size=2')
+        PatientRequest.objects.create(patient=self.patient, title="Late", detailed_comment="...", summary_comment="...")
+        second = self.client.get(first.data['next'])
+        seen = [row['id'] for row in first.data['results'] + second.data['results']]
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(second.data['results']), 2)
+        self.assertIsNone(second.data['next'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('issue-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username="jwt_patient", password="password123", role="PATIENT")
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def queries_for_home(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_repeat_requests_skip_user_lookup(self):
+        self.assertEqual(self.queries_for_home(), 1)
+        self.assertEqual(self.queries_for_home(), 0)
+
+    def test_user_save_invalidates_cache(self):
+        self.queries_for_home()
+        self.user.first_name = "Changed"
+        self.user.save()
+        self.assertEqual(self.queries_for_home(), 1)
+
+    def test_role_claim_mismatch_reloads_user(self):
+        self.queries_for_home()
+        # Simulate an update made by another worker that this process never saw
+        User.objects.filter(pk=self.user.pk).update(role="DOCTOR")
+        self.assertEqual(self.queries_for_home(), 0)
+        token = CustomTokenObtainPairSerializer.get_token(User.objects.get(pk=self.user.pk)).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.queries_for_home(), 1)
+
+    def test_inactive_user_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('issue-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DoctorDirectoryCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient_user = User.objects.create_user(username="cache_patient", password="password123", role="PATIENT")
+        self.doctor_user = User.objects.create_user(username="cache_doctor", password="password123", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty='RADIOLOGY', license_number='C-1')
+        other_user = User.objects.create_user(username="cache_doctor_2", password="password123", role="DOCTOR")
+        Doctor.objects.create(user=other_user, specialty='PATHOLOGY', license_number='C-2')
+        self.client.force_authenticate(user=self.patient_user)
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(reverse('doctor-list'))
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(reverse('doctor-list'))
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(second.data, first.data)
+
+    def test_doctor_change_bumps_generation(self):
+        self.client.get(reverse('doctor-detail', args=[self.doctor.pk]))
+        self.doctor.years_experience = 12
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.save()
+        response = self.client.get(reverse('doctor-detail', args=[self.doctor.pk]))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['years_experience'], 12)
+
+    def test_generation_bumps_on_commit(self):
+        before = get_generation('doctors')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.doctor.save()
+            # Until the transaction commits, readers still see the old rows
+            self.assertEqual(get_generation('doctors'), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_generation('doctors'), before)
+
+    def test_query_params_and_role_scope_are_part_of_the_key(self):
+        self.client.get(reverse('doctor-list'))
+        self.assertEqual(self.client.get(reverse('doctor-list') + '?page_size=1')['X-Cache'], 'MISS')
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.get(reverse('doctor-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_stats_count_hits_and_misses(self):
+        self.client.get(reverse('doctor-list'))
+        self.client.get(reverse('doctor-list'))
+        admin = User.objects.create_user(username="cache_admin", password="password123", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.data['DoctorList'], {'hits': 1, 'misses': 1})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), UPLOAD_SESSION_ROOT=tempfile.mkdtemp())
+class ResumableUploadTests(APITestCase):
+
+    def setUp(self):
+        self.patient_user = User.objects.create_user(username="upload_patient", password="password123", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.patient_user, age=30)
+        self.issue = Issue.objects.create(patient=self.patient, title="Scan", description="MRI")
+        self.client.force_authenticate(user=self.patient_user)
+        self.payload = b"%PDF-1.4 " + bytes(range(256)) * 40
+
+    def start(self, **overrides):
+        data = {'issue': self.issue.id, 'filename': 'scan.pdf', 'size': len(self.payload)}
+        data.update(overrides)
+        return self.client.post(reverse('upload-session-create'), data)
+
+    def put_chunk(self, session_id, offset, chunk):
+        return self.client.generic(
+            'PUT', reverse('upload-session-detail', args=[session_id]), chunk,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload_materializes_document(self):
+        session_id = self.start().data['id']
+        half = len(self.payload) // 2
+        self.assertEqual(self.put_chunk(session_id, 0, self.payload[:half]).data['offset'], half)
+        # A retried chunk at a stale offset is refused with the offset to resume from
+        conflict = self.put_chunk(session_id, 0, self.payload[:half])
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(conflict.data['offset'], half)
+        self.put_chunk(session_id, half, self.payload[half:])
+
+        checksum = f"{zlib.crc32(self.payload):08x}"
+        response = self.client.post(reverse('upload-session-complete', args=[session_id]), {'checksum': checksum})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        document = Document.objects.get(issue=self.issue)
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.payload)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_concurrent_chunk_for_the_same_offset_loses(self):
+        session_id = self.start().data['id']
+        real_crc32 = zlib.crc32
+
+        def other_put_commits_first(block, checksum):
+            UploadSession.objects.filter(pk=session_id).update(offset=5)
+            return real_crc32(block, checksum)
+
+        with mock.patch('main_app.views.zlib.crc32', side_effect=other_put_commits_first):
+            response = self.put_chunk(session_id, 0, self.payload[:10])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 5)
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertFalse(os.path.exists(session.chunk_path(0)))
+        self.assertFalse([name for name in os.listdir(session.upload_root) if name.endswith('.staged')])
+
+    def test_checksum_mismatch_and_incomplete_upload_are_rejected(self):
+        session_id = self.start().data['id']
+        self.put_chunk(session_id, 0, self.payload[:10])
+        incomplete = self.client.post(reverse('upload-session-complete', args=[session_id]))
+        self.assertEqual(incomplete.status_code, status.HTTP_409_CONFLICT)
+        self.put_chunk(session_id, 10, self.payload[10:])
+        mismatch = self.client.post(reverse('upload-session-complete', args=[session_id]), {'checksum': '00000000'})
+        self.assertEqual(mismatch.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+
+    def test_limits_are_checked_before_upload(self):
+        self.assertEqual(self.start(size=6 * 1024 * 1024).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.start(filename='scan.exe').status_code, status.HTTP_400_BAD_REQUEST)
+        session_id = self.start(size=4).data['id']
+        self.assertEqual(self.put_chunk(session_id, 0, b"too long").status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+
+class ContentAddressedStorageTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        patient = Patient.objects.create(user=User.objects.create_user(username="blob_patient", password="x"), age=30)
+        self.issue = Issue.objects.create(patient=patient, title="Blobs", description="...")
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def add_document(self, name, content):
+        document = Document(issue=self.issue)
+        document.file.save(name, ContentFile(content), save=True)
+        return document
+
+    def test_identical_content_is_stored_once(self):
+        first = self.add_document('BIRD1.jpg', b'same pixels')
+        second = self.add_document('BIRD1.jpg', b'same pixels')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertRegex(first.file.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(StoredBlob.objects.get(name=first.file.name).refcount, 2)
+
+    def test_unreferenced_blobs_are_collected(self):
+        document = self.add_document('scan.pdf', b'%PDF scan')
+        path = document.file.path
+        document.delete()
+        self.assertEqual(StoredBlob.objects.get(name=document.file.name).refcount, 0)
+        call_command('collect_blobs', grace_hours=0, stdout=io.StringIO())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_collection_skips_blobs_referenced_meanwhile(self):
+        from django.db import transaction
+        from .storage import collect_garbage
+        document = self.add_document('scan.pdf', b'%PDF scan')
+        name = document.file.name
+        document.delete()
+        real_atomic = transaction.atomic
+
+        def saved_again_first(*args, **kwargs):
+            # Another upload of the same content lands between listing and deleting
+            StoredBlob.objects.filter(name=name).update(refcount=1)
+            return real_atomic(*args, **kwargs)
+
+        with mock.patch('main_app.storage.transaction.atomic', side_effect=saved_again_first):
+            removed = collect_garbage(document.file.storage, grace=timedelta(0))
+        self.assertNotIn(name, removed)
+        self.assertTrue(document.file.storage.exists(name))
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 1)
+
+    def test_saving_collected_content_restores_the_file(self):
+        first = self.add_document('scan.pdf', b'%PDF scan')
+        first.delete()
+        call_command('collect_blobs', grace_hours=0, stdout=io.StringIO())
+        second = self.add_document('scan.pdf', b'%PDF scan')
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertTrue(second.file.storage.exists(second.file.name))
+        self.assertEqual(StoredBlob.objects.get(name=second.file.name).refcount, 1)
+
+    def test_replacing_a_file_releases_the_previous_blob(self):
+        document = self.add_document('scan.pdf', b'%PDF first')
+        first = document.file.name
+        document.file.save('scan.pdf', ContentFile(b'%PDF second'), save=True)
+        self.assertEqual(StoredBlob.objects.get(name=first).refcount, 0)
+        self.assertEqual(StoredBlob.objects.get(name=document.file.name).refcount, 1)
+
+        # A reloaded row remembers the name it was read with
+        reloaded = Document.objects.get(pk=document.pk)
+        reloaded.file.save('scan.pdf', ContentFile(b'%PDF first'), save=True)
+        self.assertEqual(StoredBlob.objects.get(name=first).refcount, 1)
+        self.assertEqual(StoredBlob.objects.get(name=document.file.name).refcount, 0)
+
+        # Saving without touching the file keeps its reference
+        reloaded.save()
+        self.assertEqual(StoredBlob.objects.get(name=first).refcount, 1)
+
+    def test_migrate_command_repoints_and_deduplicates_flat_files(self):
+        os.makedirs(os.path.join(self.media_root, 'patient_requests'))
+        for name in ('Tweeter.png', 'Tweeter_6zVvwUO.png'):
+            with open(os.path.join(self.media_root, 'patient_requests', name), 'wb') as fh:
+                fh.write(b'tweeter logo')
+        request = PatientRequest.objects.create(
+            title="Logo", detailed_comment="...", summary_comment="...", document='patient_requests/Tweeter_6zVvwUO.png'
+        )
+        call_command('migrate_media_to_blobs', stdout=io.StringIO())
+        request.refresh_from_db()
+        self.assertTrue(request.document.startswith('blobs/'))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, request.document)))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'patient_requests', 'Tweeter.png')))
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+
+    def test_migrate_command_leaves_derivatives_out_of_the_blobs(self):
+        os.makedirs(os.path.join(self.media_root, 'issue_documents'))
+        with open(os.path.join(self.media_root, 'issue_documents', 'rash.png'), 'wb') as fh:
+            fh.write(b'rash pixels')
+        Document.objects.bulk_create([Document(issue=self.issue, file='issue_documents/rash.png')])
+        for size in DERIVATIVE_SIZES:
+            path = derivative_storage.path(derivative_name('issue_documents/rash.png', size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fh:
+                fh.write(size.encode())
+
+        out = io.StringIO()
+        call_command('migrate_media_to_blobs', stdout=out)
+        self.assertIn('Migrated 1 file(s)', out.getvalue())
+        document = Document.objects.get()
+        derivatives = DocumentSerializer(document).data['derivatives']
+        for size in DERIVATIVE_SIZES:
+            name = derivative_name(document.file.name, size)
+            self.assertTrue(derivative_storage.exists(name))
+            self.assertEqual(derivatives[size], derivative_storage.url(name))
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+
+
+class ImageDerivativeTests(APITestCase):
+
+    def setUp(self):
+        self.settings_override = override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_DERIVATIVE_WORKERS=0)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username="picture_patient", password="x")
+        patient = Patient.objects.create(user=self.user, age=30)
+        self.issue = Issue.objects.create(patient=patient, title="Rash", description="...")
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def png(self, size=(2000, 1500)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 255)).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue())
+
+    def test_document_image_gets_resized_derivatives(self):
+        from PIL import Image
+        with self.captureOnCommitCallbacks(execute=True):
+            document = Document(issue=self.issue)
+            document.file.save('rash.png', self.png(), save=True)
+        for size, edge in DERIVATIVE_SIZES.items():
+            with Image.open(derivative_storage.path(derivative_name(document.file.name, size))) as derivative:
+                self.assertLessEqual(max(derivative.size), edge)
+        urls = DocumentSerializer(document).data['derivatives']
+        self.assertIn('/derivatives/thumbnail/', urls['thumbnail'])
+
+    def test_profile_picture_falls_back_to_original_until_rendered(self):
+        self.user.profile_picture.save('me.png', self.png((300, 300)), save=True)
+        data = UserSerializer(self.user).data
+        self.assertEqual(data['profile_picture_derivatives']['thumbnail'], self.user.profile_picture.url)
+
+    def test_pdf_documents_have_no_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = Document(issue=self.issue)
+            document.file.save('report.pdf', ContentFile(b'%PDF'), save=True)
+        self.assertIsNone(DocumentSerializer(document).data['derivatives'])
+
+
+class DocumentDownloadTests(APITestCase):
+
+    def setUp(self):
+        self.settings_override = override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SENDFILE_BACKEND=None)
+        self.settings_override.enable()
+        self.patient_user = User.objects.create_user(username="download_patient", password="x", role="PATIENT")
+        patient = Patient.objects.create(user=self.patient_user, age=30)
+        issue = Issue.objects.create(patient=patient, title="Report", description="...")
+        self.content = bytes(range(256)) * 8
+        self.document = Document(issue=issue)
+        self.document.file.save('report.pdf', ContentFile(self.content), save=True)
+        self.url = reverse('document-download', args=[self.document.pk])
+        self.client.force_authenticate(user=self.patient_user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def test_full_download_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-10:])
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(unsatisfiable.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+
+    def test_sendfile_offload(self):
+        with self.settings(SENDFILE_BACKEND='nginx'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.document.file.name)
+        self.assertEqual(response.content, b'')
+
+    def test_other_users_cannot_download(self):
+        self.client.force_authenticate(user=User.objects.create_user(username="stranger", password="x"))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patient_request_document_is_free_text_but_served_only_to_its_owner(self):
+        name = self.document.file.name
+        item = {'title': "t", 'detailed_comment': "d", 'summary_comment': "s", 'document': name}
+        response = self.client.post(reverse('patient-request-create'), item, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        download = self.client.get(reverse('patient-request-document', args=[response.data['id']]))
+        self.assertEqual(b''.join(download.streaming_content), self.content)
+
+        stranger = User.objects.create_user(username="request_stranger", password="x", role="PATIENT")
+        Patient.objects.create(user=stranger, age=40)
+        self.client.force_authenticate(user=stranger)
+        for document in (name, '../db.sqlite3', 'see attached letter'):
+            response = self.client.post(reverse('patient-request-create'), dict(item, document=document), format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            download = self.client.get(reverse('patient-request-document', args=[response.data['id']]))
+            self.assertEqual(download.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patient_request_naming_another_patients_file_is_not_served(self):
+        stranger = User.objects.create_user(username="request_thief", password="x", role="PATIENT")
+        stolen = PatientRequest.objects.create(
+            patient=Patient.objects.create(user=stranger, age=40),
+            title="t", detailed_comment="d", summary_comment="s", document=self.document.file.name,
+        )
+        self.client.force_authenticate(user=stranger)
+        response = self.client.get(reverse('patient-request-document', args=[stolen.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncReadPathTests(APITestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.doctor_user = User.objects.create_user(username="async_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty='CARDIOLOGY', license_number='A-1')
+        self.patient_user = User.objects.create_user(username="async_patient", password="x", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.patient_user, age=50)
+        for i in range(3):
+            issue = Issue.objects.create(patient=self.patient, doctor=self.doctor, title=f"Async {i}", description="...")
+            Comment.objects.create(issue=issue, author=self.doctor_user, content="noted")
+        PatientRequest.objects.create(patient=self.patient, title="Second opinion", detailed_comment="...", summary_comment="...")
+
+    def authenticate(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_async_issue_endpoints_match_sync_payloads(self):
+        self.authenticate(self.doctor_user)
+        for sync_url, async_url in [
+            (reverse('issue-list') + '?page_size=2', reverse('async-issue-list') + '?page_size=2'),
+            (reverse('doctor-list'), reverse('async-doctor-list')),
+        ]:
+            expected = self.client.get(sync_url).json()
+            actual = self.client.get(async_url).json()
+            self.assertEqual(actual['results'], expected['results'])
+            self.assertEqual(bool(actual['next']), bool(expected['next']))
+
+        issue = Issue.objects.first()
+        response = self.client.get(reverse('async-issue-detail', args=[issue.id]))
+        self.assertEqual(response.json(), self.client.get(reverse('issue-detail', args=[issue.id])).json())
+        self.assertEqual(self.client.get(reverse('async-issue-detail', args=[0])).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_async_patient_requests(self):
+        self.authenticate(self.patient_user)
+        response = self.client.get(reverse('async-patient-request-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['title'] for r in response.json()['results']], ["Second opinion"])
+
+    def test_async_views_require_authentication_and_get(self):
+        self.assertEqual(self.client.get(reverse('async-issue-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.authenticate(self.patient_user)
+        self.assertEqual(self.client.post(reverse('async-issue-list')).status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class BulkCreateTests(APITestCase):
+
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(username="bulk_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty='PATHOLOGY', license_number='BK-1')
+        self.patient_user = User.objects.create_user(username="bulk_patient", password="x", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.patient_user, age=30)
+        self.open_issue = Issue.objects.create(patient=self.patient, doctor=self.doctor, title="Open", description="...")
+        self.closed_issue = Issue.objects.create(
+            patient=self.patient, doctor=self.doctor, title="Closed", description="...", status=Issue.STATUS_COMPLETED
+        )
+
+    def test_comments_are_validated_together_and_inserted_in_bulk(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        items = [{'issue': self.open_issue.id, 'content': f"note {i}"} for i in range(20)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('comment-bulk-create'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Comment.objects.filter(issue=self.open_issue, author=self.doctor_user).count(), 20)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertLessEqual(len(ctx.captured_queries), 4)
+
+    def test_per_item_results_report_failures(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        items = [
+            {'issue': self.open_issue.id, 'content': "ok"},
+            {'issue': self.closed_issue.id, 'content': "too late"},
+            {'issue': 999999, 'content': "missing"},
+            {'content': "no issue"},
+        ]
+        response = self.client.post(reverse('comment-bulk-create'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 400, 400, 400])
+        self.assertEqual(response.data['results'][0]['data']['content'], "ok")
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_patient_requests_bulk_create(self):
+        self.client.force_authenticate(user=self.patient_user)
+        items = [
+            {'title': f"Request {i}", 'detailed_comment': "...", 'summary_comment': "...", 'issue': self.open_issue.id}
+            for i in range(5)
+        ]
+        response = self.client.post(reverse('patient-request-bulk-create'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PatientRequest.objects.filter(patient=self.patient, issue=self.open_issue).count(), 5)
+        self.assertEqual(response.data['results'][0]['data']['patient']['user']['username'], "bulk_patient")
+
+    def test_rejects_non_array_payloads(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.post(reverse('patient-request-bulk-create'), {'title': "x"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FullTextSearchTests(APITestCase):
+
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(username="search_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty='CARDIOLOGY', license_number='S-1')
+        patient = Patient.objects.create(user=User.objects.create_user(username="search_patient", password="x", role="PATIENT"), age=61)
+        self.in_title = Issue.objects.create(patient=patient, doctor=self.doctor, title="Arrhythmia follow-up", description="Holter results")
+        self.in_body = Issue.objects.create(patient=patient, doctor=self.doctor, title="Checkup", description="Mild arrhythmia noted")
+        Issue.objects.create(patient=patient, title="Arrhythmia, unassigned", description="...")
+        Issue.objects.create(patient=patient, doctor=self.doctor, title="Knee", description="Sprain")
+        PatientRequest.objects.create(
+            patient=patient, issue=self.in_title, title="Second opinion", detailed_comment="Worried about palpitations", summary_comment="..."
+        )
+        self.client.force_authenticate(user=self.doctor_user)
+
+    def test_issue_search_is_ranked_and_role_scoped(self):
+        response = self.client.get(reverse('issue-search'), {'q': 'arrhythmia'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in response.data['results']], [self.in_title.id, self.in_body.id])
+
+    def test_search_index_follows_updates(self):
+        self.in_body.description = "Nothing remarkable"
+        self.in_body.save()
+        response = self.client.get(reverse('issue-search'), {'q': 'arrhythmia'})
+        self.assertEqual([r['id'] for r in response.data['results']], [self.in_title.id])
+
+    def test_patient_request_search(self):
+        response = self.client.get(reverse('patient-request-search'), {'q': 'palpitations'})
+        self.assertEqual([r['title'] for r in response.data['results']], ["Second opinion"])
+
+    def test_query_syntax_is_not_interpreted(self):
+        response = self.client.get(reverse('issue-search'), {'q': 'arrhythmia" OR NEAR('})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('issue-search')).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IssueAssignmentTests(APITestCase):
+
+    def setUp(self):
+        self.patient = Patient.objects.create(user=User.objects.create_user(username="queue_patient", password="x"), age=44)
+        self.cardiologists = [
+            Doctor.objects.create(
+                user=User.objects.create_user(username=f"cardio_{i}", password="x", role="DOCTOR"),
+                specialty='CARDIOLOGY', license_number=f"Q-{i}"
+            )
+            for i in range(2)
+        ]
+
+    def pending(self, title, specialty=''):
+        return Issue.objects.create(patient=self.patient, title=title, description="...", specialty=specialty)
+
+    def test_claim_takes_oldest_matching_issue(self):
+        self.pending("Scan", specialty='RADIOLOGY')
+        first = self.pending("Chest pain", specialty='CARDIOLOGY')
+        self.pending("Anything")
+        self.client.force_authenticate(user=self.cardiologists[0].user)
+        response = self.client.post(reverse('issue-claim'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], first.id)
+        first.refresh_from_db()
+        self.assertEqual((first.doctor, first.status), (self.cardiologists[0], Issue.STATUS_ACCEPTED))
+        self.assertEqual(self.client.post(reverse('issue-claim')).data['title'], "Anything")
+        self.assertEqual(self.client.post(reverse('issue-claim')).status_code, status.HTTP_204_NO_CONTENT)
+
+    @override_settings(MAX_OPEN_ISSUES_PER_DOCTOR=1)
+    def test_open_issue_cap(self):
+        self.pending("One")
+        self.pending("Two")
+        self.assertIsNotNone(claim_next_issue(self.cardiologists[0]))
+        self.assertIsNone(claim_next_issue(self.cardiologists[0]))
+
+    def test_patients_cannot_claim(self):
+        self.client.force_authenticate(user=self.patient.user)
+        self.assertEqual(self.client.post(reverse('issue-claim')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_engine_balances_by_open_issues(self):
+        Issue.objects.create(patient=self.patient, doctor=self.cardiologists[0], title="Existing", description="...")
+        for i in range(5):
+            self.pending(f"Pending {i}", specialty='CARDIOLOGY')
+        self.pending("Radiology only", specialty='RADIOLOGY')
+        self.assertEqual(assign_pending_issues(), 5)
+        loads = sorted(Issue.objects.filter(doctor=d).count() for d in self.cardiologists)
+        self.assertEqual(loads, [3, 3])
+        self.assertTrue(Issue.objects.filter(title="Radiology only", doctor__isnull=True).exists())
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class IssueClaimConcurrencyTests(TransactionTestCase):
+    """Many doctors claiming at once must never receive the same issue."""
+
+    doctors = 16
+    issues = 200
+
+    def test_no_issue_is_claimed_twice(self):
+        patient = Patient.objects.create(user=User.objects.create_user(username="stress_patient", password="x"), age=30)
+        Issue.objects.bulk_create([
+            Issue(patient=patient, title=f"Stress {i}", description="...") for i in range(self.issues)
+        ])
+        doctors = [
+            Doctor.objects.create(
+                user=User.objects.create_user(username=f"stress_doctor_{i}", password="x", role="DOCTOR"),
+                specialty='CARDIOLOGY', license_number=f"ST-{i}"
+            )
+            for i in range(self.doctors)
+        ]
+
+        def drain(doctor):
+            claimed = []
+            try:
+                while True:
+                    issue = claim_next_issue(doctor)
+                    if issue is None:
+                        return claimed
+                    claimed.append(issue.id)
+            finally:
+                connection.close()
+
+        with override_settings(MAX_OPEN_ISSUES_PER_DOCTOR=self.issues), ThreadPoolExecutor(self.doctors) as pool:
+            results = list(pool.map(drain, doctors))
+
+        claimed = [issue_id for ids in results for issue_id in ids]
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(len(claimed), self.issues)
+        self.assertFalse(Issue.objects.filter(doctor__isnull=True).exists())
+
+    def test_pushing_and_claiming_together_respect_the_cap(self):
+        patient = Patient.objects.create(user=User.objects.create_user(username="cap_patient", password="x"), age=30)
+        Issue.objects.bulk_create([Issue(patient=patient, title=f"Cap {i}", description="...") for i in range(40)])
+        doctor = Doctor.objects.create(
+            user=User.objects.create_user(username="cap_doctor", password="x", role="DOCTOR"),
+            specialty='CARDIOLOGY', license_number="CAP-1",
+        )
+
+        def run(work):
+            try:
+                for _ in range(10):
+                    work()
+            finally:
+                connection.close()
+
+        with override_settings(MAX_OPEN_ISSUES_PER_DOCTOR=5), ThreadPoolExecutor(4) as pool:
+            list(pool.map(run, [lambda: claim_next_issue(doctor), lambda: assign_pending_issues(limit=5)] * 2))
+        self.assertEqual(open_issue_count(doctor), 5)
+
+
+class CommentSyncTests(APITestCase):
+
+    def setUp(self):
+        self.patient_user = User.objects.create_user(username="sync_patient", password="x", role="PATIENT")
+        patient = Patient.objects.create(user=self.patient_user, age=30)
+        self.issue = Issue.objects.create(patient=patient, title="Thread", description="...")
+        self.url = reverse('issue-comments', args=[self.issue.id])
+        self.authenticate(self.patient_user)
+
+    def authenticate(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def comment(self, content):
+        return Comment.objects.create(issue=self.issue, author=self.patient_user, content=content)
+
+    def test_only_newer_comments_are_returned(self):
+        self.comment("one")
+        self.comment("two")
+        first = self.client.get(self.url).json()
+        self.assertEqual([c['content'] for c in first['results']], ["one", "two"])
+        self.comment("three")
+        second = self.client.get(self.url, {'after': first['cursor']}).json()
+        self.assertEqual([c['content'] for c in second['results']], ["three"])
+        empty = self.client.get(self.url, {'after': second['cursor']}).json()
+        self.assertEqual(empty['results'], [])
+        self.assertEqual(empty['cursor'], second['cursor'])
+
+    @override_settings(COMMENT_LONG_POLL_MAX=0.3, COMMENT_POLL_INTERVAL=0.05)
+    def test_long_poll_times_out_with_empty_result(self):
+        started = time.monotonic()
+        response = self.client.get(self.url, {'wait': 5})
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(response.json()['results'], [])
+
+    @override_settings(COMMENT_LONG_POLL_MAX=0.3, COMMENT_POLL_INTERVAL=0.05)
+    def test_invalid_waits_do_not_hold_the_request(self):
+        for wait in ('nan', 'inf', '-inf', '-5', 'soon'):
+            started = time.monotonic()
+            response = self.client.get(self.url, {'wait': wait})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLess(time.monotonic() - started, 0.25, wait)
+
+    def test_other_users_cannot_sync(self):
+        self.authenticate(User.objects.create_user(username="sync_stranger", password="x", role="PATIENT"))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CommentLongPollTests(TransactionTestCase):
+
+    @override_settings(COMMENT_POLL_INTERVAL=0.05)
+    def test_long_poll_returns_when_a_comment_arrives(self):
+        user = User.objects.create_user(username="poll_patient", password="x", role="PATIENT")
+        issue = Issue.objects.create(patient=Patient.objects.create(user=user, age=30), title="Poll", description="...")
+        client = APIClient()
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        def post_later():
+            time.sleep(0.3)
+            Comment.objects.create(issue=issue, author=user, content="arrived")
+            connection.close()
+
+        writer = threading.Thread(target=post_later)
+        writer.start()
+        started = time.monotonic()
+        response = client.get(reverse('issue-comments', args=[issue.id]), {'wait': 10})
+        writer.join()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([c['content'] for c in response.json()['results']], ["arrived"])
+
+
+@override_settings(EVENT_STREAM_MAX_AGE=0.3, EVENT_HEARTBEAT_INTERVAL=0.1)
+class StatusEventStreamTests(APITestCase):
+
+    def setUp(self):
+        broker.clear()
+        self.patient_user = User.objects.create_user(username="sse_patient", password="x", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.patient_user, age=40)
+        self.doctor_user = User.objects.create_user(username="sse_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty='CARDIOLOGY', license_number='S-1')
+        self.issue = Issue.objects.create(patient=self.patient, title="Status", description="...")
+
+    def authenticate(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def stream(self, user, last_event_id=None):
+        self.authenticate(user)
+        headers = {'HTTP_LAST_EVENT_ID': last_event_id} if last_event_id else {}
+        response = self.client.get(reverse('event-stream'), **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        with warnings.catch_warnings():
+            # The test client consumes the async stream synchronously; it ends after EVENT_STREAM_MAX_AGE
+            warnings.simplefilter('ignore')
+            return b''.join(response).decode()
+
+    def test_status_changes_are_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.issue.title = "Renamed"
+            self.issue.save()
+        self.assertEqual(broker.recent(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            claim_next_issue(self.doctor)
+        [event] = broker.recent()
+        self.assertEqual(event['data'], {'id': self.issue.id, 'status': 'ACCEPTED', 'previous_status': 'PENDING'})
+        self.assertEqual((event['patient_user'], event['doctor_user']), (self.patient_user.pk, self.doctor_user.pk))
+
+    def test_reconnect_replays_missed_events_for_the_caller_only(self):
+        issue = Issue.objects.get(pk=self.issue.pk)
+        for new_status in (Issue.STATUS_ACCEPTED, Issue.STATUS_COMPLETED):
+            with self.captureOnCommitCallbacks(execute=True):
+                issue.status = new_status
+                issue.save()
+        first, second = broker.recent()
+
+        body = self.stream(self.patient_user, last_event_id=first['id'])
+        self.assertNotIn(f"id: {first['id']}", body)
+        self.assertIn(f"id: {second['id']}\nevent: issue\n", body)
+        self.assertIn('"status": "COMPLETED"', body)
+
+        stranger = User.objects.create_user(username="sse_stranger", password="x", role="PATIENT")
+        self.assertNotIn("event: issue", self.stream(stranger, last_event_id=first['id']))
+        self.assertIn("event: reset", self.stream(self.patient_user, last_event_id="unknown"))
+
+    def test_live_events_reach_open_streams(self):
+        event = make_event('issue', self.issue.id, 'DECLINED', 'PENDING', self.patient_user.pk, None)
+        timer = threading.Timer(0.1, broker.deliver, [event])
+        timer.start()
+        body = self.stream(self.patient_user)
+        timer.join()
+        self.assertIn(f"id: {event['id']}", body)
+        self.assertIn(": keep-alive", body)
+
+    def test_stream_requires_authentication(self):
+        self.assertEqual(self.client.get(reverse('event-stream')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DashboardCounterTests(APITestCase):
+
+    def setUp(self):
+        self.patient_user = User.objects.create_user(username="count_patient", password="x", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.patient_user, age=30)
+        self.doctor_user = User.objects.create_user(username="count_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty='RADIOLOGY', license_number='N-1')
+        self.issues = [Issue.objects.create(patient=self.patient, title=f"Count {i}", description="...") for i in range(3)]
+
+    def stored_counts(self):
+        return {
+            (c.owner_type, c.owner_id, c.kind, c.status): c.count
+            for c in DashboardCounter.objects.all() if c.count
+        }
+
+    def test_counters_follow_creates_transitions_and_deletes(self):
+        claim_next_issue(self.doctor)
+        issue = Issue.objects.get(pk=self.issues[1].pk)
+        issue.doctor = self.doctor
+        issue.status = Issue.STATUS_COMPLETED
+        issue.save()
+        Issue.objects.filter(pk=self.issues[2].pk).delete()
+        PatientRequest.objects.create(patient=self.patient, title="Opinion", detailed_comment="...", summary_comment="...")
+        self.client.force_authenticate(user=self.patient_user)
+        self.client.post(reverse('patient-request-bulk-create'), [
+            {'title': 'Bulk', 'detailed_comment': '...', 'summary_comment': '...'},
+        ], format='json')
+        self.assertEqual(self.stored_counts()[('patient', self.patient.pk, 'patient_request', 'PENDING')], 2)
+        self.assertEqual(self.stored_counts(), dict(actual_counts()))
+
+    def test_stats_endpoint_reads_counters_in_one_query(self):
+        claim_next_issue(self.doctor)
+        self.client.force_authenticate(user=self.doctor_user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dashboard-stats'))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response.data['issues'], {'PENDING': 0, 'ACCEPTED': 1, 'DECLINED': 0, 'COMPLETED': 0})
+
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get(reverse('dashboard-stats'))
+        self.assertEqual(response.data['issues']['PENDING'], 2)
+        self.assertEqual(response.data['patient_requests']['PENDING'], 0)
+
+        admin = User.objects.create_user(username="count_admin", password="x", role="ADMIN")
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('dashboard-stats'))
+        self.assertEqual(response.data['doctors'][self.doctor.pk]['ACCEPTED'], 1)
+
+    def test_admin_totals_come_from_the_site_wide_rows(self):
+        claim_next_issue(self.doctor)
+        other = Patient.objects.create(user=User.objects.create_user(username="count_other", password="x"), age=40)
+        Issue.objects.create(patient=other, title="Other", description="...")
+        admin = User.objects.create_user(username="count_admin", password="x", role="ADMIN")
+        self.client.force_authenticate(user=admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dashboard-stats'))
+        self.assertEqual(response.data['issues'], {'PENDING': 3, 'ACCEPTED': 1, 'DECLINED': 0, 'COMPLETED': 0})
+        self.assertNotIn("'patient'", ctx.captured_queries[-1]['sql'])
+
+        # A drifted patient row does not leak into the totals
+        DashboardCounter.objects.filter(owner_type='patient', owner_id=other.pk).update(count=50)
+        response = self.client.get(reverse('dashboard-stats'))
+        self.assertEqual(response.data['issues']['PENDING'], 3)
+
+    def test_reconcile_command_reports_and_repairs_drift(self):
+        DashboardCounter.objects.filter(owner_type='patient', status='PENDING').update(count=7)
+        out = io.StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn(f"patient {self.patient.pk} issue PENDING: 7 -> 3", out.getvalue())
+        self.assertEqual(self.stored_counts()[('patient', self.patient.pk, 'issue', 'PENDING')], 7)
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(self.stored_counts(), dict(actual_counts()))
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the queries behind the list endpoints over a seeded data set and
+    fail on full scans or sorts of the large tables.
+    """
+    patients = 200
+    issues_per_patient = 25
+    large_tables = ['main_app_issue', 'main_app_patientrequest', 'main_app_comment']
+    # Plan lines that mean a large table is read in full or sorted, per backend
+    problem_patterns = {
+        'sqlite': [r'\bSCAN {table}\b', r'USE TEMP B-TREE FOR ORDER BY'],
+        'postgresql': [r'Seq Scan on {table}\b', r'(^|->\s+)Sort\b'],
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(username=f"plan_patient_{i}", role="PATIENT") for i in range(cls.patients)]
+            + [User(username=f"plan_doctor_{i}", role="DOCTOR") for i in range(10)]
+        )
+        patients = Patient.objects.bulk_create([Patient(user=user, age=40) for user in users[:cls.patients]])
+        doctors = Doctor.objects.bulk_create([
+            Doctor(user=user, specialty='RADIOLOGY', license_number=f'P-{i}') for i, user in enumerate(users[cls.patients:])
+        ])
+        statuses = [choice for choice, _ in Issue.STATUS_CHOICES]
+        Issue.objects.bulk_create([
+            Issue(patient=patient, doctor=doctors[i % len(doctors)] if i % 3 else None,
+                  status=statuses[i % len(statuses)], title=f"Plan {i}", description="...")
+            for patient in patients for i in range(cls.issues_per_patient)
+        ])
+        PatientRequest.objects.bulk_create([
+            PatientRequest(patient=patient, title=f"Request {i}", detailed_comment="...", summary_comment="...")
+            for patient in patients for i in range(5)
+        ])
+        issue = Issue.objects.filter(status=Issue.STATUS_PENDING).first()
+        Comment.objects.bulk_create([Comment(issue=issue, author=users[0], content=f"{i}") for i in range(50)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.patient_user = users[0]
+        cls.patient = patients[0]
+        cls.doctor = doctors[0]
+        cls.issue = issue
+
+    def setUp(self):
+        if connection.vendor not in self.problem_patterns:
+            self.skipTest(f"No plan checks for {connection.vendor}")
+
+    def page_queryset(self, queryset, user, view_class=None):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = user
+        return KeysetPagination().get_page_queryset(queryset, request, view=view_class)
+
+    def assertIndexedPlan(self, queryset, index=None):
+        plan = queryset.explain()
+        for table in self.large_tables:
+            for pattern in self.problem_patterns[connection.vendor]:
+                match = re.search(pattern.format(table=table), plan, re.MULTILINE)
+                self.assertIsNone(match, f"Plan reads or sorts {table} in full:\n{plan}")
+        if index is not None:
+            self.assertIn(index, plan)
+
+    def test_recommended_indexes_exist(self):
+        with connection.cursor() as cursor:
+            issue_indexes = connection.introspection.get_constraints(cursor, 'main_app_issue')
+            request_indexes = connection.introspection.get_constraints(cursor, 'main_app_patientrequest')
+        self.assertEqual(issue_indexes['issue_patient_recent_idx']['columns'], ['patient_id', 'created_at', 'id'])
+        self.assertEqual(issue_indexes['issue_doctor_recent_idx']['columns'], ['doctor_id', 'created_at', 'id'])
+        self.assertEqual(issue_indexes['issue_doctor_status_idx']['columns'], ['doctor_id', 'status', 'created_at'])
+        self.assertEqual(request_indexes['request_patient_recent_idx']['columns'], ['patient_id', 'created_at', 'id'])
+
+    def test_issue_list_for_patient(self):
+        queryset = views.scope_issues(self.patient_user, views.issue_queryset())
+        self.assertIndexedPlan(self.page_queryset(queryset, self.patient_user, views.IssueList), 'issue_patient_recent_idx')
+
+    def test_issue_list_for_doctor(self):
+        queryset = views.scope_issues(self.doctor.user, views.issue_queryset())
+        self.assertIndexedPlan(self.page_queryset(queryset, self.doctor.user, views.IssueList), 'issue_doctor_recent_idx')
+
+    def test_patient_request_list(self):
+        queryset = PatientRequest.objects.filter(patient=self.patient).select_related('patient__user')
+        self.assertIndexedPlan(self.page_queryset(queryset, self.patient_user), 'request_patient_recent_idx')
+
+    def test_open_issue_count(self):
+        self.assertIndexedPlan(Issue.objects.filter(doctor=self.doctor, status__in=Issue.OPEN_STATUSES))
+        self.assertLess(open_issue_count(self.doctor), Issue.objects.count())
+
+    def test_doctor_issues_in_one_status(self):
+        queryset = Issue.objects.filter(doctor=self.doctor, status=Issue.STATUS_ACCEPTED).order_by('-created_at')
+        self.assertIndexedPlan(queryset[:25], 'issue_doctor_status_idx')
+
+    def test_claim_queue(self):
+        self.assertIndexedPlan(claimable_issues('RADIOLOGY')[:5])
+
+    def test_comment_sync(self):
+        queryset = Comment.objects.filter(issue=self.issue).order_by('created_at', 'id')
+        self.assertIndexedPlan(queryset[:100])
+
+
+class BenchmarkSupportTests(APITestCase):
+
+    def test_seed_benchmark_creates_consistent_data(self):
+        call_command('seed_benchmark', issues=40, patients=4, doctors=2, batch_size=15, stdout=io.StringIO())
+        self.assertEqual(Issue.objects.count(), 40)
+        self.assertEqual(Comment.objects.count(), 120)
+        self.assertEqual(Document.objects.count(), 40)
+        self.assertEqual(PatientRequest.objects.count(), 8)
+        self.assertFalse(Issue.objects.filter(status=Issue.STATUS_PENDING, doctor__isnull=False).exists())
+        self.assertEqual(
+            {(c.owner_type, c.owner_id, c.kind, c.status): c.count for c in DashboardCounter.objects.all()},
+            dict(actual_counts()),
+        )
+        self.assertTrue(self.client.login(username='bench_patient_0', password='benchmark-password'))
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark', issues=1, stdout=io.StringIO())
+
+    @modify_settings(MIDDLEWARE={'prepend': 'main_app.middleware.QueryCountMiddleware'})
+    def test_query_count_header(self):
+        user = User.objects.create_user(username="bench_counted", password="x", role="PATIENT")
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(reverse('home'))['X-Query-Count'], '0')
+        self.assertEqual(self.client.get(reverse('dashboard-stats'))['X-Query-Count'], '2')
+
+
+class PasswordHashingPoolTests(APITestCase):
+
+    def setUp(self):
+        User.objects.create_user(username="pool_user", password="s3cret-pass", role="patient")
+
+    def credentials(self, password="s3cret-pass"):
+        return {'username': 'pool_user', 'password': password}
+
+    def test_login_and_register_through_the_pool(self):
+        for name in ('login', 'async-login'):
+            response = self.client.post(reverse(name), self.credentials(), format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(response.content)['user']['username'], 'pool_user')
+            response = self.client.post(reverse(name), self.credentials('wrong'), format='json')
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        data = {'username': 'pool_new', 'email': 'new@example.com', 'password': 'another-pass', 'role': 'patient'}
+        response = self.client.post(reverse('async-register'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Patient.objects.filter(user__username='pool_new').exists())
+        self.assertTrue(User.objects.get(username='pool_new').check_password('another-pass'))
+        response = self.client.post(reverse('async-register'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_saturated_pool_sheds_load(self):
+        pool = passwords.BoundedExecutor(workers=1, queue_size=0)
+        release = threading.Event()
+        blocker = pool.submit(release.wait)
+        try:
+            with mock.patch.object(passwords, '_pool', pool):
+                for name in ('login', 'async-login'):
+                    response = self.client.post(reverse(name), self.credentials(), format='json')
+                    self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+                    self.assertEqual(response['Retry-After'], '1')
+        finally:
+            release.set()
+        blocker.result()
+        # The slot is free again once the running hash finishes
+        with mock.patch.object(passwords, '_pool', pool):
+            response = self.client.post(reverse('login'), self.credentials(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+@override_settings(ONBOARDING_HASH_WORKERS=0, ONBOARDING_BATCH_SIZE=2)
+class BulkOnboardingTests(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="onboard_admin", password="x")
+        User.objects.create_user(username="taken", password="x", role="PATIENT")
+        self.client.force_authenticate(user=self.admin)
+
+    def test_json_rows(self):
+        rows = [
+            {'username': 'p1', 'password': 'pw-one', 'role': 'patient', 'age': 40},
+            {'username': 'd1', 'password': 'pw-two', 'role': 'DOCTOR', 'specialty': 'RADIOLOGY', 'license_number': 'LIC-1'},
+            {'username': 'p2', 'role': 'patient'},
+            {'username': 'taken', 'password': 'pw', 'role': 'patient'},
+            {'username': 'd2', 'password': 'pw', 'role': 'doctor', 'specialty': 'RADIOLOGY', 'license_number': 'LIC-1'},
+            {'username': 'd3', 'password': 'pw', 'role': 'doctor'},
+            {'username': 'p3', 'password': 'pw-three', 'role': 'patient', 'email': 'p3@example.com'},
+        ]
+        response = self.client.post(reverse('user-bulk-register'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(
+            {row['row']: sorted(row['errors']) for row in response.data['errors']},
+            {3: ['password'], 4: ['username'], 5: ['license_number'], 6: ['license_number', 'specialty']},
+        )
+        self.assertEqual(Patient.objects.get(user__username='p1').age, 40)
+        self.assertEqual(Doctor.objects.get(user__username='d1').license_number, 'LIC-1')
+        self.assertEqual(User.objects.get(username='d1').role, User.ROLE_DOCTOR)
+        User.objects.get(username='d1').full_clean()
+        self.assertTrue(User.objects.get(username='p3').check_password('pw-three'))
+
+    def test_bulk_and_self_registered_users_are_scoped_alike(self):
+        self.client.post(reverse('user-bulk-register'), [{'username': 'bulk_p', 'password': 'pw', 'role': 'PATIENT'}], format='json')
+        self.client.post(reverse('register'), {'username': 'self_p', 'password': 'pw', 'role': 'patient'}, format='json')
+        for username in ('bulk_p', 'self_p'):
+            user = User.objects.get(username=username)
+            self.assertEqual(user.role, User.ROLE_PATIENT)
+            Issue.objects.create(patient=user.patient, title=username, description="d")
+            self.client.force_authenticate(user=user)
+            titles = [issue['title'] for issue in self.client.get(reverse('issue-list')).data['results']]
+            self.assertEqual(titles, [username])
+
+    def test_bulk_doctors_refresh_the_directory(self):
+        before = get_generation('doctors')
+        row = {'username': 'bulk_d', 'password': 'pw', 'role': 'doctor', 'specialty': 'RADIOLOGY', 'license_number': 'LIC-B'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('user-bulk-register'), [row], format='json')
+        self.assertNotEqual(get_generation('doctors'), before)
+
+    @override_settings(ONBOARDING_MAX_REQUEST_ROWS=2, ONBOARDING_HASH_WORKERS=None)
+    def test_endpoint_is_capped_and_hashes_on_the_password_pool(self):
+        rows = [{'username': f'cap_{i}', 'password': 'pw', 'role': 'patient'} for i in range(3)]
+        with mock.patch('main_app.onboarding.ProcessPoolExecutor') as process_pool:
+            response = self.client.post(reverse('user-bulk-register'), rows, format='json')
+            self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            self.assertFalse(User.objects.filter(username__startswith='cap_').exists())
+
+            with mock.patch('main_app.passwords.run', wraps=passwords.run) as run:
+                response = self.client.post(reverse('user-bulk-register'), rows[:2], format='json')
+            self.assertEqual(response.data['created'], 2)
+            self.assertEqual(run.call_count, 2)
+
+            with mock.patch('main_app.passwords.run', side_effect=passwords.HashingBusy):
+                response = self.client.post(reverse('user-bulk-register'), rows[2:], format='json')
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        process_pool.assert_not_called()
+
+    def test_csv_upload(self):
+        upload = io.BytesIO(b"username,password,role,age,specialty,license_number\ncsv_p,pw,patient,30,,\ncsv_d,pw,doctor,,PATHOLOGY,LIC-9\n")
+        upload.name = 'clinic.csv'
+        response = self.client.post(reverse('user-bulk-register'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertIsNone(Doctor.objects.get(user__username='csv_d').years_experience)
+
+    def test_admins_only(self):
+        self.client.force_authenticate(user=User.objects.get(username='taken'))
+        response = self.client.post(reverse('user-bulk-register'), [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_command_hashes_on_a_process_pool(self):
+        fd, path = tempfile.mkstemp(suffix='.ndjson')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as fh:
+            for i in range(5):
+                fh.write(json.dumps({'username': f'cmd_{i}', 'password': f'pw-{i}', 'role': 'patient'}) + '\n')
+            fh.write(json.dumps({'username': 'cmd_0', 'password': 'pw', 'role': 'patient'}) + '\n')
+        out, err = io.StringIO(), io.StringIO()
+        call_command('onboard_users', path, workers=1, stdout=out, stderr=err)
+        self.assertIn('Created 5 accounts', out.getvalue())
+        self.assertIn('Row 6 (cmd_0)', err.getvalue())
+        self.assertTrue(User.objects.get(username='cmd_4').check_password('pw-4'))
+        self.assertEqual(Patient.objects.filter(user__username__startswith='cmd_').count(), 5)
+
+    def test_register_creates_one_profile(self):
+        data = {'username': 'single', 'email': 'single@example.com', 'password': 'pw', 'role': 'patient'}
+        response = self.client.post(reverse('register'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Patient.objects.filter(user__username='single').count(), 1)
+
+class TokenRevocationTests(APITestCase):
+
+    def setUp(self):
+        revocations.reset()
+        self.user = User.objects.create_user(username="revoker", password="x", role="PATIENT")
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def refresh_token(self, token=None):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(token or self.refresh)}, format='json')
+
+    def test_logout_revokes_the_refresh_token(self):
+        self.assertEqual(self.refresh_token().status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('logout'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(RevokedToken.objects.filter(jti=self.refresh['jti']).exists())
+        self.assertEqual(self.refresh_token().status_code, status.HTTP_401_UNAUTHORIZED)
+        # Other sessions are unaffected
+        self.assertEqual(self.refresh_token(RefreshToken.for_user(self.user)).status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('logout'), {'refresh': 'garbage'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_checks_revocation_in_memory(self):
+        revoked = RefreshToken.for_user(self.user)
+        revoke_token(revoked)
+        self.refresh_token()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh_token().status_code, status.HTTP_200_OK)
+            self.assertEqual(self.refresh_token(revoked).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse([q for q in queries if 'main_app_revokedtoken' in q['sql']])
+
+    def test_revocations_from_other_processes_are_synced(self):
+        local = RevocationList(sync_interval=0)
+        self.assertFalse(local.is_revoked(self.refresh['jti']))
+        RevokedToken.objects.create(jti=self.refresh['jti'], expires_at=timezone.now() + timedelta(days=1))
+        with mock.patch('main_app.serializers.revocations', local):
+            self.assertEqual(self.refresh_token().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_revocations_are_pruned(self):
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='live', expires_at=timezone.now() + timedelta(hours=1))
+        local = RevocationList()
+        self.assertFalse(local.is_revoked('expired'))
+        self.assertTrue(local.is_revoked('live'))
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"revoked-{i}")
+        self.assertTrue(all(f"revoked-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+class ConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="conditional", password="x", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.user, age=30)
+        doctor_user = User.objects.create_user(username="conditional_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=doctor_user, specialty="RADIOLOGY", license_number="C-1")
+        self.issue = Issue.objects.create(patient=self.patient, doctor=self.doctor, title="Cached", description="d")
+        PatientRequest.objects.create(patient=self.patient, title="t", detailed_comment="d", summary_comment="s")
+        self.client.force_authenticate(user=self.user)
+
+    def revalidate(self, url, response, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+        return revalidated, queries
+
+    def test_issue_detail(self):
+        url = reverse('issue-detail', kwargs={'pk': self.issue.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertNotIn('Last-Modified', response)
+
+        revalidated, queries = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(revalidated.content, b'')
+        self.assertEqual(len(queries), 1)
+
+        # A new comment changes the payload, so the old validator no longer matches
+        Comment.objects.create(issue=self.issue, author=self.user, content="New")
+        revalidated, _ = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(revalidated['ETag'], response['ETag'])
+        self.assertEqual(len(revalidated.data['comments']), 1)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_DERIVATIVE_WORKERS=0)
+    def test_replacing_a_document_file_invalidates(self):
+        document = Document(issue=self.issue)
+        document.file.save('scan.pdf', ContentFile(b'%PDF first'), save=True)
+        urls = [reverse('issue-detail', kwargs={'pk': self.issue.pk}), reverse('issue-list')]
+        responses = [self.client.get(url) for url in urls]
+
+        upload = ContentFile(b'%PDF second', name='scan.pdf')
+        replaced = self.client.put(reverse('document-detail', kwargs={'pk': document.pk}), {'file': upload}, format='multipart')
+        self.assertEqual(replaced.status_code, status.HTTP_200_OK)
+        for url, response in zip(urls, responses):
+            revalidated, _ = self.revalidate(url, response)
+            self.assertEqual(revalidated.status_code, status.HTTP_200_OK, url)
+
+    def test_issue_list(self):
+        url = reverse('issue-list')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response)[0].status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(url + '?page_size=1')['ETag'], response['ETag'])
+        Issue.objects.create(patient=self.patient, title="Another", description="d")
+        self.assertEqual(self.revalidate(url, response)[0].status_code, status.HTTP_200_OK)
+
+    def test_patient_request_list_follows_the_nested_patient(self):
+        url = reverse('patient-request-create')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.revalidate(url, response)[0].status_code, status.HTTP_304_NOT_MODIFIED)
+        User.objects.filter(pk=self.user.pk).update(first_name="Renamed")
+        revalidated, _ = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, status.HTTP_200_OK)
+        self.assertEqual(revalidated.data['results'][0]['patient']['user']['first_name'], "Renamed")
+
+    def test_deletes_and_renamed_authors_invalidate_issues(self):
+        Issue.objects.create(patient=self.patient, title="Newest", description="d")
+        comment = Comment.objects.create(issue=self.issue, author=self.user, content="Hello")
+        urls = [reverse('issue-detail', kwargs={'pk': self.issue.pk}), reverse('issue-list')]
+
+        responses = [self.client.get(url) for url in urls]
+        User.objects.filter(pk=self.user.pk).update(first_name="Renamed")
+        for url, response in zip(urls, responses):
+            self.assertEqual(self.revalidate(url, response)[0].status_code, status.HTTP_200_OK, url)
+
+        responses = [self.client.get(url) for url in urls]
+        User.objects.filter(pk=self.doctor.pk).update(last_name="Renamed")
+        for url, response in zip(urls, responses):
+            self.assertEqual(self.revalidate(url, response)[0].status_code, status.HTTP_200_OK, url)
+
+        responses = [self.client.get(url) for url in urls]
+        comment.delete()
+        Issue.objects.filter(title="Newest").delete()
+        for url, response in zip(urls, responses):
+            self.assertEqual(self.revalidate(url, response)[0].status_code, status.HTTP_200_OK, url)
+
+    def test_profiles(self):
+        for url in (reverse('patient-detail', kwargs={'pk': self.patient.pk}),
+                    reverse('doctor-detail', kwargs={'pk': self.doctor.pk})):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(self.revalidate(url, response)[0].status_code, status.HTTP_304_NOT_MODIFIED)
+
+        url = reverse('patient-detail', kwargs={'pk': self.patient.pk})
+        response = self.client.get(url)
+        Patient.objects.filter(pk=self.patient.pk).update(age=31)
+        revalidated, _ = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, status.HTTP_200_OK)
+        self.assertEqual(revalidated.data['age'], 31)
+
+    def test_missing_issue_is_still_404(self):
+        response = self.client.get(reverse('issue-detail', kwargs={'pk': 999999}), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sparse", password="x", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.user, age=30)
+        doctor_user = User.objects.create_user(username="sparse_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=doctor_user, specialty="RADIOLOGY", license_number="S-1")
+        self.issue = Issue.objects.create(patient=self.patient, doctor=self.doctor, title="Sparse", description="d")
+        Comment.objects.create(issue=self.issue, author=self.user, content="Hello")
+        PatientRequest.objects.create(patient=self.patient, title="t", detailed_comment="d", summary_comment="s")
+        self.client.force_authenticate(user=self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in queries]
+
+    def test_default_payload_unchanged(self):
+        response, _ = self.get(reverse('issue-detail', kwargs={'pk': self.issue.pk}))
+        self.assertEqual(set(response.data), set(IssueSerializer.Meta.fields))
+        self.assertEqual(response.data['patient'], str(self.patient))
+        self.assertEqual(len(response.data['comments']), 1)
+
+    def test_fields_prune_payload_and_queries(self):
+        url = reverse('issue-list')
+        _, full = self.get(url)
+        response, sparse = self.get(url + '?fields=id,title,status')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title', 'status'])
+        self.assertEqual(len(sparse), len(full) - 2)
+        issue_query = next(sql for sql in sparse if 'FROM "main_app_issue"' in sql and 'main_app_issue"."title' in sql)
+        self.assertNotIn('description', issue_query)
+        self.assertNotIn('main_app_user', issue_query)
+
+    def test_expand_loads_only_named_relations(self):
+        url = reverse('issue-detail', kwargs={'pk': self.issue.pk})
+        _, full = self.get(url)
+        response, queries = self.get(url + '?fields=title&expand=comments')
+        self.assertEqual(set(response.data), {'id', 'title', 'comments'})
+        self.assertEqual(response.data['comments'][0]['author'], str(self.user))
+        # The documents prefetch is skipped
+        self.assertEqual(len(queries), len(full) - 1)
+
+        # Different selections are different representations
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url + '?fields=title')['ETag'])
+
+    def test_expand_without_fields_keeps_plain_fields(self):
+        response, _ = self.get(reverse('issue-detail', kwargs={'pk': self.issue.pk}) + '?expand=doctor')
+        self.assertIn('description', response.data)
+        self.assertEqual(response.data['doctor'], str(self.doctor))
+        self.assertNotIn('documents', response.data)
+
+    def test_patient_requests_skip_patient_join(self):
+        response, queries = self.get(reverse('patient-request-create') + '?fields=title,issue')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title', 'issue'])
+        page_query = next(sql for sql in queries if 'main_app_patientrequest"."title' in sql)
+        self.assertNotIn('main_app_user', page_query)
+
+    def test_csv_export_header_follows_fields(self):
+        response = self.client.get(reverse('issue-export', kwargs={'file_format': 'csv'}) + '?fields=title')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(rows, [['id', 'title'], [str(self.issue.pk), 'Sparse']])
+
+    def test_writes_are_not_pruned(self):
+        url = reverse('issue-detail', kwargs={'pk': self.issue.pk}) + '?fields=title'
+        response = self.client.patch(url, {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('comments', response.data)
+
+
+class ServerTimingTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="timed", password="x", role="PATIENT")
+        patient = Patient.objects.create(user=self.user, age=30)
+        Issue.objects.create(patient=patient, title="Timed", description="d")
+        self.client.force_authenticate(user=self.user)
+
+    def timings(self, response):
+        return dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+
+    def test_header_and_log_fields(self):
+        with self.assertLogs('main_app.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('issue-list'))
+        self.assertEqual(set(self.timings(response)), {'db', 'serialize', 'total'})
+        self.assertIn('desc="', response['Server-Timing'])
+        record = logs.records[-1]
+        self.assertEqual(record.levelname, 'INFO')
+        self.assertEqual((record.path, record.status), (reverse('issue-list'), 200))
+        self.assertGreaterEqual(record.db_queries, 3)
+        self.assertGreater(record.serialize_ms, 0)
+        self.assertLessEqual(record.db_ms + record.serialize_ms, record.duration_ms)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('main_app.middleware', 'WARNING') as logs:
+            self.client.get(reverse('issue-list'))
+        statements = logs.records[-1].sql
+        self.assertTrue(statements)
+        self.assertTrue(any('main_app_issue' in statement['sql'] for statement in statements))
+
+    def test_serializers_outside_views_are_left_alone(self):
+        from rest_framework import serializers
+        ServerTimingMiddleware(lambda request: None)
+        self.assertEqual(serializers.BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+        timings = RequestTimings(capture_sql=0)
+        token = current_timings.set(timings)
+        try:
+            UserSerializer(self.user).data
+        finally:
+            current_timings.reset(token)
+        self.assertEqual(timings.serialize_time, 0)
+
+    def test_streaming_responses_are_marked_partial(self):
+        with self.assertLogs('main_app.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('issue-export', kwargs={'file_format': 'ndjson'}))
+        b''.join(response.streaming_content)
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertIn('desc="before streaming"', response['Server-Timing'])
+        self.assertTrue(logs.records[-1].partial)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('issue-list')))
+
+    def test_async_views_are_not_adapted_to_a_thread(self):
+        from django.core.handlers.asgi import ASGIHandler
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        response = async_to_sync(self.async_client.get)(
+            reverse('async-issue-list'), headers={'Authorization': f'Bearer {token}'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+    def test_queries_in_worker_threads_are_counted(self):
+        ServerTimingMiddleware(lambda request: None)
+        timings = RequestTimings(capture_sql=0)
+        token = current_timings.set(timings)
+        try:
+            def query():
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                finally:
+                    connection.close()
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pool.submit(contextvars.copy_context().run, query).result()
+        finally:
+            current_timings.reset(token)
+        self.assertEqual(timings.queries, 1)
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        self.patient_user = User.objects.create_user(username="export_patient", password="x", role="PATIENT")
+        self.patient = Patient.objects.create(user=self.patient_user, age=30)
+        self.doctor_user = User.objects.create_user(username="export_doctor", password="x", role="DOCTOR")
+        self.doctor = Doctor.objects.create(user=self.doctor_user, specialty="RADIOLOGY", license_number="EXP-1")
+        self.issues = [
+            Issue.objects.create(patient=self.patient, doctor=self.doctor if i == 0 else None, title=f"Issue {i}", description="d")
+            for i in range(3)
+        ]
+        for issue in self.issues:
+            Comment.objects.create(issue=issue, author=self.patient_user, content=f"About {issue.title}")
+        other = Patient.objects.create(user=User.objects.create_user(username="export_other", password="x", role="PATIENT"))
+        Issue.objects.create(patient=other, title="Not mine", description="d")
+        PatientRequest.objects.create(patient=self.patient, title="Second opinion", detailed_comment="d", summary_comment="s")
+
+    def export(self, user, name, file_format):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse(name, kwargs={'file_format': file_format}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_issue_export(self):
+        body = self.export(self.patient_user, 'issue-export', 'ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['title'] for row in rows], ["Issue 0", "Issue 1", "Issue 2"])
+        self.assertEqual([row['comments'][0]['content'] for row in rows], ["About Issue 0", "About Issue 1", "About Issue 2"])
+
+    def test_export_is_scoped_like_the_list(self):
+        body = self.export(self.doctor_user, 'issue-export', 'ndjson')
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], [self.issues[0].id])
+        self.assertEqual(self.export(self.doctor_user, 'patient-request-export', 'ndjson'), '')
+
+    def test_csv_export(self):
+        body = self.export(self.patient_user, 'patient-request-export', 'csv')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], "Second opinion")
+        self.assertEqual(json.loads(rows[0]['patient'])['id'], self.patient.id)
+
+        rows = list(csv.DictReader(io.StringIO(self.export(self.patient_user, 'issue-export', 'csv'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(json.loads(rows[0]['comments'])), 1)
+
+    def test_unknown_format(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get(reverse('issue-export', kwargs={'file_format': 'xml'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class BulkImportTests(TestCase):
+    # Children before parents, as in a hand-assembled migration export
+    FIXTURE = [
+        {"model": "main_app.comment", "pk": 9, "fields": {"issue": 50, "author": 101, "content": "Looks benign",
+                                                        "created_at": "2024-01-03T10:00:00Z", "updated_at": "2024-01-03T10:00:00Z"}},
+        {"model": "main_app.issue", "pk": 50, "fields": {"patient": 7, "doctor": 101, "title": "Scan", "description": "MRI",
+                                                        "status": "ACCEPTED", "created_at": "2024-01-02T03:04:05Z"}},
+        {"model": "contenttypes.contenttype", "pk": 1, "fields": {"app_label": "main_app", "model": "issue"}},
+        {"model": "main_app.user", "pk": 100, "fields": {"username": "imported_patient", "password": "!", "role": "PATIENT"}},
+        {"model": "main_app.user", "pk": 101, "fields": {"username": "imported_doctor", "password": "!", "role": "DOCTOR"}},
+        {"model": "main_app.patient", "pk": 7, "fields": {"user": 100, "age": 40}},
+        {"model": "main_app.doctor", "pk": 101, "fields": {"specialty": "RADIOLOGY", "license_number": "L-1"}},
+    ]
+
+    def write(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_import(self, *args, **kwargs):
+        out = io.StringIO()
+        call_command('import_records', *args, batch_size=2, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_json_fixture_remaps_foreign_keys(self):
+        path = self.write('.json', json.dumps(self.FIXTURE, indent=2))
+        self.run_import(path)
+        comment = Comment.objects.select_related('issue__patient__user', 'issue__doctor__user', 'author').get()
+        issue = comment.issue
+        self.assertEqual(issue.patient.user.username, 'imported_patient')
+        self.assertEqual(issue.doctor.user.username, 'imported_doctor')
+        self.assertEqual(comment.author, issue.doctor.user)
+        # The fixture's upper-case roles are stored as the model's choices
+        self.assertEqual(issue.patient.user.role, User.ROLE_PATIENT)
+        self.assertEqual(issue.doctor.user.role, User.ROLE_DOCTOR)
+        self.assertEqual(issue.created_at.isoformat(), '2024-01-02T03:04:05+00:00')
+        self.assertEqual(DashboardCounter.objects.get(owner_type='doctor', kind='issue', status='ACCEPTED').count, 1)
+
+        # Running it again resumes: nothing is imported twice
+        output = self.run_import(path)
+        self.assertIn('main_app.comment: 1 skipped', output)
+        self.assertEqual(Issue.objects.count(), 1)
+        self.assertEqual(User.objects.filter(username__startswith='imported_').count(), 2)
+
+    def test_ndjson_and_csv(self):
+        ndjson = self.write('.ndjson', '\n'.join(json.dumps(record) for record in self.FIXTURE[3:]))
+        csv_path = self.write('.csv', 'pk,patient,title,description,status\n1,7,First,One,PENDING\n2,7,Second,Two,COMPLETED\n')
+        self.run_import(ndjson, source='clinic-a')
+        self.run_import(csv_path, source='clinic-a', model='main_app.issue')
+        patient = Patient.objects.get(user__username='imported_patient')
+        self.assertEqual(sorted(patient.issue_set.values_list('title', flat=True)), ['First', 'Second'])
+
+    def test_unresolvable_rows_are_rejected(self):
+        User.objects.create_user(username='imported_doctor', password='x', role='DOCTOR')
+        path = self.write('.json', json.dumps(self.FIXTURE))
+        rejects = self.write('.ndjson', '')
+        output = self.run_import(path, rejects=rejects)
+        self.assertIn('rejected', output)
+        # The clashing user, then everything that depends on it
+        with open(rejects) as fh:
+            rejected = [json.loads(line) for line in fh]
+        self.assertEqual(
+            sorted(record['model'] for record in rejected),
+            ['main_app.comment', 'main_app.doctor', 'main_app.issue', 'main_app.user'],
+        )
+        self.assertTrue(all(record['error'] for record in rejected))
+        self.assertTrue(Patient.objects.filter(user__username='imported_patient').exists())
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_imported_files_keep_their_blobs(self):
+        from django.core.files.storage import default_storage
+        name = default_storage.blob_name('ab' * 32, '.pdf')
+        os.makedirs(os.path.dirname(default_storage.path(name)))
+        with open(default_storage.path(name), 'wb') as fh:
+            fh.write(b'%PDF imported')
+        document = {"model": "main_app.document", "pk": 3, "fields": {"issue": 50, "file": name}}
+        path = self.write('.json', json.dumps(self.FIXTURE[1:] + [document]))
+        self.run_import(path)
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 1)
+        call_command('collect_blobs', grace_hours=0, stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(name))
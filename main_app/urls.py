@@ -1,21 +1,46 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
     path('register/', views.RegisterView.as_view(), name='register'),
+    path('users/bulk/', views.BulkRegisterView.as_view(), name='user-bulk-register'),
     path('users/login/', views.LoginView.as_view(), name='login'),
+    path('users/logout/', views.LogoutView.as_view(), name='logout'),
     path('users/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),  
     path('patients/', views.PatientList.as_view(), name='patient-list'),
     path('patients/<int:pk>/', views.PatientDetail.as_view(), name='patient-detail'),
     path('doctors/', views.DoctorList.as_view(), name='doctor-list'),
     path('doctors/<int:pk>/', views.DoctorDetail.as_view(), name='doctor-detail'),
     path('issues/', views.IssueList.as_view(), name='issue-list'),
+    path('issues/claim/', views.IssueClaim.as_view(), name='issue-claim'),
+    path('issues/search/', views.IssueSearch.as_view(), name='issue-search'),
+    path('issues/export.<str:file_format>', views.IssueExport.as_view(), name='issue-export'),
     path('issues/<int:pk>/', views.IssueDetail.as_view(), name='issue-detail'),
+    path('issues/<int:pk>/comments/', async_views.issue_comments, name='issue-comments'),
     path('documents/', views.DocumentList.as_view(), name='document-list'),
     path('documents/<int:pk>/', views.DocumentDetail.as_view(), name='document-detail'),
+    path('documents/<int:pk>/download/', views.DocumentDownload.as_view(), name='document-download'),
+    path('uploads/', views.UploadSessionCreate.as_view(), name='upload-session-create'),
+    path('uploads/<uuid:pk>/', views.UploadSessionDetail.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:pk>/complete/', views.UploadSessionComplete.as_view(), name='upload-session-complete'),
     path('comments/', views.CommentList.as_view(), name='comment-list'),
+    path('comments/bulk/', views.CommentBulkCreate.as_view(), name='comment-bulk-create'),
     path('comments/<int:pk>/', views.CommentDetail.as_view(), name='comment-detail'),
+    path('cache/stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+    path('stats/', views.DashboardStats.as_view(), name='dashboard-stats'),
     path('patient-requests/', views.PatientRequestCreate.as_view(), name='patient-request-create'),
+    path('patient-requests/search/', views.PatientRequestSearch.as_view(), name='patient-request-search'),
+    path('patient-requests/export.<str:file_format>', views.PatientRequestExport.as_view(), name='patient-request-export'),
+    path('patient-requests/bulk/', views.PatientRequestBulkCreate.as_view(), name='patient-request-bulk-create'),
+    path('patient-requests/<int:pk>/document/', views.PatientRequestDocumentDownload.as_view(), name='patient-request-document'),
+    # Async read path, for deployments behind an ASGI server
+    path('async/register/', async_views.register, name='async-register'),
+    path('async/users/login/', async_views.login, name='async-login'),
+    path('async/issues/', async_views.issue_list, name='async-issue-list'),
+    path('async/issues/<int:pk>/', async_views.issue_detail, name='async-issue-detail'),
+    path('async/doctors/', async_views.doctor_list, name='async-doctor-list'),
+    path('async/patient-requests/', async_views.patient_request_list, name='async-patient-request-list'),
+    path('events/', async_views.event_stream, name='event-stream'),
 ]
@@ -3,7 +3,13 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.http import HttpResponse
-from django.contrib.auth import authenticate
+from django.conf import settings
+from django.db import transaction
+from django.core.files import File
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+import os
+import zlib
 from rest_framework_simplejwt.tokens import RefreshToken
 
 
@@ -11,6 +17,21 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import *
 from .serializers import *
+from .pagination import KeysetPagination
+from .cache import CachedResponseMixin, get_stats
+from .downloads import serve_file
+from .conditional import ConditionalGetMixin, conditional_response, issue_list_state, issue_state, list_state, row_state
+from .exports import export_response
+from .fieldsets import shape_queryset
+from .storage import is_patient_document_name, patient_owned_names, referenced_by_others
+from .onboarding import Onboarding, hash_on_password_pool, read_rows
+from . import passwords
+from .search import search
+from .assignment import claim_next_issue
+from .counters import DOCTOR, ISSUE, PATIENT, PATIENT_REQUEST, read_counts, read_totals, record_created
+from .middleware import TimedSerializerMixin, timed_data
+from django.core.files.storage import default_storage
+from django.http import Http404
 
 # from django.http import JsonResponse
 
@@ -23,40 +44,104 @@ class HomeView(APIView):
     def get(self, request):
         return Response({"message": "Welcome to the YaqeenMed API!"})
 
+def login_payload(user):
+    refresh = RefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token), 'user': timed_data(UserSerializer(user))}
+
+def hashing_busy_response():
+    # Every password worker is busy and the queue is full: shed load instead of queueing
+    return Response(
+        {'error': 'Too many sign-ins in progress, please retry.'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': passwords.retry_after()},
+    )
+
 # Register View with Nested User Creation
 class RegisterView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-            role = request.data.get('role', '').upper()
-
-            # Automatically creating Patient or Doctor after user creation
-            if role == 'PATIENT':
-                Patient.objects.create(user=user)
-            elif role == 'DOCTOR':
-                Doctor.objects.create(user=user)
-
+            try:
+                # Also creates the Patient or Doctor row
+                serializer.save()
+            except passwords.HashingBusy:
+                return hashing_busy_response()
             return Response({'message': 'User registered successfully!'}, status=status.HTTP_201_CREATED)
         print(serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkRegisterView(APIView):
+    """
+    Onboard many patients and doctors at once, from a JSON array or an
+    uploaded ``file`` (.csv or .ndjson); see main_app.onboarding.  The
+    response lists the rows that were not created, by row number.
+
+    At most ONBOARDING_MAX_REQUEST_ROWS rows are taken per request, created in
+    one transaction; larger files go through ``manage.py onboard_users``.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            rows = read_rows(upload.file, 'csv' if upload.name.lower().endswith('.csv') else 'ndjson')
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            return Response({'error': 'Expected a JSON array or a CSV/NDJSON file'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_rows = getattr(settings, 'ONBOARDING_MAX_REQUEST_ROWS', 100)
+        # One batch for the whole request, flushed by finish() once every row is in
+        onboarding = Onboarding(batch_size=max_rows + 1, hasher=hash_on_password_pool)
+        try:
+            for row in rows:
+                if onboarding.rows == max_rows:
+                    return Response(
+                        {'error': f'At most {max_rows} rows per request; use manage.py onboard_users for larger files'},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    )
+                onboarding.add(row)
+        except (ValueError, UnicodeDecodeError) as err:
+            return Response({'error': f'Row {onboarding.rows + 1}: {err}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            created, errors = onboarding.finish()
+        except passwords.HashingBusy:
+            return hashing_busy_response()
+
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'created': created, 'failed': len(errors), 'errors': errors}, status=response_status)
+
 class LoginView(APIView):
 
   def post(self, request):
     try:
       username = request.data.get('username')
       password = request.data.get('password')
-      user = authenticate(username=username, password=password)
+      # Same checks as authenticate(), with the password hashing on the bounded pool
+      user = passwords.authenticate(username, password)
       if user:
-        refresh = RefreshToken.for_user(user)
-        content = {'refresh': str(refresh), 'access': str(refresh.access_token),'user': UserSerializer(user).data}
-        return Response(content, status=status.HTTP_200_OK)
+        return Response(login_payload(user), status=status.HTTP_200_OK)
       return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+    except passwords.HashingBusy:
+      return hashing_busy_response()
     except Exception as err:
         print(err)
         return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class LogoutView(APIView):
+    """Revoke a refresh token, so it can no longer be exchanged for access tokens."""
+
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({'message': 'Logged out.'}, status=status.HTTP_200_OK)
+
 class VerifyUserView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
@@ -66,111 +151,513 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
         return obj.user == request.user
 
-class PatientList(generics.ListCreateAPIView):
+class PatientList(TimedSerializerMixin, generics.ListCreateAPIView):
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('-id',)
 
     def get_queryset(self):
         user = self.request.user
-        if user.role == 'PATIENT':
+        if user.is_patient:
             return Patient.objects.filter(user=user)
         return Patient.objects.all()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class PatientDetail(generics.RetrieveUpdateDestroyAPIView):
+# The user columns UserSerializer shows; profiles have no updated_at to validate against
+PROFILE_USER_FIELDS = [
+    'user__username', 'user__email', 'user__first_name', 'user__last_name', 'user__role', 'user__profile_picture',
+]
+
+class PatientDetail(ConditionalGetMixin, TimedSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     queryset = Patient.objects.all()
 
-class DoctorList(generics.ListCreateAPIView):
+    def conditional_state(self):
+        return row_state(Patient.objects, self.kwargs['pk'], ['age'] + PROFILE_USER_FIELDS)
+
+def scope_doctors(user, queryset):
+    if user.is_doctor:
+        return queryset.filter(user=user)
+    return queryset
+
+class DoctorList(CachedResponseMixin, TimedSerializerMixin, generics.ListCreateAPIView):
     serializer_class = DoctorSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('-pk',)
+    cache_namespace = 'doctors'
 
     def get_queryset(self):
+        return scope_doctors(self.request.user, Doctor.objects.select_related('user'))
+
+    def get_cache_scope(self):
+        # Doctors only ever see themselves, everyone else shares one directory
         user = self.request.user
-        if user.role == 'DOCTOR':
-            return Doctor.objects.filter(user=user)
-        return Doctor.objects.all()
+        if user.is_doctor:
+            return f'doctor:{user.pk}'
+        return 'directory'
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class DoctorDetail(generics.RetrieveUpdateDestroyAPIView):
+class DoctorDetail(ConditionalGetMixin, CachedResponseMixin, TimedSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DoctorSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
-    queryset = Doctor.objects.all()
+    queryset = Doctor.objects.select_related('user')
+    cache_namespace = 'doctors'
+
+    def conditional_state(self):
+        fields = ['specialty', 'license_number', 'years_experience'] + PROFILE_USER_FIELDS
+        return row_state(Doctor.objects, self.kwargs['pk'], fields)
+
+    def get_cache_scope(self):
+        return 'directory'
+
+class CacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats([DoctorList.__name__, DoctorDetail.__name__]))
 
-class IssueList(generics.ListCreateAPIView):
+def issue_queryset(request=None):
+    # Join and prefetch what IssueSerializer renders, pruned to the caller's
+    # ?fields= / ?expand= (see main_app.fieldsets)
+    return shape_queryset(Issue.objects.all(), IssueSerializer, request)
+
+def patient_request_queryset(request=None):
+    return shape_queryset(PatientRequest.objects.all(), PatientRequestSerializer, request)
+
+def scope_issues(user, queryset):
+    # Patients see their own issues, doctors the ones assigned to them
+    if user.is_patient:
+        return queryset.filter(patient__user=user)
+    elif user.is_doctor:
+        return queryset.filter(doctor__user=user)
+    return queryset
+
+class IssueList(ConditionalGetMixin, TimedSerializerMixin, generics.ListCreateAPIView):
     serializer_class = IssueSerializer  
     permission_classes = [permissions.IsAuthenticated]
+    # issues + documents + comments, independent of the number of rows, after
+    # the three aggregates that validate conditional GETs
+    query_budget = 6
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return Issue.objects.filter(patient__user=user)
-        elif user.role == 'DOCTOR':
-            return Issue.objects.filter(doctor__user=user)
-        return Issue.objects.all()
+        return scope_issues(self.request.user, issue_queryset(self.request))
+
+    def conditional_state(self):
+        return issue_list_state(scope_issues(self.request.user, Issue.objects.all()))
 
     def perform_create(self, serializer):
         serializer.save(patient=self.request.user.patient)
 
-class IssueDetail(generics.RetrieveUpdateDestroyAPIView):
+class IssueExport(APIView):
+    """The caller's issues with their documents and comments, streamed as NDJSON or CSV."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, file_format):
+        issues = scope_issues(request.user, issue_queryset(request)).order_by('created_at', 'id')
+        return export_response(issues, IssueSerializer, file_format, 'issues', request)
+
+class DashboardStats(APIView):
+    """
+    Issue and patient-request counts per status for the caller, read from the
+    incrementally maintained counters (see main_app.counters).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        if user.is_patient:
+            patient_id = Patient.objects.filter(user=user).values_list('pk', flat=True).first()
+            counts = read_counts(PATIENT, patient_id)
+            return Response({'issues': counts[ISSUE], 'patient_requests': counts[PATIENT_REQUEST]})
+        elif user.is_doctor:
+            return Response({'issues': read_counts(DOCTOR, user.pk)[ISSUE]})
+        totals, doctors = read_totals()
+        return Response({'issues': totals[ISSUE], 'patient_requests': totals[PATIENT_REQUEST], 'doctors': doctors})
+
+class IssueClaim(APIView):
+    """Give the calling doctor the oldest pending issue for their specialty."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        doctor = Doctor.objects.filter(user=request.user).first()
+        if doctor is None:
+            return Response({'error': 'Only doctors can claim issues'}, status=status.HTTP_403_FORBIDDEN)
+        issue = claim_next_issue(doctor)
+        if issue is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = IssueSerializer(issue_queryset().get(pk=issue.pk), context={'request': request})
+        return Response(timed_data(serializer), status=status.HTTP_200_OK)
+
+class SearchView(APIView):
+    """Ranked full-text search, scoped to what the caller may see (see main_app.search)."""
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = None
+    default_limit = 25
+    max_limit = 100
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'The q parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        results = search(self.get_queryset(), text)[:max(limit, 1)]
+        serializer = self.serializer_class(results, many=True, context={'request': request})
+        return Response({'results': timed_data(serializer)})
+
+class IssueSearch(SearchView):
+    serializer_class = IssueSerializer
+
+    def get_queryset(self):
+        return scope_issues(self.request.user, issue_queryset(self.request))
+
+class IssueDetail(ConditionalGetMixin, TimedSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = IssueSerializer  
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Issue.objects.all()
+    # The validator query, then the issue with its documents and comments
+    query_budget = 4
+
+    def get_queryset(self):
+        return issue_queryset(self.request)
+
+    def conditional_state(self):
+        return issue_state(Issue.objects.all(), self.kwargs['pk'])
 
-class DocumentList(generics.ListCreateAPIView):
+class DocumentList(TimedSerializerMixin, generics.ListCreateAPIView):
     serializer_class = DocumentSerializer
     permission_classes = [permissions.IsAuthenticated]
     queryset = Document.objects.all()
+    keyset_ordering = ('-uploaded_at', '-id')
 
-class DocumentDetail(generics.RetrieveUpdateDestroyAPIView):
+class DocumentDetail(TimedSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DocumentSerializer
     permission_classes = [permissions.IsAuthenticated]
     queryset = Document.objects.all()
 
+# --- Download Views ---
+def can_access_issue(user, issue):
+    # Doctor's primary key is its user id, so no join is needed for doctors
+    return issue.patient.user_id == user.pk or issue.doctor_id == user.pk
+
+class DocumentDownload(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        document = get_object_or_404(Document.objects.select_related('issue__patient'), pk=pk)
+        if not can_access_issue(request.user, document.issue):
+            raise Http404
+        if not document.file or not document.file.storage.exists(document.file.name):
+            raise Http404
+        extension = os.path.splitext(document.file.name)[1]
+        return serve_file(request, document.file.storage, document.file.name, f"document-{document.pk}{extension}")
+
+class PatientRequestDocumentDownload(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        patient_request = get_object_or_404(PatientRequest.objects.select_related('patient', 'issue__patient'), pk=pk)
+        is_owner = patient_request.patient is not None and patient_request.patient.user_id == request.user.pk
+        if not is_owner and not (patient_request.issue and can_access_issue(request.user, patient_request.issue)):
+            raise Http404
+        name = patient_request.document
+        if not name or not is_patient_document_name(name):
+            raise Http404
+        # document is free text: it may name someone else's file
+        owner = patient_request.patient
+        owned = owner is not None and name in patient_owned_names(owner, [name], exclude_request=patient_request.pk)
+        if not owned and referenced_by_others(name, owner, exclude_request=patient_request.pk):
+            raise Http404
+        if not default_storage.exists(name):
+            raise Http404
+        return serve_file(request, default_storage, name, f"patient-request-{patient_request.pk}{os.path.splitext(name)[1]}")
+
+# --- Resumable upload Views ---
+class AssembledUpload(File):
+    # Exposing the path lets FileSystemStorage move the finished file into
+    # place instead of reading it back through Python.
+    def temporary_file_path(self):
+        return self.file.name
+
+class UploadSessionCreate(TimedSerializerMixin, generics.CreateAPIView):
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+class UploadSessionMixin:
+    def get_session(self, request, pk, for_update=False):
+        sessions = UploadSession.objects.select_for_update() if for_update else UploadSession.objects
+        return get_object_or_404(sessions, pk=pk, owner=request.user, expires_at__gt=timezone.now())
+
+class UploadSessionDetail(UploadSessionMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    read_block_size = 64 * 1024
+
+    def get(self, request, pk):
+        # Clients resume by asking for the current offset
+        return Response(timed_data(UploadSessionSerializer(self.get_session(request, pk))))
+
+    def put(self, request, pk):
+        try:
+            start = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Upload-Offset header is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        session = self.get_session(request, pk)
+        if start != session.offset:
+            return Response(timed_data(UploadSessionSerializer(session)), status=status.HTTP_409_CONFLICT)
+
+        # Stream the chunk to its own file with no transaction or row lock
+        # held, however slow the client is
+        staged = session.staging_path()
+        offset, checksum = start, session.checksum
+        stream = request.stream
+        try:
+            with open(staged, 'wb') as destination:
+                while stream is not None:
+                    block = stream.read(self.read_block_size)
+                    if not block:
+                        break
+                    offset += len(block)
+                    if offset > session.size:
+                        return Response({'error': 'Chunk exceeds the declared upload size'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                    checksum = zlib.crc32(block, checksum)
+                    destination.write(block)
+
+            # Claim the offset; a concurrent PUT of the same chunk loses here
+            with transaction.atomic():
+                claimed = UploadSession.objects.filter(pk=session.pk, offset=start).update(offset=offset, checksum=checksum)
+                if claimed and offset > start:
+                    os.replace(staged, session.chunk_path(start))
+        finally:
+            if os.path.exists(staged):
+                os.remove(staged)
+        try:
+            session.refresh_from_db()
+        except UploadSession.DoesNotExist:
+            raise Http404
+        if not claimed:
+            return Response(timed_data(UploadSessionSerializer(session)), status=status.HTTP_409_CONFLICT)
+        return Response(timed_data(UploadSessionSerializer(session)))
+
+    def delete(self, request, pk):
+        self.get_session(request, pk).discard()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class UploadSessionComplete(UploadSessionMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        with transaction.atomic():
+            session = self.get_session(request, pk, for_update=True)
+            if session.offset != session.size:
+                return Response(timed_data(UploadSessionSerializer(session)), status=status.HTTP_409_CONFLICT)
+            checksum = request.data.get('checksum')
+            if checksum is not None and str(checksum).lower() != f"{session.checksum:08x}":
+                return Response({'error': 'Checksum mismatch'}, status=status.HTTP_400_BAD_REQUEST)
+
+            document = Document(issue=session.issue)
+            with open(session.assemble(), 'rb') as assembled:
+                document.file.save(session.filename, AssembledUpload(assembled), save=True)
+            session.discard()
+        return Response(timed_data(DocumentSerializer(document, context={'request': request})), status=status.HTTP_201_CREATED)
+
 # --- COMMENT Views ---
-class CommentList(generics.ListCreateAPIView):
+class CommentList(TimedSerializerMixin, generics.ListCreateAPIView):
     serializer_class = CommentListSerializer  
     permission_classes = [permissions.IsAuthenticated]
     queryset = Comment.objects.all()
 
 
-class CommentCreate(generics.CreateAPIView):
+class CommentCreate(TimedSerializerMixin, generics.CreateAPIView):
     serializer_class = CommentCreateSerializer  
     permission_classes = [permissions.IsAuthenticated]
     queryset = Comment.objects.all()
     
 
-class CommentDetail(generics.RetrieveUpdateDestroyAPIView):
+class CommentDetail(TimedSerializerMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CommentListSerializer
     permission_classes = [permissions.IsAuthenticated]
     queryset = Comment.objects.all()
 
 
+# --- Bulk create Views ---
+class BulkCreateView(APIView):
+    """
+    Create many rows from a JSON array in one round trip.
+
+    Every item is validated first; related rows are looked up once for the
+    whole batch in ``prepare``; valid items are inserted with a single
+    bulk_create inside one transaction. The response lists a result per
+    input item, in order.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    model = None
+    item_serializer_class = None
+    result_serializer_class = None
+    max_batch_size = 500
+
+    def prepare(self, request, items):
+        return None
+
+    def check(self, request, item, context):
+        return None
+
+    def build(self, request, item, context):
+        raise NotImplementedError
+
+    def created(self, request, instances):
+        # Runs in the insert's transaction; bulk_create sends no save signals
+        return None
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty JSON array'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_batch_size:
+            return Response({'error': f'At most {self.max_batch_size} items per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = self.item_serializer_class(data=item, context={'request': request})
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+
+        context = self.prepare(request, [item for _, item in valid])
+        pending = []
+        for index, item in valid:
+            errors = self.check(request, item, context)
+            if errors:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': errors}
+            else:
+                pending.append((index, self.build(request, item, context)))
+
+        with transaction.atomic():
+            created = self.model.objects.bulk_create([instance for _, instance in pending])
+            self.created(request, created)
+        for (index, _), instance in zip(pending, created):
+            data = timed_data(self.result_serializer_class(instance, context={'request': request}))
+            results[index] = {'index': index, 'status': status.HTTP_201_CREATED, 'data': data}
+
+        if len(created) == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'created': len(created), 'failed': len(items) - len(created), 'results': results}, status=response_status)
+
+class CommentBulkCreate(BulkCreateView):
+    model = Comment
+    item_serializer_class = CommentBulkItemSerializer
+    result_serializer_class = CommentListSerializer
+
+    def prepare(self, request, items):
+        # One status lookup per distinct issue instead of one per Comment.save()
+        issue_ids = {item['issue'] for item in items}
+        rows = Issue.objects.filter(pk__in=issue_ids).values('id', 'status', 'doctor_id', 'patient__user_id')
+        return {row['id']: row for row in rows}
+
+    def check(self, request, item, issues):
+        issue = issues.get(item['issue'])
+        if issue is None:
+            return {'issue': [f"Issue {item['issue']} does not exist."]}
+        if request.user.pk not in (issue['patient__user_id'], issue['doctor_id']):
+            return {'issue': ["You can only comment on your own issues."]}
+        if issue['status'] == Issue.STATUS_COMPLETED:
+            return {'issue': ["Cannot modify comments on completed issues."]}
+        return None
+
+    def build(self, request, item, issues):
+        return Comment(issue_id=item['issue'], author=request.user, content=item['content'])
+
+class PatientRequestBulkCreate(BulkCreateView):
+    model = PatientRequest
+    item_serializer_class = PatientRequestBulkItemSerializer
+    result_serializer_class = PatientRequestSerializer
+
+    def prepare(self, request, items):
+        patient = get_object_or_404(Patient.objects.select_related('user'), user=request.user)
+        issue_ids = {item['issue'] for item in items if item.get('issue')}
+        existing = set(Issue.objects.filter(pk__in=issue_ids).values_list('id', flat=True))
+        return {'patient': patient, 'issues': existing}
+
+    def check(self, request, item, context):
+        if item.get('issue') and item['issue'] not in context['issues']:
+            return {'issue': [f"Issue {item['issue']} does not exist."]}
+        return None
+
+    def build(self, request, item, context):
+        item = dict(item)
+        return PatientRequest(patient=context['patient'], issue_id=item.pop('issue', None), **item)
+
+    def created(self, request, instances):
+        record_created(instances)
+
+def scope_patient_requests(user, queryset):
+    # Same visibility as scope_issues: patients see their own, doctors those on their issues
+    if user.is_patient:
+        return queryset.filter(patient__user=user)
+    elif user.is_doctor:
+        return queryset.filter(issue__doctor__user=user)
+    return queryset
+
+class PatientRequestExport(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, file_format):
+        patient_requests = scope_patient_requests(
+            request.user, patient_request_queryset(request)
+        ).order_by('created_at', 'id')
+        return export_response(patient_requests, PatientRequestSerializer, file_format, 'patient-requests', request)
+
+class PatientRequestSearch(SearchView):
+    serializer_class = PatientRequestSerializer
+
+    def get_queryset(self):
+        return scope_patient_requests(self.request.user, patient_request_queryset(self.request))
+
 
 class PatientRequestCreate(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # Fetch all patient requests associated with the current user
-        patient_requests = PatientRequest.objects.filter(patient=request.user.patient)
-        serializer = PatientRequestSerializer(patient_requests, many=True)
-        return Response(serializer.data)
+        # Fetch the current user's patient requests one keyset page at a time
+        patient_requests = patient_request_queryset(request).filter(patient=request.user.patient)
+
+        def respond():
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(patient_requests, request, view=self)
+            serializer = PatientRequestSerializer(page, many=True, context={'request': request})
+            return paginator.get_paginated_response(timed_data(serializer))
+
+        nested = ['patient_id', 'patient__age'] + [f'patient__{field}' for field in PROFILE_USER_FIELDS]
+        return conditional_response(request, list_state(patient_requests, nested), respond)
 
     def post(self, request):
         try:
             print("REQUEST DATA:   ", request.data)
             # Serialize the data sent by the user
             patient = Patient.objects.get(user=request.user)
-            serializer = PatientRequestSerializer(data=request.data)
+            serializer = PatientRequestSerializer(data=request.data, context={'request': request})
             if serializer.is_valid():
                 # Attach the patient to the request directly (done in the serializer)
                 serializer.save(patient=patient)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+                return Response(timed_data(serializer), status=status.HTTP_201_CREATED)
             # Print serializer errors for debugging
             print("SERIALIZER ERRORS:   ", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
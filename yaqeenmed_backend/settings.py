@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main_app.middleware.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -49,11 +50,24 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request timings (see main_app.middleware.ServerTimingMiddleware): the
+# fraction of requests measured, and the duration above which a measured
+# request is logged as a warning with up to SLOW_REQUEST_MAX_STATEMENTS SQL statements
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get("SERVER_TIMING_SAMPLE_RATE", "1.0"))
+SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+# Benchmark runs: report queries per request in an X-Query-Count header
+if os.environ.get("QUERY_COUNT_HEADER"):
+    MIDDLEWARE.insert(0, 'main_app.middleware.QueryCountMiddleware')
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'main_app.authentication.CachedJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'main_app.pagination.KeysetPagination',
+    'PAGE_SIZE': 25,
 }
 
 # JWT Authentication settings
@@ -66,8 +80,22 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # The blacklist app is not installed: revoked refresh tokens are checked in memory (see main_app.revocation)
+    'TOKEN_REFRESH_SERIALIZER': 'main_app.serializers.RevocableTokenRefreshSerializer',
 }
 
+# Refresh-token revocation (see main_app.revocation): how often each process
+# pulls new revocations and prunes/rebuilds its filter (seconds), how many
+# recent revocations it keeps exactly, and the Bloom filter's false-positive rate
+REVOCATION_SYNC_INTERVAL = 5
+REVOCATION_PRUNE_INTERVAL = 3600
+REVOCATION_RECENT_SIZE = 10_000
+REVOCATION_ERROR_RATE = 0.001
+
+# In-process LRU of users resolved from JWTs (see main_app.authentication)
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 300  # seconds
+
 ROOT_URLCONF = 'yaqeenmed_backend.urls'
 
 # Template settings (if using templates)
@@ -101,6 +129,15 @@ DATABASES = {
     }
 }
 
+# Cache used for versioned API responses (see main_app.cache). Local memory is
+# per-process; point CACHE_BACKEND at FileBasedCache to share across workers.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "yaqeenmed"),
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
@@ -121,6 +158,55 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded media is stored content-addressed and deduplicated (see main_app.storage)
+STORAGES = {
+    "default": {
+        "BACKEND": "main_app.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# Long-polling on issues/<id>/comments/?wait=: longest hold and re-check interval (seconds)
+COMMENT_LONG_POLL_MAX = 30
+COMMENT_POLL_INTERVAL = 1.0
+
+# Status-change event stream (see main_app.events): 'local' delivers within
+# one process, 'postgres' fans out to every worker through LISTEN/NOTIFY
+EVENT_BROKER_BACKEND = os.environ.get("EVENT_BROKER_BACKEND", "local")
+EVENT_BUFFER_SIZE = 1000  # recent events kept for Last-Event-ID replay
+EVENT_STREAM_MAX_AGE = 300  # seconds before a stream is closed for the client to reconnect
+EVENT_HEARTBEAT_INTERVAL = 15
+
+# Rows fetched (and prefetched) per round trip by the streaming exports
+EXPORT_CHUNK_SIZE = 500
+
+# A doctor cannot claim or be assigned more open issues than this
+MAX_OPEN_ISSUES_PER_DOCTOR = 20
+
+# Hand document downloads to the web server: None, 'nginx' (X-Accel-Redirect
+# to an internal location serving MEDIA_ROOT) or 'apache' (X-Sendfile)
+SENDFILE_BACKEND = os.environ.get("SENDFILE_BACKEND") or None
+SENDFILE_URL_PREFIX = '/protected-media/'
+
+# Password hashing pool (see main_app.passwords): threads that run PBKDF2, how
+# many calls may wait for one before login/register answer 503, and the
+# Retry-After (seconds) sent with that 503
+PASSWORD_HASHING_WORKERS = int(os.environ.get("PASSWORD_HASHING_WORKERS", "2"))
+PASSWORD_HASHING_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASHING_QUEUE_SIZE", "32"))
+PASSWORD_HASHING_RETRY_AFTER = 1
+
+# Bulk onboarding (see main_app.onboarding): accounts per transaction, and
+# processes hashing their passwords (None: one per CPU; 0: hash inline), for
+# manage.py onboard_users; rows accepted per request by the bulk endpoint
+ONBOARDING_BATCH_SIZE = 1000
+ONBOARDING_HASH_WORKERS = None
+ONBOARDING_MAX_REQUEST_ROWS = 100
+
+# Worker processes that render image thumbnails/previews; 0 renders inline
+IMAGE_DERIVATIVE_WORKERS = 2
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 